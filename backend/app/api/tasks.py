@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 
-from app.db import get_db
+from app.db import get_db, SessionLocal
 from app.schemas import TaskBase, TaskListResponse
+from app.services.task_events import task_events
 from app.services.task_service import task_service
 
+STREAM_KEEPALIVE = float(os.getenv("TASK_STREAM_KEEPALIVE", "15"))
+
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 
@@ -21,6 +29,70 @@ def list_tasks(
     return {"total": data["total"], "items": data["items"]}
 
 
+def _sse(event: str, data, seq: Optional[int] = None) -> str:
+    head = f"id: {task_events.event_id(seq)}\n" if seq is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _snapshot(limit: int) -> dict:
+    """连接建立（或游标失效）时发送一次最近任务列表，之后只推送增量"""
+    db = SessionLocal()
+    try:
+        seq = task_events.cursor
+        data = task_service.list_tasks(db, page=1, page_size=limit)
+        items = [TaskBase.model_validate(task).model_dump(mode="json") for task in data["items"]]
+        return {"seq": seq, "cursor": task_events.event_id(seq), "total": data["total"], "items": items}
+    finally:
+        db.close()
+
+
+@router.get("/stream")
+async def stream_tasks(
+    request: Request,
+    cursor: Optional[str] = Query(default=None, description="上次收到的事件 ID（<纪元>:<序号>）；也可通过 Last-Event-ID 头传递"),
+    limit: int = Query(default=20, ge=1, le=200, description="首次快照包含的任务数"),
+):
+    """SSE 推送任务状态变化：snapshot（全量）→ task（单个任务最新状态）；断线重连按游标补发"""
+    # 纪元不符（服务重启）或格式无法识别的游标按无游标处理，先发送全量快照
+    start = task_events.parse_event_id(cursor or request.headers.get("last-event-id"))
+
+    async def event_stream():
+        sub, backlog = task_events.subscribe(start)
+        try:
+            if backlog is None:
+                snapshot = await asyncio.to_thread(_snapshot, limit)
+                seq = snapshot.pop("seq")
+                yield _sse("snapshot", snapshot, seq)
+            else:
+                for seq, data in backlog:
+                    yield _sse("task", data, seq)
+            while True:
+                if sub.overflowed:
+                    # 客户端消费过慢，丢弃积压并重新发送快照
+                    sub.overflowed = False
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    snapshot = await asyncio.to_thread(_snapshot, limit)
+                    snapshot_seq = snapshot.pop("seq")
+                    yield _sse("snapshot", snapshot, snapshot_seq)
+                try:
+                    seq, data = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse("task", data, seq)
+        finally:
+            task_events.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{task_id}", response_model=TaskBase)
 def get_task(task_id: str, db: Session = Depends(get_db)):
     task = task_service.get_task(db, task_id)
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Optional
+from datetime import datetime, timezone
 import os
+import time
 
 from app.db import get_db, SessionLocal
+from app.db.pagination import encode_cursor, decode_cursor, keyset_after, bounded_count, page_rows
 from app.models.virtualization import EsxiHost, VirtualMachine, Datastore
 from app.models.credential import Credential
 from app.schemas.virtualization import (
@@ -15,26 +20,87 @@ from app.schemas.virtualization import (
     VirtualMachineListResponse,
     VirtualMachineInfo,
     PowerActionRequest,
+    VMBulkPowerRequest,
     VMUpdateRequest,
     AsyncTaskResponse,
     VMCloneRequest,
+    VMBatchCloneRequest,
     VMCloneResponse,
     VMInstallToolsRequest,
     DatastoreStatsResponse,
+    InventoryAggregateInfo,
+    InventoryStatsResponse,
+    MetricSeries,
+    MetricsResponse,
+    CapacityReportResponse,
+    SyncResponse,
 )
-from app.services.task_service import task_service
-from app.services.virtualization_service import virtualization_service
+from app.services.virtualization_service import virtualization_service, POWER_ACTIONS
+from app.services.esxi_session_pool import esxi_session_pool
+from app.services.esxi_executor import esxi_executor, HostQueueFull
+from app.services.inventory_watcher import inventory_watcher
+from app.services.vm_search import vm_search
+from app.services.vm_export import vm_exporter, EXPORT_FORMATS
+from app.services.inventory_cache import inventory_cache
+from app.services.inventory_aggregates import GLOBAL_KEY, load_aggregates, refresh_aggregates
+from app.services.metrics_store import metrics_store, RESOLUTIONS
+from app.services.metrics_collector import METRIC_COUNTERS, HOST_GAUGES
+from app.services.capacity import capacity_planner
+from app.services.job_queue import job_queue
+from app.services import jobs  # noqa: F401  注册克隆/电源/安装 Tools 任务处理函数
 
 router = APIRouter(prefix="/virtualization", tags=["virtualization"])
 
 
+def _with_session(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def _on_host(host_ip: str, fn, *args):
+    """在主机专属执行器中以独立数据库会话执行 fn(db, *args)，并把常见异常映射为 HTTP 错误"""
+    try:
+        return await esxi_executor.run(host_ip, _with_session, fn, *args)
+    except HTTPException:
+        raise
+    except HostQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+def _get_vm_and_host(db: Session, vm_id: str):
+    vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
+    if not vm:
+        raise HTTPException(status_code=404, detail="VM not found")
+    host = db.query(EsxiHost).filter(EsxiHost.ip == vm.host_ip).first()
+    if not host:
+        raise HTTPException(status_code=404, detail="Host not found")
+    return vm, host
+
+
+async def _vm_host_ip(vm_id: str) -> str:
+    """纯数据库查询，放在默认线程池，不进入主机队列"""
+    return await run_in_threadpool(_with_session, lambda db: _get_vm_and_host(db, vm_id)[1].ip)
+
+
 @router.post("/hosts", response_model=EsxiHostResponse, status_code=status.HTTP_201_CREATED)
-def add_host(data: EsxiHostCreate, db: Session = Depends(get_db)):
+async def add_host(data: EsxiHostCreate):
     """添加或测试 ESXi 主机；probe_only=true 时仅探测不落库"""
     pwd = data.password or os.getenv("ESXI_PASSWORD")
     if not pwd:
         raise HTTPException(status_code=400, detail="缺少 ESXi 密码")
+    return await _on_host(data.ip, _add_host, data, pwd)
+
 
+def _add_host(db: Session, data: EsxiHostCreate, pwd: str):
     probe_result = virtualization_service.probe_host(data.ip, data.username, pwd, data.port)
     if not probe_result.get("success"):
         raise HTTPException(status_code=502, detail=f"Connection failed: {probe_result.get('message')}")
@@ -82,32 +148,25 @@ def add_host(data: EsxiHostCreate, db: Session = Depends(get_db)):
         virtualization_service.sync_host_vms(db, host, user_override=data.username, pwd_override=pwd)
     except Exception:
         pass
-    return host
+    inventory_watcher.ensure(host.id, host.ip)
+    return EsxiHostResponse.model_validate(host)
+
+
+def _not_modified(request: Request, response: Response, etag: str) -> bool:
+    """写入 ETag；客户端 If-None-Match 命中时返回 True（调用方直接回 304）"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    if_none_match = request.headers.get("if-none-match")
+    return bool(if_none_match) and etag in [tag.strip() for tag in if_none_match.split(",")]
 
 
 @router.get("/hosts", response_model=List[EsxiHostResponse])
-def get_hosts(db: Session = Depends(get_db)):
-    hosts = db.query(EsxiHost).order_by(EsxiHost.sort_order.asc(), EsxiHost.id.asc()).all()
-    
-    # 获取 VM 统计
-    vm_stats = {}
-    vms = db.query(VirtualMachine.host_ip, VirtualMachine.status).all()
-    for row in vms:
-        host_ip = row.host_ip
-        status = row.status
-        if host_ip not in vm_stats:
-            vm_stats[host_ip] = {"total": 0, "running": 0}
-        
-        vm_stats[host_ip]["total"] += 1
-        if status == "poweredOn":
-            vm_stats[host_ip]["running"] += 1
-
-    for h in hosts:
-        stats = vm_stats.get(h.ip, {"total": 0, "running": 0})
-        h.vm_count = stats["total"]
-        h.vms_running = stats["running"]
-        
-    return hosts
+def get_hosts(request: Request, response: Response):
+    """主机列表（含 VM 总数 / 运行数），由清单缓存提供；内容未变时返回 304"""
+    etag = inventory_cache.etag(SessionLocal, "hosts")
+    if _not_modified(request, response, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return inventory_cache.hosts(SessionLocal)["items"]
 
 
 @router.post("/hosts/reorder", response_model=SuccessResponse)
@@ -148,6 +207,8 @@ def update_host(host_id: int, data: EsxiHostCreate, db: Session = Depends(get_db
     host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
     if not host:
         raise HTTPException(status_code=404, detail="Host not found")
+    # 凭据/地址可能变更，淘汰旧会话
+    esxi_session_pool.invalidate(host.ip)
     if data.ip:
         host.ip = data.ip
     host.port = data.port or host.port
@@ -158,6 +219,7 @@ def update_host(host_id: int, data: EsxiHostCreate, db: Session = Depends(get_db
         host.description = data.description
     db.commit()
     db.refresh(host)
+    inventory_watcher.restart(host.id, host.ip)
     return host
 
 
@@ -168,243 +230,256 @@ def delete_host(host_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Host not found")
     db.query(VirtualMachine).filter(VirtualMachine.host_ip == host.ip).delete()
     db.delete(host)
+    refresh_aggregates(db, [host.ip])
+    metrics_store.delete_entities(db, host.ip)
     db.commit()
+    inventory_watcher.stop(host_id)
+    esxi_session_pool.invalidate(host.ip)
+    esxi_executor.discard(host.ip)
     return None
 
 
+def _to_vm_info(vm: VirtualMachine, host_id: Optional[int]) -> VirtualMachineInfo:
+    return VirtualMachineInfo(
+        id=str(vm.id),
+        name=vm.name,
+        power_state=vm.status or "unknown",
+        guest_os=vm.os_name,
+        ip_address=vm.ip_address,
+        description=vm.description,
+        instance_uuid=vm.uuid,
+        moref=vm.moref,
+        host_ip=vm.host_ip,
+        host_id=host_id,
+        cpu_count=vm.cpu_count,
+        memory_mb=vm.memory_mb,
+        cpu_usage_mhz=vm.cpu_usage_mhz,
+        memory_usage_mb=vm.memory_usage_mb,
+        uptime_seconds=vm.uptime_seconds,
+        disk_used_gb=vm.disk_used_gb,
+        disk_provisioned_gb=vm.disk_provisioned_gb,
+        tools_status=vm.tools_status,
+    )
+
+
+@router.get("/vms/search", response_model=VirtualMachineListResponse)
+def search_vms(
+    q: str = Query(..., min_length=1, description="关键字，空格分隔多个词（AND）"),
+    host_id: Optional[int] = None,
+    status_filter: Optional[str] = Query(default=None, alias="status"),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """按相关度搜索 VM（名称 / IP / 操作系统 / 备注 / 宿主机 IP），名称前缀命中优先"""
+    rows = vm_search.search(db, q, limit=limit, host_id=host_id, status=status_filter)
+    return {"total": len(rows), "items": [_to_vm_info(vm, vm_host_id) for vm, vm_host_id in rows]}
+
+
+# 允许的排序列（均有 (列, id) 或复合索引支撑）；前缀 "-" 表示降序
+VM_SORT_COLUMNS = {
+    "name": VirtualMachine.name,
+    "status": VirtualMachine.status,
+    "host_ip": VirtualMachine.host_ip,
+    "id": VirtualMachine.id,
+}
+VM_APPROX_COUNT_LIMIT = int(os.getenv("VM_APPROX_COUNT_LIMIT", "10000"))
+
+
 @router.get("/vms", response_model=VirtualMachineListResponse)
-def get_vms(
+async def get_vms(
+    request: Request,
+    response: Response,
     host_id: Optional[int] = None,
     keyword: Optional[str] = None,
     status_filter: Optional[str] = Query(default=None, alias="status"),
     page: int = 1,
-    page_size: int = 20,
+    page_size: int = Query(default=20, ge=1, le=500),
     refresh: bool = False,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    total: str = Query(default="exact", pattern="^(exact|approx|none)$"),
 ):
-    """获取虚拟机列表；refresh=true 且 host_id 指定时会强制同步"""
+    """获取虚拟机列表；refresh=true 且 host_id 指定时会强制同步（增量监听在线时无需全量同步）。
+
+    分页：传 cursor（上一页返回的 next_cursor）时按游标定位，忽略 page；否则按 page 偏移（兼容旧前端）。
+    total=exact 精确计数，approx 最多计到 VM_APPROX_COUNT_LIMIT，none 不计数。
+    """
+    sort_key = sort.lstrip("-")
+    if sort_key not in VM_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"不支持的排序列: {sort}")
     if refresh and host_id:
-        host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
-        if host:
-            virtualization_service.sync_host_vms(db, host)
+        host_ip = await run_in_threadpool(inventory_cache.host_ip, SessionLocal, host_id)
+        if host_ip and not inventory_watcher.is_live(host_ip):
+            await _on_host(host_ip, _sync_host_by_id, host_id)
+    params = {k: v for k, v in request.query_params.items() if k != "refresh"}
+    etag = await run_in_threadpool(inventory_cache.etag, SessionLocal, "vms", params)
+    if _not_modified(request, response, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    try:
+        return await run_in_threadpool(
+            _with_session, _list_vms, host_id, keyword, status_filter, page, page_size, cursor, sort, total
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/vms/export")
+def export_vms(
+    export_format: str = Query(default="ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    host_id: Optional[int] = None,
+    keyword: Optional[str] = None,
+    status_filter: Optional[str] = Query(default=None, alias="status"),
+    sort: str = "id",
+    db: Session = Depends(get_db),
+):
+    """流式导出 VM 清单（含宿主机与数据存储列），过滤条件与 GET /vms 相同；内存占用与行数无关"""
+    sort_key = sort.lstrip("-")
+    if sort_key not in VM_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"不支持的排序列: {sort}")
+    sort_col = VM_SORT_COLUMNS[sort_key]
+    if sort.startswith("-"):
+        order_by = [sort_col.desc(), VirtualMachine.id.desc()]
+    else:
+        order_by = [sort_col.asc(), VirtualMachine.id.asc()]
+    criteria = _vm_criteria(db, host_id, keyword, status_filter)
+    filename = f"vms-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return StreamingResponse(
+        vm_exporter.stream(export_format, criteria, order_by),
+        media_type=EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _sync_host_by_id(db: Session, host_id: int):
+    host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
+    if host:
+        virtualization_service.sync_host_vms(db, host)
+
 
-    query = db.query(VirtualMachine)
-    host_ip = None
+def _vm_criteria(db: Session, host_id: Optional[int], keyword: Optional[str], status_filter: Optional[str]) -> list:
+    """VM 列表 / 导出共用的过滤条件（host_id 条件依赖与 esxi_hosts 的外连接）"""
+    criteria = []
     if host_id:
-        host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
-        if host:
-            host_ip = host.ip
-            query = query.filter(VirtualMachine.host_ip == host.ip)
-
-    if keyword:
-        query = query.filter(
-            (VirtualMachine.name.contains(keyword)) | (VirtualMachine.ip_address.contains(keyword))
-        )
+        criteria.append(EsxiHost.id == host_id)
+    if keyword and keyword.strip():
+        criteria.append(vm_search.keyword_filter(db, keyword))
     if status_filter:
-        query = query.filter(VirtualMachine.status == status_filter)
-
-    total = query.count()
-    items = query.offset((page - 1) * page_size).limit(page_size).all()
-    host_map = {h.ip: h.id for h in db.query(EsxiHost).all()}
-
-    res_items = []
-    for vm in items:
-        res_items.append(
-            VirtualMachineInfo(
-                id=str(vm.id),
-                name=vm.name,
-                power_state=vm.status or "unknown",
-                guest_os=vm.os_name,
-                ip_address=vm.ip_address,
-                description=vm.description,
-                instance_uuid=vm.uuid,
-                host_ip=vm.host_ip,
-                host_id=host_map.get(vm.host_ip),
-                cpu_count=vm.cpu_count,
-                memory_mb=vm.memory_mb,
-                cpu_usage_mhz=vm.cpu_usage_mhz,
-                memory_usage_mb=vm.memory_usage_mb,
-                uptime_seconds=vm.uptime_seconds,
-                disk_used_gb=vm.disk_used_gb,
-                disk_provisioned_gb=vm.disk_provisioned_gb,
-                tools_status=vm.tools_status,
-            )
-        )
-
-    return {"total": total, "items": res_items}
+        criteria.append(VirtualMachine.status == status_filter)
+    return criteria
+
+
+def _list_vms(
+    db: Session,
+    host_id: Optional[int],
+    keyword: Optional[str],
+    status_filter: Optional[str],
+    page: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    sort: str = "name",
+    total_mode: str = "exact",
+):
+    descending = sort.startswith("-")
+    sort_key = sort.lstrip("-")
+    sort_col = VM_SORT_COLUMNS[sort_key]
+
+    # 主机 ID 随行联查，不再整表扫描 esxi_hosts 构建映射
+    query = db.query(VirtualMachine, EsxiHost.id).outerjoin(EsxiHost, EsxiHost.ip == VirtualMachine.host_ip)
+    query = query.filter(*_vm_criteria(db, host_id, keyword, status_filter))
+
+    total, approximate = None, False
+    if total_mode == "exact":
+        total = query.with_entities(func.count(VirtualMachine.id)).order_by(None).scalar() or 0
+    elif total_mode == "approx":
+        total, approximate = bounded_count(query, VirtualMachine.id, VM_APPROX_COUNT_LIMIT)
+
+    if descending:
+        query = query.order_by(sort_col.desc(), VirtualMachine.id.desc())
+    else:
+        query = query.order_by(sort_col.asc(), VirtualMachine.id.asc())
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        query = query.filter(keyset_after(sort_col, VirtualMachine.id, last_value, last_id, descending))
+    else:
+        query = query.offset((page - 1) * page_size)
+    rows, has_more = page_rows(query.limit(page_size + 1).all(), page_size)
 
+    res_items = [_to_vm_info(vm, vm_host_id) for vm, vm_host_id in rows]
 
-@router.patch("/vms/{vm_id}", response_model=VirtualMachineInfo)
-def update_vm(vm_id: str, body: VMUpdateRequest, db: Session = Depends(get_db)):
-    vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
-    if not vm:
-        raise HTTPException(status_code=404, detail="VM not found")
+    next_cursor = None
+    if has_more and rows:
+        last_vm = rows[-1][0]
+        next_cursor = encode_cursor([getattr(last_vm, sort_col.key), last_vm.id])
+    return {
+        "total": total,
+        "items": res_items,
+        "total_is_approximate": approximate,
+        "next_cursor": next_cursor,
+    }
 
-    host = db.query(EsxiHost).filter(EsxiHost.ip == vm.host_ip).first()
-    if not host:
-        raise HTTPException(status_code=404, detail="Host not found")
 
+@router.patch("/vms/{vm_id}", response_model=VirtualMachineInfo)
+async def update_vm(vm_id: str, body: VMUpdateRequest):
     payload = body.model_dump(exclude_unset=True)
     if not payload:
         raise HTTPException(status_code=400, detail="No fields to update")
+    host_ip = await _vm_host_ip(vm_id)
+    return await _on_host(host_ip, _update_vm, vm_id, payload)
+
+
+def _update_vm(db: Session, vm_id: str, payload: dict):
+    vm, host = _get_vm_and_host(db, vm_id)
+    updated_vm = virtualization_service.update_vm_basic_info(
+        db,
+        host,
+        vm,
+        new_name=payload.get("name"),
+        new_description=payload.get("description"),
+    )
 
-    try:
-        updated_vm = virtualization_service.update_vm_basic_info(
-            db,
-            host,
-            vm,
-            new_name=payload.get("name"),
-            new_description=payload.get("description"),
-        )
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except TimeoutError as e:
-        raise HTTPException(status_code=504, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=str(e))
+    return _to_vm_info(updated_vm, host.id)
 
-    host_map = {h.ip: h.id for h in db.query(EsxiHost).all()}
-    return VirtualMachineInfo(
-        id=str(updated_vm.id),
-        name=updated_vm.name,
-        power_state=updated_vm.status or "unknown",
-        guest_os=updated_vm.os_name,
-        ip_address=updated_vm.ip_address,
-        description=updated_vm.description,
-        instance_uuid=updated_vm.uuid,
-        host_ip=updated_vm.host_ip,
-        host_id=host_map.get(updated_vm.host_ip),
-        cpu_count=updated_vm.cpu_count,
-        memory_mb=updated_vm.memory_mb,
-        cpu_usage_mhz=updated_vm.cpu_usage_mhz,
-        memory_usage_mb=updated_vm.memory_usage_mb,
-        uptime_seconds=updated_vm.uptime_seconds,
-        disk_used_gb=updated_vm.disk_used_gb,
-        disk_provisioned_gb=updated_vm.disk_provisioned_gb,
-        tools_status=updated_vm.tools_status,
-    )
+
+def _check_power_action(action: str):
+    if action.lower() not in POWER_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"不支持的动作: {action}")
 
 
 @router.post("/vms/{vm_id}/power", response_model=AsyncTaskResponse)
 def power_action(vm_id: str, body: PowerActionRequest, db: Session = Depends(get_db)):
-    vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
-    if not vm:
-        raise HTTPException(status_code=404, detail="VM not found")
-    host = db.query(EsxiHost).filter(EsxiHost.ip == vm.host_ip).first()
-    if not host:
-        raise HTTPException(status_code=404, detail="Host not found")
-    try:
-        return virtualization_service.power_vm(db, host, vm, body.action)
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except TimeoutError as e:
-        raise HTTPException(status_code=504, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=str(e))
+    """电源动作入队后立即返回任务 id，执行结果与刷新后的状态通过任务中心查看"""
+    _check_power_action(body.action)
+    vm, host = _get_vm_and_host(db, vm_id)
+    task = job_queue.enqueue(
+        db,
+        "power_vm",
+        payload={"host_id": host.id, "vm_id": vm.id, "action": body.action},
+        target_id=vm.id,
+        message=f"等待执行 {body.action}",
+    )
+    return AsyncTaskResponse(task_id=task.id, status=task.status, message=f"{vm.name} 的 {body.action} 操作已提交")
 
 
-def bg_clone_task(
-    task_id: str,
-    host_id: int,
-    vm_id: str,
-    new_name: str,
-    target_datastore: Optional[str],
-    power_on: bool,
-    source_ip: Optional[str],
-    auto_config_ip: bool,
-    guest_username: Optional[str],
-    guest_password: Optional[str],
-    new_ip: Optional[str],
-    netmask: Optional[str],
-    gateway: Optional[str],
-    dns: Optional[List[str]],
-    nic_name: Optional[str],
-    disconnect_nic_first: bool,
-):
-    print(f"[BG Task] ========== 后台克隆任务启动 ==========")
-    print(f"[BG Task] task_id: {task_id}")
-    print(f"[BG Task] new_name: {new_name}")
-    print(f"[BG Task] auto_config_ip: {auto_config_ip}")
-    if auto_config_ip:
-        print(f"[BG Task] IP配置参数: nic={nic_name}, ip={new_ip}, netmask={netmask}, gw={gateway}, dns={dns}")
-    db = SessionLocal()
-    try:
-        host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
-        vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
-        
-        start_msg = "准备克隆"
-        metadata = {}
-        if vm:
-            start_msg = f"正在克隆: {vm.name} -> {new_name}"
-            metadata = {"source": vm.name, "target": new_name}
-            
-        task_service.update_task(db, task_id, status="running", progress=5, message=start_msg, result=metadata)
-        
-        if host and vm:
-            print(f"[BG Task] Starting clone for {vm.name} -> {new_name}")
-            res = virtualization_service.clone_vm(
-                db=db,
-                host=host,
-                vm=vm,
-                new_name=new_name,
-                target_datastore=target_datastore,
-                power_on=power_on,
-                source_ip=source_ip,
-                auto_config_ip=auto_config_ip,
-                guest_username=guest_username,
-                guest_password=guest_password,
-                new_ip=new_ip,
-                netmask=netmask,
-                gateway=gateway,
-                dns=dns,
-                nic_name=nic_name,
-                disconnect_nic_first=disconnect_nic_first,
-                task_id=task_id,
-                task_service=task_service,
-            )
-            ip_msg = res.get("ip_message")
-            final_msg = res.get("message")
-            ip_configured = res.get("ip_configured")
-
-            print(f"[BG Task] ========== 克隆结果 ==========")
-            print(f"[BG Task] success: {res.get('success')}")
-            print(f"[BG Task] new_vm_moref: {res.get('new_vm_moref')}")
-            print(f"[BG Task] ip_configured: {ip_configured}")
-            print(f"[BG Task] ip_message: {ip_msg}")
-
-            if ip_msg and not ip_configured:
-                final_msg += f" [IP配置失败: {ip_msg}]"
-                print(f"[BG Task] ⚠️ IP 配置失败，但克隆任务标记为成功")
-
-            task_service.update_task(
-                db,
-                task_id,
-                status="success",
-                progress=100,
-                message=final_msg,
-                result={
-                    "source": vm.name,
-                    "target": new_name,
-                    "new_vm_moref": res.get("new_vm_moref"),
-                    "new_vmx_path": res.get("new_vmx_path"),
-                    "ip_configured": ip_configured,
-                    "ip_message": ip_msg,
-                },
-            )
-            print(f"[BG Task] ✅ 克隆任务完成: {new_name}")
-        else:
-            print(f"[BG Task] ❌ 未找到 Host 或 VM: host_id={host_id}, vm_id={vm_id}")
-            task_service.update_task(db, task_id, status="failed", message="未找到 Host 或 VM")
-    except Exception as e:
-        print(f"[BG Task] ❌ 克隆失败: {e}")
-        import traceback
-        print(f"[BG Task] 异常堆栈: {traceback.format_exc()}")
-        task_service.update_task(db, task_id, status="failed", message=str(e), progress=100)
-    finally:
-        db.close()
+@router.post("/vms/power/batch", response_model=AsyncTaskResponse)
+def bulk_power_action(body: VMBulkPowerRequest, db: Session = Depends(get_db)):
+    """对多台 VM（可跨主机）执行同一电源动作，整批作为一个后台任务，按主机并行执行"""
+    _check_power_action(body.action)
+    vm_ids = list(dict.fromkeys(body.vm_ids))
+    found = {row[0] for row in db.query(VirtualMachine.id).filter(VirtualMachine.id.in_(vm_ids)).all()}
+    missing = [vm_id for vm_id in vm_ids if vm_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"VM not found: {missing}")
+    task = job_queue.enqueue(
+        db,
+        "bulk_power_vm",
+        payload={"vm_ids": vm_ids, "action": body.action},
+        message=f"等待批量执行 {body.action}（{len(vm_ids)} 台）",
+    )
+    return AsyncTaskResponse(task_id=task.id, status=task.status, message=f"批量 {body.action} 已提交（{len(vm_ids)} 台）")
+
 
 @router.post("/vms/{vm_id}/clone", response_model=AsyncTaskResponse)
-def clone_vm(vm_id: str, body: VMCloneRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def clone_vm(vm_id: str, body: VMCloneRequest, db: Session = Depends(get_db)):
     print(f"[API] ========== 收到克隆请求 ==========")
     print(f"[API] vm_id: {vm_id}")
     print(f"[API] 请求参数:")
@@ -434,34 +509,51 @@ def clone_vm(vm_id: str, body: VMCloneRequest, background_tasks: BackgroundTasks
         raise HTTPException(status_code=404, detail="Host not found")
     print(f"[API] 宿主机: {host.ip} ({host.hostname})")
 
-    # 创建任务记录
-    task = task_service.create_task(db, type="clone_vm", target_id=vm.id, message="等待开始")
+    # 写入持久化队列，由 worker 执行
+    # Guest 密码不进 payload，单独存放，任务结束即删除
+    options = body.model_dump(exclude={"guest_password"})
+    task = job_queue.enqueue(
+        db,
+        "clone_vm",
+        payload={"host_id": host.id, "vm_id": vm.id, "options": options},
+        target_id=vm.id,
+        secrets={"guest_password": body.guest_password} if body.guest_password else None,
+    )
     print(f"[API] ✅ 创建任务: task_id={task.id}")
 
-    # 立即返回，后台执行
-    background_tasks.add_task(
-        bg_clone_task, 
-        task.id,
-        host.id, 
-        vm.id, 
-        body.new_name, 
-        body.target_datastore, 
-        body.power_on,
-        body.source_ip,
-        body.auto_config_ip,
-        body.guest_username,
-        body.guest_password,
-        body.new_ip,
-        body.netmask,
-        body.gateway,
-        body.dns,
-        body.nic_name,
-        body.disconnect_nic_first,
-    )
-    
     return AsyncTaskResponse(task_id=task.id, status=task.status, message="克隆任务已提交后台运行")
 
 
+@router.post("/vms/{vm_id}/clone/batch", response_model=AsyncTaskResponse)
+def batch_clone_vm(vm_id: str, body: VMBatchCloneRequest, db: Session = Depends(get_db)):
+    """从同一源 VM 批量克隆，整批作为一个后台任务执行，子任务进度写在 result.children"""
+    vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
+    if not vm:
+        raise HTTPException(status_code=404, detail="VM not found")
+    host = db.query(EsxiHost).filter(EsxiHost.ip == vm.host_ip).first()
+    if not host:
+        raise HTTPException(status_code=404, detail="Host not found")
+
+    items = [item.model_dump() for item in body.items]
+    try:
+        virtualization_service.validate_batch_clone(
+            items, body.auto_config_ip, body.guest_username, body.guest_password, body.netmask
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    options = body.model_dump(exclude={"items", "guest_password"})
+    task = job_queue.enqueue(
+        db,
+        "batch_clone_vm",
+        payload={"host_id": host.id, "vm_id": vm.id, "items": items, "options": options},
+        target_id=vm.id,
+        secrets={"guest_password": body.guest_password} if body.guest_password else None,
+    )
+    print(f"[API] ✅ 创建批量克隆任务: task_id={task.id}, {vm.name} -> {len(items)} 台")
+    return AsyncTaskResponse(task_id=task.id, status=task.status, message=f"批量克隆任务已提交后台运行（{len(items)} 台）")
+
+
 @router.get("/vms/{vm_id}/console")
 def get_console(vm_id: str):
     return {
@@ -471,67 +563,158 @@ def get_console(vm_id: str):
     }
 
 
-@router.post("/sync")
-def sync_hosts(body: dict = None, db: Session = Depends(get_db)):
+@router.post("/sync", response_model=SyncResponse)
+async def sync_hosts(body: dict = None):
+    """手动同步；增量监听在线的主机默认跳过全量扫描，force=true 强制全量"""
     host_id = (body or {}).get("host_id")
+    force = bool((body or {}).get("force"))
     if host_id:
-        host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
-        if not host:
+        host_ip = await run_in_threadpool(inventory_cache.host_ip, SessionLocal, host_id)
+        if not host_ip:
             raise HTTPException(status_code=404, detail="Host not found")
-        virtualization_service.sync_host_vms(db, host)
-        return {"success": True, "message": f"Sync started for {host.ip}"}
-    virtualization_service.sync_all_hosts(db)
-    return {"success": True, "message": "Sync started for all hosts"}
+        if not force and inventory_watcher.is_live(host_ip):
+            return {"success": True, "message": f"{host_ip} 增量同步运行中，数据已是最新"}
+        await _on_host(host_ip, _sync_host_by_id, host_id)
+        inventory_watcher.ensure(host_id, host_ip)
+        return {"success": True, "message": f"Sync started for {host_ip}"}
+    skip_ips = set() if force else inventory_watcher.live_ips()
+    # 全量同步内部已按主机并发，占用独立队列，不与单主机操作互相排队
+    results = await _on_host("*", lambda db: virtualization_service.sync_all_hosts(db, skip_ips=skip_ips))
+    failed = [r for r in results if not r["success"]]
+    message = f"Synced {len(results) - len(failed)}/{len(results)} hosts"
+    return {"success": True, "message": message, "results": results}
 
 
 @router.post("/vms/{vm_id}/install-tools", response_model=AsyncTaskResponse)
-def install_tools(vm_id: str, body: VMInstallToolsRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def install_tools(vm_id: str, body: VMInstallToolsRequest, db: Session = Depends(get_db)):
     vm = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
     if not vm:
         raise HTTPException(status_code=404, detail="VM not found")
         
-    username = body.username
-    password = body.password
-    
+    # payload 只记录凭据 ID，密码由 worker 执行时再读取
     if body.credential_id:
         cred = db.query(Credential).filter(Credential.id == body.credential_id).first()
         if not cred:
             raise HTTPException(status_code=400, detail="Credential not found")
-        username = cred.username
-        password = cred.password
-    
-    if not username or not password:
+        payload = {"ip": body.ip, "credential_id": cred.id}
+        secrets = None
+    elif body.username and body.password:
+        payload = {"ip": body.ip, "username": body.username}
+        secrets = {"password": body.password}
+    else:
         raise HTTPException(status_code=400, detail="Username and password required (directly or via credential_id)")
 
-    task = task_service.create_task(db, type="install_tools", target_id=vm.id, message="准备安装 Tools")
-    
-    def bg_install(task_id, ip, user, pwd):
-        db_inner = SessionLocal()
-        try:
-            task_service.update_task(db_inner, task_id, status="running", progress=10, message=f"正在连接 SSH: {ip}")
-            virtualization_service.install_tools_ssh(ip, user, pwd)
-            task_service.update_task(db_inner, task_id, status="success", progress=100, message="Tools 安装命令执行成功，请稍候同步")
-        except Exception as e:
-            task_service.update_task(db_inner, task_id, status="failed", progress=100, message=str(e))
-        finally:
-            db_inner.close()
-
-    background_tasks.add_task(bg_install, task.id, body.ip, username, password)
-    
+    task = job_queue.enqueue(
+        db,
+        "install_tools",
+        payload=payload,
+        target_id=vm.id,
+        message="准备安装 Tools",
+        secrets=secrets,
+    )
+
     return AsyncTaskResponse(task_id=task.id, status=task.status, message="后台安装任务已启动")
 
 
 @router.get("/datastores/stats", response_model=DatastoreStatsResponse)
 def get_datastore_stats(db: Session = Depends(get_db)):
-    count = db.query(Datastore).count()
-    # Calculate sum of capacity and free
-    stats = db.query(
-        func.sum(Datastore.capacity_gb).label("total_capacity"),
-        func.sum(Datastore.free_gb).label("total_free")
-    ).first()
-    
+    overall = load_aggregates(db)[GLOBAL_KEY]
     return DatastoreStatsResponse(
-        total_count=count,
-        total_capacity_gb=stats.total_capacity or 0.0,
-        total_free_gb=stats.total_free or 0.0
+        total_count=overall.datastore_count or 0,
+        total_capacity_gb=overall.datastore_capacity_gb or 0.0,
+        total_free_gb=overall.datastore_free_gb or 0.0,
+    )
+
+
+@router.get("/stats", response_model=InventoryStatsResponse)
+def get_inventory_stats(db: Session = Depends(get_db)):
+    """预聚合的清单统计：全局汇总 + 每台主机一行"""
+    aggregates = load_aggregates(db)
+    return InventoryStatsResponse(
+        overall=InventoryAggregateInfo.model_validate(aggregates.pop(GLOBAL_KEY)),
+        hosts=[InventoryAggregateInfo.model_validate(row) for _, row in sorted(aggregates.items())],
     )
+
+
+
+@router.get("/capacity", response_model=CapacityReportResponse)
+def get_capacity_report(
+    host_id: Optional[int] = Query(None, description="仅统计该主机"),
+    top: int = Query(100, ge=0, le=1000, description="空闲 / 规格过大 VM 列表各返回的最大条数"),
+    db: Session = Depends(get_db),
+):
+    """容量规划报告：超配比、存储耗尽预测、空闲与规格过大的 VM（全量向量化计算）"""
+    try:
+        return CapacityReportResponse(**capacity_planner.report(db, host_id=host_id, top=top))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+def _unix(value: Optional[datetime], default: float) -> int:
+    if value is None:
+        return int(default)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _query_metrics(
+    db: Session,
+    entity_type: str,
+    entity_id: str,
+    metrics: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    resolution: Optional[int],
+) -> MetricsResponse:
+    allowed = list(METRIC_COUNTERS) + (HOST_GAUGES if entity_type == "host" else [])
+    names = [m.strip() for m in metrics.split(",") if m.strip()] if metrics else allowed
+    unknown = [m for m in names if m not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知指标: {', '.join(unknown)}")
+    if resolution is not None and resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution 仅支持 {RESOLUTIONS}")
+    end_ts = _unix(end, time.time())
+    start_ts = _unix(start, end_ts - 3600)
+    try:
+        data = metrics_store.query(db, entity_type, entity_id, names, start_ts, end_ts, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MetricsResponse(
+        entity_type=entity_type,
+        entity_id=entity_id,
+        resolution=data["resolution"],
+        timestamps=data["timestamps"],
+        series=[MetricSeries(metric=name, **values) for name, values in data["series"].items()],
+    )
+
+
+@router.get("/vms/{vm_id}/metrics", response_model=MetricsResponse)
+def get_vm_metrics(
+    vm_id: str,
+    metrics: Optional[str] = Query(None, description="逗号分隔的指标名，默认全部"),
+    start: Optional[datetime] = Query(None, description="开始时间（ISO 8601 或 Unix 秒），默认结束前 1 小时"),
+    end: Optional[datetime] = Query(None, description="结束时间，默认当前"),
+    resolution: Optional[int] = Query(None, description="点间隔秒数 20/300/3600，默认按时间跨度自动选择"),
+    db: Session = Depends(get_db),
+):
+    """VM 性能曲线：短范围读原始 20 秒采样，长范围读 5 分钟 / 1 小时汇总"""
+    if not db.query(VirtualMachine.id).filter(VirtualMachine.id == vm_id).first():
+        raise HTTPException(status_code=404, detail="VM not found")
+    return _query_metrics(db, "vm", vm_id, metrics, start, end, resolution)
+
+
+@router.get("/hosts/{host_id}/metrics", response_model=MetricsResponse)
+def get_host_metrics(
+    host_id: int,
+    metrics: Optional[str] = Query(None, description="逗号分隔的指标名，默认全部"),
+    start: Optional[datetime] = Query(None, description="开始时间（ISO 8601 或 Unix 秒），默认结束前 1 小时"),
+    end: Optional[datetime] = Query(None, description="结束时间，默认当前"),
+    resolution: Optional[int] = Query(None, description="点间隔秒数 20/300/3600，默认按时间跨度自动选择"),
+    db: Session = Depends(get_db),
+):
+    """主机性能曲线"""
+    host_ip = inventory_cache.host_ip(SessionLocal, host_id)
+    if not host_ip:
+        raise HTTPException(status_code=404, detail="Host not found")
+    return _query_metrics(db, "host", host_ip, metrics, start, end, resolution)
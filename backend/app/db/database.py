@@ -35,6 +35,18 @@ else:
 
 engine = create_engine(DATABASE_URL, **engine_kwargs)
 
+if DATABASE_URL.startswith("sqlite") and os.getenv("SQLITE_TUNED", "True") == "True":
+    from .sqlite import configure_sqlite
+
+    configure_sqlite(
+        engine,
+        busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+        mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+        cache_size_kb=int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024))),
+        serialize_writes=os.getenv("SQLITE_SERIALIZE_WRITES", "True") == "True",
+        write_lock_timeout=float(os.getenv("SQLITE_WRITE_LOCK_TIMEOUT", "30")),
+    )
+
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -63,6 +75,7 @@ def init_db():
         import app.models.task  # noqa: F401
         import app.models.credential  # noqa: F401
         import app.models.virtualization  # noqa: F401
+        import app.models.metrics  # noqa: F401
     except Exception as e:
         print(f"[init_db] import task model failed: {e}")
     Base.metadata.create_all(bind=engine)
@@ -85,6 +98,23 @@ def init_db():
                 else:
                     _add_column_sql("virtual_machines", "description TEXT")
                 print("[init_db] added column virtual_machines.description")
+            if "moref" not in columns:
+                _add_column_sql("virtual_machines", "moref VARCHAR(50)")
+                print("[init_db] added column virtual_machines.moref")
+            try:
+                idx_names = {idx.get("name") for idx in inspector.get_indexes("virtual_machines")}
+                vm_indexes = [
+                    ("idx_vms_host_status_name", "host_ip, status, name, id"),
+                    ("idx_vms_host_name", "host_ip, name, id"),
+                    ("idx_vms_status_name", "status, name, id"),
+                ]
+                for name, cols in vm_indexes:
+                    if name not in idx_names:
+                        with engine.begin() as conn:
+                            conn.execute(text(f"CREATE INDEX {name} ON virtual_machines({cols})"))
+                        print(f"[init_db] added index {name}")
+            except Exception as e:
+                print(f"[init_db] ensure virtual_machines indexes failed: {e}")
         if "esxi_hosts" in tables:
             columns = {col["name"] for col in inspector.get_columns("esxi_hosts")}
             if "description" not in columns:
@@ -102,6 +132,12 @@ def init_db():
                 else:
                     _add_column_sql("esxi_hosts", "sort_order INTEGER NOT NULL DEFAULT 0")
                 print("[init_db] added column esxi_hosts.sort_order")
+            if "cpu_mhz" not in columns:
+                if dialect == "mysql":
+                    _add_column_sql("esxi_hosts", "cpu_mhz INT NULL COMMENT '单核主频 (MHz)'")
+                else:
+                    _add_column_sql("esxi_hosts", "cpu_mhz INTEGER")
+                print("[init_db] added column esxi_hosts.cpu_mhz")
             try:
                 idx_names = {idx.get("name") for idx in inspector.get_indexes("esxi_hosts")}
                 if "idx_esxi_hosts_sort_order" not in idx_names:
@@ -110,5 +146,44 @@ def init_db():
                     print("[init_db] added index idx_esxi_hosts_sort_order")
             except Exception as e:
                 print(f"[init_db] ensure index esxi_hosts.sort_order failed: {e}")
+        if "tasks" in tables:
+            columns = {col["name"] for col in inspector.get_columns("tasks")}
+            task_columns = [
+                ("payload", "JSON NULL", "JSON"),
+                ("attempts", "INT NOT NULL DEFAULT 0", "INTEGER NOT NULL DEFAULT 0"),
+                ("max_attempts", "INT NOT NULL DEFAULT 1", "INTEGER NOT NULL DEFAULT 1"),
+                ("available_at", "DATETIME NULL", "DATETIME"),
+                ("lease_owner", "VARCHAR(100) NULL", "VARCHAR(100)"),
+                ("lease_expires_at", "DATETIME NULL", "DATETIME"),
+                ("last_error", "TEXT NULL", "TEXT"),
+            ]
+            for name, mysql_ddl, sqlite_ddl in task_columns:
+                if name not in columns:
+                    _add_column_sql("tasks", f"{name} {mysql_ddl if dialect == 'mysql' else sqlite_ddl}")
+                    print(f"[init_db] added column tasks.{name}")
+            try:
+                idx_names = {idx.get("name") for idx in inspector.get_indexes("tasks")}
+                if "idx_tasks_status_available" not in idx_names:
+                    with engine.begin() as conn:
+                        conn.execute(text("CREATE INDEX idx_tasks_status_available ON tasks(status, available_at)"))
+                    print("[init_db] added index idx_tasks_status_available")
+            except Exception as e:
+                print(f"[init_db] ensure index tasks.status_available failed: {e}")
+            # 旧版本把密码写在 payload 里且终态后不清理，这里清掉已结束任务的参数
+            with engine.begin() as conn:
+                scrubbed = conn.execute(
+                    text("UPDATE tasks SET payload = NULL WHERE status IN ('success', 'failed') AND payload IS NOT NULL")
+                ).rowcount
+            if scrubbed:
+                print(f"[init_db] cleared payload of {scrubbed} finished tasks")
     except Exception as e:
         print(f"[init_db] ensure schema failed: {e}")
+
+    # VM 全文索引（仅 SQLite，需 FTS5 trigram）；不可用时搜索回退为 LIKE
+    if os.getenv("VM_SEARCH_FTS", "True") == "True":
+        try:
+            from .search import ensure_vm_search_index
+
+            ensure_vm_search_index(engine)
+        except Exception as e:
+            print(f"[init_db] ensure full-text index failed: {e}")
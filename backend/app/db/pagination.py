@@ -0,0 +1,58 @@
+"""
+游标（keyset）分页工具：按 (排序列, 主键) 组成稳定排序键，下一页条件为 "排序键 > 上一页末行"，
+配合复合索引可直接定位，不随页码增大而扫描跳过的行；另提供有上限的近似计数。
+"""
+import base64
+import json
+from typing import Any, List, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Query
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """解析游标；格式错误抛 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("无效的分页游标")
+    # 游标来自客户端：排序值只能是标量，主键不能为空，否则拼进 SQL 时才报错（500）
+    value, last_pk = values
+    if not isinstance(value, (str, int, float, type(None))) or not isinstance(last_pk, (str, int)):
+        raise ValueError("无效的分页游标")
+    return values
+
+
+def keyset_after(column, pk, value: Any, last_pk: Any, descending: bool = False):
+    """构造 "(column, pk) 在游标之后" 的条件；SQLite/MySQL 中 NULL 在升序时排最前"""
+    if value is None:
+        if descending:
+            # 降序时 NULL 在末尾：之后只剩同为 NULL 且主键更小的行
+            return and_(column.is_(None), pk < last_pk)
+        return or_(column.is_not(None), and_(column.is_(None), pk > last_pk))
+    if descending:
+        return or_(column < value, and_(column == value, pk < last_pk), column.is_(None))
+    return or_(column > value, and_(column == value, pk > last_pk))
+
+
+def bounded_count(query: Query, column, limit: int) -> Tuple[int, bool]:
+    """计数最多扫描 limit + 1 行；超过上限时返回 (limit, True) 表示近似值"""
+    sub = query.with_entities(column).order_by(None).limit(limit + 1).subquery()
+    count = query.session.execute(select(func.count()).select_from(sub)).scalar() or 0
+    if count > limit:
+        return limit, True
+    return count, False
+
+
+def page_rows(rows: list, limit: int) -> Tuple[list, bool]:
+    """查询时多取一行判断是否还有下一页"""
+    return rows[:limit], len(rows) > limit
+
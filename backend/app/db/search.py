@@ -0,0 +1,68 @@
+"""
+VM 清单全文索引（仅 SQLite）：FTS5 trigram 外部内容表 vm_search 索引 virtual_machines 的
+name / ip_address / os_name / description / host_ip，由触发器随每次 INSERT / UPDATE / DELETE 增量维护，
+同步、增量监听、定向刷新与删除主机等所有写路径无需额外代码。
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+VM_SEARCH_TABLE = "vm_search"
+VM_SEARCH_COLUMNS = ["name", "ip_address", "os_name", "description", "host_ip"]
+
+
+def _trigger_sql() -> list:
+    cols = ", ".join(VM_SEARCH_COLUMNS)
+    new_vals = ", ".join(f"new.{c}" for c in VM_SEARCH_COLUMNS)
+    old_vals = ", ".join(f"old.{c}" for c in VM_SEARCH_COLUMNS)
+    t = VM_SEARCH_TABLE
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {t}_ai AFTER INSERT ON virtual_machines BEGIN
+            INSERT INTO {t}(rowid, {cols}) VALUES (new.rowid, {new_vals});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {t}_ad AFTER DELETE ON virtual_machines BEGIN
+            INSERT INTO {t}({t}, rowid, {cols}) VALUES ('delete', old.rowid, {old_vals});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {t}_au AFTER UPDATE OF {cols} ON virtual_machines BEGIN
+            INSERT INTO {t}({t}, rowid, {cols}) VALUES ('delete', old.rowid, {old_vals});
+            INSERT INTO {t}(rowid, {cols}) VALUES (new.rowid, {new_vals});
+        END""",
+    ]
+
+
+def fts5_trigram_supported(engine: Engine) -> bool:
+    """trigram 分词器需要 SQLite 3.34+ 且编译启用 FTS5"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')"))
+            conn.execute(text("DROP TABLE temp._fts5_probe"))
+        return True
+    except Exception:
+        return False
+
+
+def ensure_vm_search_index(engine: Engine) -> bool:
+    """创建 FTS 表与触发器；首次创建时从现有数据重建索引。返回索引是否可用"""
+    if engine.dialect.name != "sqlite" or not fts5_trigram_supported(engine):
+        return False
+    t = VM_SEARCH_TABLE
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": t}
+        ).first()
+        if not exists:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {t} USING fts5({', '.join(VM_SEARCH_COLUMNS)}, "
+                f"content='virtual_machines', content_rowid='rowid', tokenize='trigram')"
+            ))
+        for sql in _trigger_sql():
+            conn.execute(text(sql))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {t}({t}) VALUES ('rebuild')"))
+            print(f"[init_db] created full-text index {t}")
+    return True
+
+
+def rebuild_vm_search_index(engine: Engine):
+    """virtual_machines 的 rowid 在 VACUUM 后可能变化，执行 VACUUM 后需重建"""
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {VM_SEARCH_TABLE}({VM_SEARCH_TABLE}) VALUES ('rebuild')"))
@@ -0,0 +1,96 @@
+"""
+SQLite 生产配置：连接时设置 WAL / synchronous=NORMAL / busy_timeout / mmap / cache 等 PRAGMA，
+并在进程内串行化写事务——首条 DML 前获取全局写锁，驱动层 commit/rollback 完成后释放，
+后台同步、克隆进度与 API 写入在 Python 层排队，而不是在 SQLite 层互相撞上 "database is locked"。
+跨进程（独立 worker.py）仍依赖 busy_timeout 等待。
+"""
+import threading
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class SqliteWriteLock:
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._owner: Optional[int] = None
+
+    @staticmethod
+    def _key(conn) -> int:
+        # 连接池代理对象与原始 DBAPI 连接统一按底层连接识别
+        return id(getattr(conn, "dbapi_connection", conn))
+
+    def acquire(self, conn):
+        key = self._key(conn)
+        if self._owner == key:
+            return
+        if not self._lock.acquire(timeout=self.timeout):
+            raise TimeoutError(f"等待 SQLite 写锁超时（{self.timeout}s）")
+        self._owner = key
+
+    def release(self, conn):
+        if self._owner == self._key(conn):
+            self._owner = None
+            self._lock.release()
+
+
+def configure_sqlite(
+    engine: Engine,
+    busy_timeout_ms: int = 5000,
+    mmap_size: int = 256 * 1024 * 1024,
+    cache_size_kb: int = 64 * 1024,
+    serialize_writes: bool = True,
+    write_lock_timeout: float = 30,
+) -> Optional[SqliteWriteLock]:
+    """为 SQLite engine 安装 PRAGMA 与写串行化；返回写锁（未启用时为 None）"""
+    in_memory = engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        try:
+            if not in_memory:
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+            cursor.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+            # 负数表示以 KiB 为单位
+            cursor.execute(f"PRAGMA cache_size=-{int(cache_size_kb)}")
+            cursor.execute("PRAGMA temp_store=MEMORY")
+        finally:
+            cursor.close()
+
+    if not serialize_writes:
+        return None
+
+    write_lock = SqliteWriteLock(timeout=write_lock_timeout)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _acquire_write_lock(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:7].upper().startswith(_WRITE_PREFIXES):
+            write_lock.acquire(conn.connection)
+
+    # 在驱动真正提交/回滚之后释放（ConnectionEvents.commit 触发于提交之前）；
+    # 连接池归还连接时的 reset 也走 do_rollback
+    dialect = engine.dialect
+    do_commit, do_rollback = dialect.do_commit, dialect.do_rollback
+
+    def _commit(dbapi_conn):
+        try:
+            do_commit(dbapi_conn)
+        finally:
+            write_lock.release(dbapi_conn)
+
+    def _rollback(dbapi_conn):
+        try:
+            do_rollback(dbapi_conn)
+        finally:
+            write_lock.release(dbapi_conn)
+
+    dialect.do_commit = _commit
+    dialect.do_rollback = _rollback
+    return write_lock
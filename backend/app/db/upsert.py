@@ -0,0 +1,69 @@
+"""
+批量 Upsert 工具：内存中比对已有行，仅对新增/变化的行执行分批 INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE。
+"""
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy.orm import Session
+
+
+def load_rows(db: Session, model, columns: Sequence[str], *criteria) -> Dict[Any, Dict[str, Any]]:
+    """单次查询加载已有行（仅取列值，不建立 ORM 对象），按主键索引"""
+    pk = model.__mapper__.primary_key[0].name
+    names = list(dict.fromkeys([pk, *columns]))
+    query = db.query(*[getattr(model, name) for name in names])
+    if criteria:
+        query = query.filter(*criteria)
+    return {row[0]: dict(zip(names, row)) for row in query.all()}
+
+
+def diff_rows(
+    existing: Dict[Any, Dict[str, Any]],
+    incoming: Iterable[Dict[str, Any]],
+    key: str = "id",
+    compare: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    """返回需要写入的行：不存在的新行，或 compare 列中任一列发生变化的行"""
+    changed = []
+    for row in incoming:
+        old = existing.get(row[key])
+        if old is None or any(old.get(col) != row.get(col) for col in compare):
+            changed.append(row)
+    return changed
+
+
+def bulk_upsert(db: Session, model, rows: List[Dict[str, Any]], chunk_size: int = 200) -> int:
+    """按方言分批 upsert；rows 的键即写入列（各行一致），主键冲突时更新其余列。
+    语句只构造一次并以 executemany 执行，SQLAlchemy 可复用编译缓存，大批量写入时不再逐批重新编译多行 VALUES"""
+    if not rows:
+        return 0
+    table = model.__table__
+    pk_cols = [col.name for col in table.primary_key.columns]
+    dialect = db.get_bind().dialect.name
+    update_cols = [name for name in rows[0].keys() if name not in pk_cols]
+
+    stmt = None
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=pk_cols,
+            set_={name: stmt.excluded[name] for name in update_cols},
+        )
+    elif dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+
+        stmt = insert(table)
+        stmt = stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update_cols})
+
+    written = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        if stmt is not None:
+            db.execute(stmt, chunk)
+        else:
+            # 其他方言退化为逐行 merge
+            for row in chunk:
+                db.merge(model(**row))
+        written += len(chunk)
+    return written
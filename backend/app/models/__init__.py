@@ -1,11 +1,15 @@
 from .credential import Credential
-from .task import Task
+from .task import Task, TaskSecret
 from .virtualization import EsxiHost, VirtualMachine, Datastore
+from .metrics import MetricRawChunk, MetricRollupChunk
 
 __all__ = [
     "Credential",
     "Task",
+    "TaskSecret",
     "EsxiHost",
     "VirtualMachine",
     "Datastore",
+    "MetricRawChunk",
+    "MetricRollupChunk",
 ]
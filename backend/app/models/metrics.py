@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, BigInteger, LargeBinary, Index
+from app.db import Base
+
+
+class MetricRawChunk(Base):
+    """原始性能采样（20 秒粒度）：每个 实体 x 指标 x 20 分钟 一行，采样值按时间槽位存为 float32 数组"""
+    __tablename__ = "metric_raw_chunks"
+    __table_args__ = (Index("idx_metric_raw_host_start", "host_ip", "chunk_start"),)
+
+    entity_type = Column(String(10), primary_key=True, comment="vm / host")
+    entity_id = Column(String(50), primary_key=True, comment="VM 本地 ID 或主机 IP")
+    metric = Column(String(30), primary_key=True)
+    chunk_start = Column(BigInteger, primary_key=True, comment="块起始时间（Unix 秒，按块跨度对齐）")
+    host_ip = Column(String(50), nullable=False)
+    samples = Column(LargeBinary, nullable=False, comment="float32 小端数组，NaN 表示缺失")
+
+
+class MetricRollupChunk(Base):
+    """降采样汇总（5 分钟 / 1 小时粒度）：每个槽位保存 sum / count / max，平均值 = sum / count"""
+    __tablename__ = "metric_rollup_chunks"
+    __table_args__ = (Index("idx_metric_rollup_host_start", "host_ip", "resolution", "chunk_start"),)
+
+    entity_type = Column(String(10), primary_key=True)
+    entity_id = Column(String(50), primary_key=True)
+    metric = Column(String(30), primary_key=True)
+    resolution = Column(Integer, primary_key=True, comment="槽位粒度（秒）")
+    chunk_start = Column(BigInteger, primary_key=True)
+    host_ip = Column(String(50), nullable=False)
+    sums = Column(LargeBinary, nullable=False)
+    counts = Column(LargeBinary, nullable=False)
+    maxes = Column(LargeBinary, nullable=False)
@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Integer, Text, DateTime, JSON
+from sqlalchemy import Column, String, Integer, Text, DateTime, JSON, Index
 from sqlalchemy.sql import func
 from app.db import Base
 
@@ -16,3 +16,24 @@ class Task(Base):
     result = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # 持久化任务队列字段（见 app/services/job_queue.py）
+    payload = Column(JSON, nullable=True, comment="任务参数（由 worker 执行时读取，不对外返回）")
+    attempts = Column(Integer, nullable=False, default=0, comment="已执行次数")
+    max_attempts = Column(Integer, nullable=False, default=1, comment="最大执行次数")
+    available_at = Column(DateTime, nullable=True, comment="最早可执行时间（UTC），用于重试退避")
+    lease_owner = Column(String(100), nullable=True, comment="持有租约的 worker")
+    lease_expires_at = Column(DateTime, nullable=True, comment="租约到期时间（UTC），靠心跳续期")
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (Index("idx_tasks_status_available", "status", "available_at"),)
+
+
+class TaskSecret(Base):
+    """任务执行所需的敏感参数（密码等），与 payload 分开存放；任务进入终态即删除"""
+
+    __tablename__ = "task_secrets"
+
+    task_id = Column(String(64), primary_key=True, comment="对应 tasks.id")
+    data = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
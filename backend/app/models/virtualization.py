@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, Text, BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, Float, DateTime, Text, BigInteger, Index
 from sqlalchemy.sql import func
 from app.db import Base
 
@@ -20,6 +20,7 @@ class EsxiHost(Base):
     cpu_usage = Column(Float, default=0.0, comment="CPU Usage %")
     memory_usage = Column(Float, default=0.0, comment="Memory Usage %")
     cpu_cores = Column(Integer, nullable=True, comment="Total CPU cores")
+    cpu_mhz = Column(Integer, nullable=True, comment="单核主频 (MHz)")
     memory_total_gb = Column(Float, nullable=True, comment="Total memory in GB")
     storage_total_gb = Column(Float, nullable=True, comment="Total storage in GB (sum of datastores)")
     storage_free_gb = Column(Float, nullable=True, comment="Free storage in GB (sum of datastores)")
@@ -31,12 +32,19 @@ class EsxiHost(Base):
 
 class VirtualMachine(Base):
     __tablename__ = "virtual_machines"
+    __table_args__ = (
+        # 列表页的筛选 + 游标分页：按主机/状态过滤后按 (name, id) 顺序定位
+        Index("idx_vms_host_status_name", "host_ip", "status", "name", "id"),
+        Index("idx_vms_host_name", "host_ip", "name", "id"),
+        Index("idx_vms_status_name", "status", "name", "id"),
+    )
 
     id = Column(String(50), primary_key=True, comment="Local ID (e.g. host_ip-vm_uuid)")
     uuid = Column(String(100), index=True)
     name = Column(String(200), index=True)
     
     host_ip = Column(String(50), index=True, comment="Belongs to which host")
+    moref = Column(String(50), nullable=True, comment="vSphere Managed Object ID（如 vm-12），用于直接定位对象")
     
     status = Column(String(20), comment="poweredOn/poweredOff/suspended")
     ip_address = Column(String(50), comment="Primary IP")
@@ -66,3 +74,25 @@ class Datastore(Base):
     capacity_gb = Column(Float, default=0.0)
     free_gb = Column(Float, default=0.0)
     last_sync = Column(DateTime(timezone=True))
+
+class InventoryAggregate(Base):
+    """按主机（host_ip）与全局（host_ip="*"）预聚合的清单统计，随同步事务一起更新"""
+    __tablename__ = "inventory_aggregates"
+
+    host_ip = Column(String(50), primary_key=True, comment="宿主机 IP；* 表示全局汇总")
+    vm_total = Column(Integer, default=0)
+    vm_powered_on = Column(Integer, default=0)
+    vm_powered_off = Column(Integer, default=0)
+    vm_suspended = Column(Integer, default=0)
+    vcpu_total = Column(Integer, default=0, comment="全部 VM 配置的 vCPU 数")
+    vcpu_running = Column(Integer, default=0, comment="开机 VM 的 vCPU 数")
+    memory_mb_total = Column(BigInteger, default=0, comment="全部 VM 配置内存 (MB)")
+    memory_mb_running = Column(BigInteger, default=0, comment="开机 VM 配置内存 (MB)")
+    memory_usage_mb = Column(BigInteger, default=0, comment="Guest 内存使用合计 (MB)")
+    cpu_usage_mhz = Column(BigInteger, default=0, comment="VM CPU 使用合计 (MHz)")
+    disk_provisioned_gb = Column(Float, default=0.0)
+    disk_used_gb = Column(Float, default=0.0)
+    datastore_count = Column(Integer, nullable=True, comment="仅全局行：数据存储数量")
+    datastore_capacity_gb = Column(Float, default=0.0)
+    datastore_free_gb = Column(Float, default=0.0)
+    updated_at = Column(DateTime(timezone=True))
@@ -6,10 +6,22 @@ from .virtualization import (
     HostReorderRequest,
     SuccessResponse,
     VMCloneRequest,
+    VMBatchCloneItem,
+    VMBatchCloneRequest,
     VMCloneResponse,
     VMInstallToolsRequest,
     DatastoreStatsResponse,
+    InventoryAggregateInfo,
+    InventoryStatsResponse,
+    MetricSeries,
+    MetricsResponse,
+    CapacityHostInfo,
+    CapacityVmInfo,
+    CapacityReportResponse,
+    HostSyncResult,
+    SyncResponse,
     PowerActionRequest,
+    VMBulkPowerRequest,
     VMUpdateRequest,
     AsyncTaskResponse,
 )
@@ -24,10 +36,22 @@ __all__ = [
     "HostReorderRequest",
     "SuccessResponse",
     "VMCloneRequest",
+    "VMBatchCloneItem",
+    "VMBatchCloneRequest",
     "VMCloneResponse",
     "VMInstallToolsRequest",
     "DatastoreStatsResponse",
+    "InventoryAggregateInfo",
+    "InventoryStatsResponse",
+    "MetricSeries",
+    "MetricsResponse",
+    "CapacityHostInfo",
+    "CapacityVmInfo",
+    "CapacityReportResponse",
+    "HostSyncResult",
+    "SyncResponse",
     "PowerActionRequest",
+    "VMBulkPowerRequest",
     "VMUpdateRequest",
     "AsyncTaskResponse",
     "TaskBase",
@@ -63,8 +63,10 @@ class VirtualMachineInfo(BaseModel):
 
 
 class VirtualMachineListResponse(BaseModel):
-    total: int
+    total: Optional[int] = Field(default=None, description="total=none 时为空")
     items: List[VirtualMachineInfo]
+    total_is_approximate: bool = Field(default=False, description="total=approx 且超过计数上限时为 true")
+    next_cursor: Optional[str] = Field(default=None, description="下一页游标；为空表示没有更多")
 
 
 # 兼容旧设计的响应/请求，可继续复用
@@ -94,6 +96,11 @@ class PowerActionRequest(BaseModel):
     action: str  # powerOn, reboot, etc.
 
 
+class VMBulkPowerRequest(BaseModel):
+    vm_ids: List[str] = Field(..., min_length=1, description="目标 VM id 列表，可跨主机")
+    action: str = Field(description="powerOn / shutdown / powerOff / reboot / reset")
+
+
 class VMUpdateRequest(BaseModel):
     name: Optional[str] = Field(default=None, description="新名称")
     description: Optional[str] = Field(default=None, description="备注/Annotation")
@@ -121,6 +128,25 @@ class VMCloneRequest(BaseModel):
     disconnect_nic_first: bool = Field(default=True, description="克隆后开机前先断开网卡，避免 IP 冲突")
 
 
+class VMBatchCloneItem(BaseModel):
+    new_name: str
+    new_ip: Optional[str] = Field(default=None, description="auto_config_ip 时必填")
+
+
+class VMBatchCloneRequest(BaseModel):
+    items: List[VMBatchCloneItem] = Field(..., min_length=1, description="克隆目标列表（名称 + 可选 IP）")
+    target_datastore: Optional[str] = None
+    power_on: bool = False
+    auto_config_ip: bool = Field(default=False, description="克隆后自动修改 IP（需要 Guest 凭据与 VMware Tools）")
+    guest_username: Optional[str] = Field(default="root", description="Guest OS 登录账号")
+    guest_password: Optional[str] = Field(default=None, description="Guest OS 登录密码")
+    netmask: Optional[str] = None
+    gateway: Optional[str] = None
+    dns: Optional[List[str]] = None
+    nic_name: Optional[str] = Field(default="eth0", description="在 Guest 内的网卡名，默认 eth0；若不同需显式指定")
+    disconnect_nic_first: bool = Field(default=True, description="克隆后开机前先断开网卡，避免 IP 冲突")
+
+
 class VMCloneResponse(BaseModel):
     success: bool
     message: str
@@ -143,6 +169,115 @@ class DatastoreStatsResponse(BaseModel):
     total_free_gb: float
 
 
+class InventoryAggregateInfo(BaseModel):
+    host_ip: str = Field(description="宿主机 IP；* 表示全局汇总")
+    vm_total: int = 0
+    vm_powered_on: int = 0
+    vm_powered_off: int = 0
+    vm_suspended: int = 0
+    vcpu_total: int = 0
+    vcpu_running: int = 0
+    memory_mb_total: int = 0
+    memory_mb_running: int = 0
+    memory_usage_mb: int = 0
+    cpu_usage_mhz: int = 0
+    disk_provisioned_gb: float = 0.0
+    disk_used_gb: float = 0.0
+    datastore_count: Optional[int] = None
+    datastore_capacity_gb: float = 0.0
+    datastore_free_gb: float = 0.0
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class InventoryStatsResponse(BaseModel):
+    overall: InventoryAggregateInfo
+    hosts: List[InventoryAggregateInfo]
+
+
+class MetricSeries(BaseModel):
+    metric: str
+    avg: List[Optional[float]] = Field(description="与 timestamps 一一对应，缺失为 null")
+    max: List[Optional[float]]
+
+
+class MetricsResponse(BaseModel):
+    entity_type: str = Field(description="vm / host")
+    entity_id: str
+    resolution: int = Field(description="点间隔（秒）：20 为原始采样，300 / 3600 为降采样汇总")
+    timestamps: List[int] = Field(description="Unix 秒")
+    series: List[MetricSeries]
+
+
+class CapacityHostInfo(BaseModel):
+    host_id: int
+    host_ip: str
+    hostname: Optional[str] = None
+    cpu_cores: Optional[int] = None
+    vcpu_total: int = 0
+    vcpu_running: int = 0
+    vcpu_ratio: Optional[float] = Field(default=None, description="开机 VM vCPU / 物理核数")
+    memory_total_gb: Optional[float] = None
+    memory_allocated_gb: Optional[float] = Field(default=None, description="开机 VM 配置内存合计")
+    memory_overcommit: Optional[float] = None
+    storage_total_gb: Optional[float] = None
+    storage_free_gb: Optional[float] = None
+    disk_provisioned_gb: Optional[float] = None
+    disk_used_gb: Optional[float] = None
+    storage_overcommit: Optional[float] = Field(default=None, description="VM 置备容量 / 数据存储总容量")
+    thin_provision_risk: bool = Field(default=False, description="精简置备磁盘全部写满时将超出可用空间")
+    storage_growth_gb_per_day: Optional[float] = None
+    days_until_full: Optional[float] = Field(default=None, description="按增长趋势预计存储耗尽天数；无增长或样本不足为 null")
+    idle_vm_count: int = 0
+    oversized_vm_count: int = 0
+    reclaimable_vcpu: int = 0
+    reclaimable_memory_gb: Optional[float] = None
+
+
+class CapacityVmInfo(BaseModel):
+    vm_id: str
+    name: Optional[str] = None
+    host_ip: Optional[str] = None
+    cpu_count: int
+    memory_mb: int
+    cpu_usage_pct: Optional[float] = None
+    memory_usage_pct: Optional[float] = None
+    recommended_cpu: int
+    recommended_memory_mb: int
+
+
+class CapacityReportResponse(BaseModel):
+    generated_at: datetime
+    elapsed_ms: int
+    vm_count: int
+    powered_on: int
+    idle_count: int
+    oversized_count: int
+    reclaimable_vcpu: int
+    reclaimable_memory_gb: float
+    hosts: List[CapacityHostInfo]
+    idle_vms: List[CapacityVmInfo]
+    oversized_vms: List[CapacityVmInfo]
+
+
+class HostSyncResult(BaseModel):
+    host_id: int
+    host_ip: Optional[str] = None
+    success: bool
+    skipped: bool = Field(default=False, description="增量监听在线而跳过全量同步")
+    vm_count: int = 0
+    duration_ms: int = 0
+    error: Optional[str] = None
+
+
+class SyncResponse(BaseModel):
+    success: bool = True
+    message: str
+    results: List[HostSyncResult] = []
+
+
 class HostReorderRequest(BaseModel):
     host_ids: List[int] = Field(..., description="ESXi Host ID 列表（数组顺序即最终显示顺序）")
 
@@ -1,7 +1,31 @@
 from .task_service import task_service
 from .virtualization_service import virtualization_service
+from .esxi_session_pool import esxi_session_pool
+from .esxi_executor import esxi_executor
+from .inventory_watcher import inventory_watcher
+from .job_queue import job_queue
+from .task_events import task_events
+from .vm_search import vm_search
+from .inventory_cache import inventory_cache
+from .metrics_store import metrics_store
+from .perf_query import perf_query
+from .metrics_collector import metrics_collector
+from .capacity import capacity_planner
+from .vm_export import vm_exporter
 
 __all__ = [
     "task_service",
     "virtualization_service",
+    "esxi_session_pool",
+    "esxi_executor",
+    "inventory_watcher",
+    "job_queue",
+    "task_events",
+    "vm_search",
+    "inventory_cache",
+    "metrics_store",
+    "perf_query",
+    "metrics_collector",
+    "capacity_planner",
+    "vm_exporter",
 ]
@@ -0,0 +1,241 @@
+"""
+容量规划与规格优化报告：一次查询把 VM / 主机容量字段读成列式 NumPy 数组，全部指标向量化计算。
+- 主机：vCPU / 内存 / 存储超配比，精简置备全部写满时是否超出可用空间，
+  已用存储增长率（指标库 storage_used_gb 的 1 小时汇总上做最小二乘拟合）与预计耗尽天数；
+- VM：空闲（CPU 与内存利用率均低于阈值）与规格过大（按目标利用率推算的建议规格明显小于当前配置）。
+VM 利用率取自清单同步的 quickStats 快照（cpu_usage_mhz / memory_usage_mb），仅统计开机 VM。
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models.virtualization import EsxiHost, VirtualMachine
+from app.services.metrics_store import metrics_store
+
+_VM_COLUMNS = [
+    VirtualMachine.id,
+    VirtualMachine.name,
+    VirtualMachine.host_ip,
+    VirtualMachine.status,
+    VirtualMachine.cpu_count,
+    VirtualMachine.memory_mb,
+    VirtualMachine.cpu_usage_mhz,
+    VirtualMachine.memory_usage_mb,
+    VirtualMachine.disk_provisioned_gb,
+    VirtualMachine.disk_used_gb,
+]
+_NUMERIC = ["cpu_count", "memory_mb", "cpu_usage_mhz", "memory_usage_mb", "disk_provisioned_gb", "disk_used_gb"]
+
+# 建议内存的下限与取整粒度（MB）
+_MIN_MEMORY_MB = 1024
+_MEMORY_STEP_MB = 256
+
+
+def _num(value) -> Optional[float]:
+    value = float(value)
+    return None if not np.isfinite(value) else round(value, 2)
+
+
+class CapacityPlanner:
+    def __init__(
+        self,
+        idle_cpu_pct: float = 5,
+        idle_mem_pct: float = 10,
+        target_cpu_pct: float = 60,
+        target_mem_pct: float = 70,
+        trend_days: float = 14,
+        default_core_mhz: int = 2400,
+    ):
+        self.idle_cpu = idle_cpu_pct / 100
+        self.idle_mem = idle_mem_pct / 100
+        self.target_cpu = target_cpu_pct / 100
+        self.target_mem = target_mem_pct / 100
+        self.trend_days = trend_days
+        # 主机尚未同步到单核主频时的估算值
+        self.default_core_mhz = default_core_mhz
+
+    # ---------- 加载 ----------
+
+    def load_fleet(self, db: Session, host_ip: Optional[str] = None) -> Dict[str, np.ndarray]:
+        """单次查询读出 VM 列并转为数组（数值列 NULL -> NaN）"""
+        stmt = select(*_VM_COLUMNS)
+        if host_ip:
+            stmt = stmt.where(VirtualMachine.host_ip == host_ip)
+        rows = db.execute(stmt).tuples().all()
+        columns = list(zip(*rows)) if rows else [()] * len(_VM_COLUMNS)
+        fleet = {
+            "id": np.array(columns[0], dtype=object),
+            "name": np.array(columns[1], dtype=object),
+            "host_ip": np.array(columns[2], dtype=object),
+            "on": np.array(columns[3], dtype=object) == "poweredOn",
+        }
+        for name, values in zip(_NUMERIC, columns[4:]):
+            fleet[name] = np.array(values, dtype=np.float64)
+        return fleet
+
+    def _storage_growth(self, db: Session, host_ips: List[str]) -> np.ndarray:
+        """各主机已用存储的日增长量（GB/天）；样本不足（少于 3 点或跨度不足 1 天）为 NaN"""
+        now = int(time.time())
+        stamps, used = metrics_store.load_matrix(
+            db, "host", host_ips, "storage_used_gb", now - int(self.trend_days * 86400), now, 3600
+        )
+        if not used.size:
+            return np.full(len(host_ips), np.nan)
+        x = (stamps - stamps[0]) / 86400.0
+        mask = np.isfinite(used)
+        n = mask.sum(axis=1)
+        xs = np.where(mask, x, 0.0)
+        ys = np.where(mask, used, 0.0)
+        sx, sy = xs.sum(axis=1), ys.sum(axis=1)
+        sxx, sxy = (xs * xs).sum(axis=1), (xs * ys).sum(axis=1)
+        denom = n * sxx - sx * sx
+        span = np.where(mask, x, -np.inf).max(axis=1) - np.where(mask, x, np.inf).min(axis=1)
+        ok = (n >= 3) & (span >= 1) & (denom > 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(ok, (n * sxy - sx * sy) / denom, np.nan)
+
+    # ---------- 报告 ----------
+
+    def report(self, db: Session, host_id: Optional[int] = None, top: int = 100) -> Dict[str, Any]:
+        """容量报告；host_id 不存在时抛 ValueError"""
+        started = time.perf_counter()
+        host_query = db.query(
+            EsxiHost.id, EsxiHost.ip, EsxiHost.hostname, EsxiHost.cpu_cores, EsxiHost.cpu_mhz,
+            EsxiHost.memory_total_gb, EsxiHost.storage_total_gb, EsxiHost.storage_free_gb,
+        ).order_by(EsxiHost.sort_order.asc(), EsxiHost.id.asc())
+        if host_id:
+            host_query = host_query.filter(EsxiHost.id == host_id)
+        hosts = host_query.all()
+        if host_id and not hosts:
+            raise ValueError("Host not found")
+        host_ips = [h.ip for h in hosts]
+        fleet = self.load_fleet(db, host_ips[0] if host_id else None)
+
+        count = len(hosts)
+        index = {ip: i for i, ip in enumerate(host_ips)}
+        # 未登记主机的 VM 映射到 -1：per-host 统计时剔除，索引主机属性时落到末尾的默认值
+        codes = np.fromiter((index.get(ip, -1) for ip in fleet["host_ip"]), dtype=np.int64, count=len(fleet["id"]))
+        known = codes >= 0
+
+        def per_host(values: np.ndarray) -> np.ndarray:
+            return np.bincount(codes[known], weights=np.nan_to_num(values[known]), minlength=count)
+
+        def host_col(values) -> np.ndarray:
+            return np.array(values, dtype=np.float64)
+
+        cores = host_col([h.cpu_cores for h in hosts])
+        core_mhz = np.append(np.nan_to_num(host_col([h.cpu_mhz for h in hosts]), nan=0.0), 0.0)
+        core_mhz[core_mhz <= 0] = self.default_core_mhz
+        mem_total_gb = host_col([h.memory_total_gb for h in hosts])
+        storage_total = host_col([h.storage_total_gb for h in hosts])
+        storage_free = host_col([h.storage_free_gb for h in hosts])
+
+        on = fleet["on"]
+        cpu_count, memory_mb = fleet["cpu_count"], fleet["memory_mb"]
+        cpu_mhz_used, memory_used = fleet["cpu_usage_mhz"], fleet["memory_usage_mb"]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cpu_util = cpu_mhz_used / (cpu_count * core_mhz[codes])
+            mem_util = memory_used / memory_mb
+            valid = on & np.isfinite(cpu_util) & np.isfinite(mem_util) & (cpu_count > 0) & (memory_mb > 0)
+            idle = valid & (cpu_util < self.idle_cpu) & (mem_util < self.idle_mem)
+
+            rec_cpu = np.clip(np.ceil(np.nan_to_num(cpu_count * cpu_util / self.target_cpu)), 1, cpu_count)
+            rec_mem = np.ceil(np.nan_to_num(memory_used / self.target_mem) / _MEMORY_STEP_MB) * _MEMORY_STEP_MB
+            rec_mem = np.minimum(np.maximum(rec_mem, _MIN_MEMORY_MB), memory_mb)
+            oversized = valid & ~idle & ((rec_cpu < cpu_count) | (rec_mem <= 0.75 * memory_mb))
+            reclaim_cpu = np.where(oversized, cpu_count - rec_cpu, 0.0)
+            reclaim_mem_gb = np.where(oversized, memory_mb - rec_mem, 0.0) / 1024
+
+            vcpu_total = per_host(cpu_count)
+            vcpu_running = per_host(np.where(on, cpu_count, 0.0))
+            mem_running_gb = per_host(np.where(on, memory_mb, 0.0)) / 1024
+            disk_provisioned = per_host(fleet["disk_provisioned_gb"])
+            disk_used = per_host(fleet["disk_used_gb"])
+            growth = self._storage_growth(db, host_ips) if count else np.empty(0)
+            vcpu_ratio = vcpu_running / cores
+            mem_overcommit = mem_running_gb / mem_total_gb
+            storage_overcommit = disk_provisioned / storage_total
+            # 精简置备磁盘全部写满所需的额外空间超过当前可用空间
+            thin_risk = (disk_provisioned - disk_used) > storage_free
+            days_left = np.where(growth > 0, storage_free / growth, np.nan)
+
+        host_idle = per_host(idle.astype(np.float64))
+        host_oversized = per_host(oversized.astype(np.float64))
+        host_reclaim_cpu = per_host(reclaim_cpu)
+        host_reclaim_mem = per_host(reclaim_mem_gb)
+
+        host_rows = []
+        for i, h in enumerate(hosts):
+            host_rows.append({
+                "host_id": h.id,
+                "host_ip": h.ip,
+                "hostname": h.hostname,
+                "cpu_cores": h.cpu_cores,
+                "vcpu_total": int(vcpu_total[i]),
+                "vcpu_running": int(vcpu_running[i]),
+                "vcpu_ratio": _num(vcpu_ratio[i]),
+                "memory_total_gb": h.memory_total_gb,
+                "memory_allocated_gb": _num(mem_running_gb[i]),
+                "memory_overcommit": _num(mem_overcommit[i]),
+                "storage_total_gb": h.storage_total_gb,
+                "storage_free_gb": h.storage_free_gb,
+                "disk_provisioned_gb": _num(disk_provisioned[i]),
+                "disk_used_gb": _num(disk_used[i]),
+                "storage_overcommit": _num(storage_overcommit[i]),
+                "thin_provision_risk": bool(thin_risk[i]),
+                "storage_growth_gb_per_day": _num(growth[i]),
+                "days_until_full": _num(days_left[i]),
+                "idle_vm_count": int(host_idle[i]),
+                "oversized_vm_count": int(host_oversized[i]),
+                "reclaimable_vcpu": int(host_reclaim_cpu[i]),
+                "reclaimable_memory_gb": _num(host_reclaim_mem[i]),
+            })
+
+        def vm_rows(mask: np.ndarray, key: np.ndarray) -> List[Dict[str, Any]]:
+            picked = np.flatnonzero(mask)
+            picked = picked[np.argsort(-key[picked], kind="stable")][:top]
+            return [
+                {
+                    "vm_id": fleet["id"][i],
+                    "name": fleet["name"][i],
+                    "host_ip": fleet["host_ip"][i],
+                    "cpu_count": int(cpu_count[i]),
+                    "memory_mb": int(memory_mb[i]),
+                    "cpu_usage_pct": _num(cpu_util[i] * 100),
+                    "memory_usage_pct": _num(mem_util[i] * 100),
+                    "recommended_cpu": int(rec_cpu[i]),
+                    "recommended_memory_mb": int(rec_mem[i]),
+                }
+                for i in picked
+            ]
+
+        return {
+            "generated_at": datetime.now(timezone.utc),
+            "vm_count": int(len(fleet["id"])),
+            "powered_on": int(on.sum()),
+            "idle_count": int(idle.sum()),
+            "oversized_count": int(oversized.sum()),
+            "reclaimable_vcpu": int(reclaim_cpu.sum()),
+            "reclaimable_memory_gb": round(float(reclaim_mem_gb.sum()), 2),
+            "hosts": host_rows,
+            # 空闲 VM 按配置内存降序，规格过大 VM 按可回收内存降序
+            "idle_vms": vm_rows(idle, memory_mb),
+            "oversized_vms": vm_rows(oversized, reclaim_mem_gb + reclaim_cpu),
+            "elapsed_ms": int((time.perf_counter() - started) * 1000),
+        }
+
+
+capacity_planner = CapacityPlanner(
+    idle_cpu_pct=float(os.getenv("CAPACITY_IDLE_CPU_PCT", "5")),
+    idle_mem_pct=float(os.getenv("CAPACITY_IDLE_MEM_PCT", "10")),
+    target_cpu_pct=float(os.getenv("CAPACITY_TARGET_CPU_PCT", "60")),
+    target_mem_pct=float(os.getenv("CAPACITY_TARGET_MEM_PCT", "70")),
+    trend_days=float(os.getenv("CAPACITY_TREND_DAYS", "14")),
+    default_core_mhz=int(os.getenv("CAPACITY_DEFAULT_CORE_MHZ", "2400")),
+)
@@ -0,0 +1,72 @@
+"""
+vSphere 阻塞调用专用执行器：每台主机一个独立的线程池与等待队列，
+异步路由通过 await esxi_executor.run(host_ip, fn) 把 pyVmomi 调用移出事件循环，
+慢主机的排队不会占用 Starlette 默认线程池，也不会拖慢其他主机与纯数据库读接口。
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+class HostQueueFull(Exception):
+    """主机队列已满（在途 + 排队请求数超过上限）"""
+
+
+class _HostLane:
+    """单台主机的线程池与在途计数；主机移除后在途调用只会回写到自己领取时的这一份"""
+
+    def __init__(self, key: str, workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"esxi-{key}")
+        self.pending = 0
+
+
+class EsxiExecutor:
+    def __init__(self, workers_per_host: int = 4, queue_limit: int = 100):
+        self.workers_per_host = workers_per_host
+        self.queue_limit = queue_limit
+        self._lock = threading.Lock()
+        self._lanes: Dict[str, _HostLane] = {}
+
+    async def run(self, key: str, fn: Callable, *args, **kwargs):
+        """在 key（主机 IP）专属线程池中执行 fn，并在事件循环中等待结果"""
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = _HostLane(key, self.workers_per_host)
+                self._lanes[key] = lane
+            if lane.pending >= self.queue_limit:
+                raise HostQueueFull(f"{key} 上排队的操作过多（{lane.pending}），请稍后重试")
+            # 与 discard() 互斥提交，避免提交到已关闭的线程池
+            future = lane.executor.submit(fn, *args, **kwargs)
+            lane.pending += 1
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            with self._lock:
+                lane.pending -= 1
+
+    def discard(self, key: str):
+        """主机删除后释放其线程池（在途任务继续执行完）"""
+        with self._lock:
+            lane = self._lanes.pop(key, None)
+        if lane:
+            lane.executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {key: lane.pending for key, lane in self._lanes.items() if lane.pending}
+
+    def shutdown(self):
+        with self._lock:
+            lanes = list(self._lanes.values())
+            self._lanes.clear()
+        for lane in lanes:
+            lane.executor.shutdown(wait=False, cancel_futures=True)
+
+
+esxi_executor = EsxiExecutor(
+    workers_per_host=int(os.getenv("ESXI_HOST_WORKERS", "4")),
+    queue_limit=int(os.getenv("ESXI_HOST_QUEUE_LIMIT", "100")),
+)
@@ -0,0 +1,239 @@
+"""
+基于 PropertyCollector 的批量清单采集：一次 RetrievePropertiesEx（分页）取回所有 VM/主机/存储属性，
+再由纯函数把扁平属性字典转换为 ORM 字段，避免逐个对象懒加载产生的大量 SOAP 往返。
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from pyVmomi import vim, vmodl
+
+GB = 1024 ** 3
+
+VM_PROPERTIES: List[str] = [
+    "summary.config.uuid",
+    "summary.config.name",
+    "summary.config.numCpu",
+    "summary.config.memorySizeMB",
+    "summary.config.annotation",
+    "summary.config.guestFullName",
+    "summary.config.vmPathName",
+    "summary.runtime.powerState",
+    "summary.guest.ipAddress",
+    "summary.guest.guestFullName",
+    "summary.guest.toolsStatus",
+    "summary.quickStats.overallCpuUsage",
+    "summary.quickStats.guestMemoryUsage",
+    "summary.quickStats.uptimeSeconds",
+    "summary.storage.committed",
+    "summary.storage.uncommitted",
+]
+
+HOST_PROPERTIES: List[str] = [
+    "name",
+    "summary.hardware.numCpuCores",
+    "summary.hardware.cpuMhz",
+    "summary.hardware.memorySize",
+    "summary.hardware.model",
+    "summary.quickStats.overallCpuUsage",
+    "summary.quickStats.overallMemoryUsage",
+    "summary.config.product.fullName",
+]
+
+DATASTORE_PROPERTIES: List[str] = [
+    "summary.url",
+    "summary.name",
+    "summary.type",
+    "summary.capacity",
+    "summary.freeSpace",
+]
+
+INVENTORY_SPECS: Dict[type, List[str]] = {
+    vim.VirtualMachine: VM_PROPERTIES,
+    vim.HostSystem: HOST_PROPERTIES,
+    vim.Datastore: DATASTORE_PROPERTIES,
+}
+
+# build_*_fields 产出的可比对列（不含主键与 last_sync），用于增量写入判断
+VM_COLUMNS: List[str] = [
+    "uuid", "moref", "name", "host_ip", "status", "ip_address", "os_name", "description",
+    "cpu_count", "memory_mb", "cpu_usage_mhz", "memory_usage_mb", "uptime_seconds",
+    "disk_used_gb", "disk_provisioned_gb", "tools_status", "datastore", "vmx_path",
+]
+
+DATASTORE_COLUMNS: List[str] = ["name", "type", "capacity_gb", "free_gb"]
+
+VM_STATUS_MAP = {
+    "poweredOn": "poweredOn",
+    "poweredOff": "poweredOff",
+    "suspended": "suspended",
+}
+
+
+def build_filter_spec(view, specs: Dict[type, List[str]]):
+    """构造遍历 ContainerView 的 FilterSpec；批量拉取与增量监听共用"""
+    traversal = vim.PropertyCollector.TraversalSpec(
+        name="traverseEntities",
+        path="view",
+        skip=False,
+        type=vim.view.ContainerView,
+    )
+    obj_spec = vim.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+    prop_specs = [
+        vim.PropertyCollector.PropertySpec(type=obj_type, pathSet=paths, all=False)
+        for obj_type, paths in specs.items()
+    ]
+    return vim.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=prop_specs)
+
+
+def _object_to_dict(obj_content) -> Dict[str, Any]:
+    props: Dict[str, Any] = {"obj": obj_content.obj, "moref": obj_content.obj._GetMoId()}
+    for prop in obj_content.propSet or []:
+        props[prop.name] = prop.val
+    return props
+
+
+def retrieve_inventory(
+    content,
+    specs: Optional[Dict[type, List[str]]] = None,
+    page_size: int = 1000,
+) -> Dict[type, List[Dict[str, Any]]]:
+    """通过 ContainerView + TraversalSpec 一次性分页拉取多种对象的指定属性"""
+    specs = specs or INVENTORY_SPECS
+    result: Dict[type, List[Dict[str, Any]]] = {obj_type: [] for obj_type in specs}
+    view = content.viewManager.CreateContainerView(content.rootFolder, list(specs.keys()), True)
+    try:
+        collector = content.propertyCollector
+        filter_spec = build_filter_spec(view, specs)
+        options = vim.PropertyCollector.RetrieveOptions(maxObjects=page_size)
+        page = collector.RetrievePropertiesEx(specSet=[filter_spec], options=options)
+        while page:
+            for obj_content in page.objects or []:
+                props = _object_to_dict(obj_content)
+                for obj_type in result:
+                    if isinstance(obj_content.obj, obj_type):
+                        result[obj_type].append(props)
+                        break
+            if not page.token:
+                break
+            page = collector.ContinueRetrievePropertiesEx(token=page.token)
+    finally:
+        view.Destroy()
+    return result
+
+
+def retrieve_object(content, obj, paths: List[str]) -> Optional[Dict[str, Any]]:
+    """只拉取单个对象的指定属性（一次 RetrievePropertiesEx）；对象已不存在时返回 None"""
+    obj_spec = vim.PropertyCollector.ObjectSpec(obj=obj, skip=False)
+    prop_spec = vim.PropertyCollector.PropertySpec(type=type(obj), pathSet=paths, all=False)
+    filter_spec = vim.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=[prop_spec])
+    try:
+        page = content.propertyCollector.RetrievePropertiesEx(
+            specSet=[filter_spec], options=vim.PropertyCollector.RetrieveOptions()
+        )
+    except vmodl.fault.ManagedObjectNotFound:
+        return None
+    if not page or not page.objects:
+        return None
+    return _object_to_dict(page.objects[0])
+
+
+def _to_gb(value: Optional[int]) -> Optional[float]:
+    return round(value / GB, 2) if value else None
+
+
+def build_vm_fields(host_ip: str, props: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """把 VM 扁平属性转换为 VirtualMachine 字段。
+    缺少 uuid（孤立 / 无效 / 注册中的 VM）时以 moref 作为 ID 保留在清单中，uuid 就绪后 ID 随之变化，
+    旧行由全量同步或增量监听按 moref 清理；连 moref 都没有时返回 None"""
+    uuid = props.get("summary.config.uuid")
+    moref = props.get("moref")
+    if uuid:
+        vm_id = f"{host_ip}-{uuid}"
+    elif moref:
+        vm_id = f"{host_ip}-moref-{moref}"
+    else:
+        return None
+
+    committed = props.get("summary.storage.committed")
+    uncommitted = props.get("summary.storage.uncommitted")
+    if committed is not None and uncommitted is not None:
+        disk_provisioned_gb = round((committed + uncommitted) / GB, 2)
+    else:
+        disk_provisioned_gb = None
+
+    vmx_path = props.get("summary.config.vmPathName")
+    datastore = None
+    if vmx_path and vmx_path.startswith("[") and "]" in vmx_path:
+        datastore = vmx_path[1 : vmx_path.find("]")]
+
+    return {
+        "id": vm_id,
+        "uuid": uuid,
+        "moref": moref,
+        "name": props.get("summary.config.name"),
+        "host_ip": host_ip,
+        "status": VM_STATUS_MAP.get(props.get("summary.runtime.powerState"), "unknown"),
+        "ip_address": props.get("summary.guest.ipAddress"),
+        "os_name": props.get("summary.guest.guestFullName") or props.get("summary.config.guestFullName"),
+        "description": props.get("summary.config.annotation"),
+        "cpu_count": props.get("summary.config.numCpu"),
+        "memory_mb": props.get("summary.config.memorySizeMB"),
+        "cpu_usage_mhz": props.get("summary.quickStats.overallCpuUsage"),
+        "memory_usage_mb": props.get("summary.quickStats.guestMemoryUsage"),
+        "uptime_seconds": props.get("summary.quickStats.uptimeSeconds"),
+        "disk_used_gb": _to_gb(committed),
+        "disk_provisioned_gb": disk_provisioned_gb,
+        "tools_status": props.get("summary.guest.toolsStatus"),
+        "datastore": datastore,
+        "vmx_path": vmx_path,
+    }
+
+
+def build_host_fields(props: Dict[str, Any]) -> Dict[str, Any]:
+    """把 HostSystem 扁平属性转换为 EsxiHost 资源字段"""
+    cores = props.get("summary.hardware.numCpuCores") or 0
+    total_cpu_mhz = (props.get("summary.hardware.cpuMhz") or 0) * cores
+    used_cpu_mhz = props.get("summary.quickStats.overallCpuUsage") or 0
+    mem_total_bytes = props.get("summary.hardware.memorySize") or 0
+    mem_used_bytes = (props.get("summary.quickStats.overallMemoryUsage") or 0) * 1024 * 1024
+
+    fields = {
+        "hostname": props.get("name"),
+        "model": props.get("summary.hardware.model"),
+        "cpu_cores": props.get("summary.hardware.numCpuCores"),
+        "cpu_mhz": props.get("summary.hardware.cpuMhz"),
+        "cpu_usage": round(used_cpu_mhz / total_cpu_mhz * 100, 2) if total_cpu_mhz > 0 else 0,
+        "memory_usage": round(mem_used_bytes / mem_total_bytes * 100, 2) if mem_total_bytes > 0 else 0,
+        "memory_total_gb": _to_gb(mem_total_bytes),
+    }
+    version = props.get("summary.config.product.fullName")
+    if version:
+        fields["version"] = version
+    return fields
+
+
+def build_datastore_fields(props: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """把 Datastore 扁平属性转换为 Datastore 字段；缺少 url 时返回 None"""
+    url = props.get("summary.url")
+    if not url:
+        return None
+    return {
+        "id": url,
+        "name": props.get("summary.name"),
+        "type": props.get("summary.type"),
+        "capacity_gb": round((props.get("summary.capacity") or 0) / GB, 2),
+        "free_gb": round((props.get("summary.freeSpace") or 0) / GB, 2),
+    }
+
+
+def build_host_storage_fields(datastores: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总主机可见存储容量；无容量数据时返回空字典，保持原值"""
+    total_cap = sum(props.get("summary.capacity") or 0 for props in datastores)
+    total_free = sum(props.get("summary.freeSpace") or 0 for props in datastores)
+    if not total_cap:
+        return {}
+    return {
+        "storage_total_gb": round(total_cap / GB, 2),
+        "storage_free_gb": round(total_free / GB, 2),
+    }
@@ -0,0 +1,296 @@
+"""
+ESXi 会话池：按 (ip, port, user) 复用已登录的 ServiceInstance，避免每次操作都执行 SmartConnect 登录。
+"""
+import http.client
+import os
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from pyVim.connect import SmartConnect, Disconnect
+from pyVmomi import vim
+
+from app.services.task_waiter import TaskWaiter
+
+SessionKey = Tuple[str, int, str]
+
+
+class EsxiConnectionError(Exception):
+    """无法建立 ESXi 会话（网络不可达/认证失败/池已满等待超时）"""
+
+
+class _PooledSession:
+    def __init__(self, key: SessionKey, pwd: str, si):
+        self.key = key
+        self.pwd = pwd
+        self.si = si
+        self.content = si.RetrieveContent()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.last_checked = self.created_at
+        self.waiter: Optional[TaskWaiter] = None
+        self.pinned = False
+
+
+class EsxiSessionPool:
+    def __init__(
+        self,
+        max_sessions: int = 32,
+        max_per_host: int = 10,
+        idle_ttl: int = 600,
+        health_check_interval: int = 60,
+        acquire_timeout: int = 60,
+    ):
+        self.max_sessions = max_sessions
+        self.max_per_host = max_per_host
+        self.idle_ttl = idle_ttl
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.ssl_context = ssl._create_unverified_context()
+        self._lock = threading.Condition()
+        self._idle: Dict[SessionKey, List[_PooledSession]] = {}
+        self._in_use: Dict[int, _PooledSession] = {}
+        self._counts: Dict[SessionKey, int] = {}
+        # 常驻会话（如增量监听）数，不计入 max_per_host，避免长期占住普通操作的名额
+        self._pinned: Dict[SessionKey, int] = {}
+
+    # ---------- 内部工具 ----------
+
+    def _total(self) -> int:
+        return sum(self._counts.values())
+
+    def _connect(self, key: SessionKey, pwd: str) -> _PooledSession:
+        ip, port, user = key
+        print(f"[Pool] Connecting to {ip} port {port} user {user}")
+        try:
+            si = SmartConnect(host=ip, user=user, pwd=pwd, port=port, sslContext=self.ssl_context)
+            entry = _PooledSession(key, pwd, si)
+        except Exception as e:
+            print(f"[Pool] Failed to connect to {ip}: {e}")
+            raise EsxiConnectionError(f"连接 {ip} 失败: {e}")
+        print(f"[Pool] Connected to {ip}")
+        return entry
+
+    def _disconnect(self, entry: _PooledSession):
+        if entry.waiter is not None:
+            entry.waiter.close()
+        try:
+            Disconnect(entry.si)
+        except Exception as e:
+            print(f"[Pool] Disconnect {entry.key[0]} warning: {e}")
+
+    def _is_alive(self, entry: _PooledSession) -> bool:
+        """会话健康检查：currentSession 为空或抛 NotAuthenticated 说明会话已过期"""
+        try:
+            return entry.content.sessionManager.currentSession is not None
+        except vim.fault.NotAuthenticated:
+            return False
+        except Exception as e:
+            print(f"[Pool] Health check {entry.key[0]} failed: {e}")
+            return False
+
+    def _unpin(self, key: SessionKey):
+        """调用方需持有锁：释放常驻会话登记，会话本身（若保留）转为普通会话"""
+        left = self._pinned.get(key, 1) - 1
+        if left > 0:
+            self._pinned[key] = left
+        else:
+            self._pinned.pop(key, None)
+
+    def _forget(self, key: SessionKey):
+        """调用方需持有锁：释放名额计数"""
+        left = self._counts.get(key, 1) - 1
+        if left > 0:
+            self._counts[key] = left
+        else:
+            self._counts.pop(key, None)
+        self._lock.notify_all()
+
+    def _collect_expired(self, now: float) -> List[_PooledSession]:
+        """调用方需持有锁：摘除超过 idle_ttl 的空闲会话"""
+        expired = []
+        for key in list(self._idle.keys()):
+            keep = []
+            for entry in self._idle[key]:
+                if now - entry.last_used > self.idle_ttl:
+                    expired.append(entry)
+                    self._forget(entry.key)
+                else:
+                    keep.append(entry)
+            if keep:
+                self._idle[key] = keep
+            else:
+                self._idle.pop(key, None)
+        return expired
+
+    def _steal_idle_slot(self) -> Optional[_PooledSession]:
+        """调用方需持有锁：全局名额耗尽时，淘汰最久未使用的其他主机空闲会话"""
+        oldest = None
+        for entries in self._idle.values():
+            for entry in entries:
+                if oldest is None or entry.last_used < oldest.last_used:
+                    oldest = entry
+        if oldest is None:
+            return None
+        self._idle[oldest.key].remove(oldest)
+        if not self._idle[oldest.key]:
+            self._idle.pop(oldest.key, None)
+        self._forget(oldest.key)
+        return oldest
+
+    # ---------- 对外接口 ----------
+
+    def acquire(self, ip: str, user: str, pwd: str, port: int = 443, pinned: bool = False):
+        """pinned=True 用于长期持有的会话：占用全局名额，但不占单主机名额"""
+        key: SessionKey = (ip, int(port or 443), user)
+        deadline = time.time() + self.acquire_timeout
+        stale: List[_PooledSession] = []
+        reuse: Optional[_PooledSession] = None
+
+        with self._lock:
+            while True:
+                stale.extend(self._collect_expired(time.time()))
+                idle = self._idle.get(key) or []
+                # 密码变更后旧会话不再可信，全部淘汰
+                for entry in [e for e in idle if e.pwd != pwd]:
+                    idle.remove(entry)
+                    self._forget(entry.key)
+                    stale.append(entry)
+                if idle:
+                    reuse = idle.pop()
+                    if not idle:
+                        self._idle.pop(key, None)
+                    break
+                if pinned or self._counts.get(key, 0) - self._pinned.get(key, 0) < self.max_per_host:
+                    if self._total() >= self.max_sessions:
+                        victim = self._steal_idle_slot()
+                        if victim:
+                            stale.append(victim)
+                    if self._total() < self.max_sessions:
+                        # 先占名额，再在锁外登录
+                        self._counts[key] = self._counts.get(key, 0) + 1
+                        break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise EsxiConnectionError(f"等待 {ip} 的 ESXi 会话超时（会话池已满）")
+                self._lock.wait(remaining)
+            if pinned:
+                # 名额确定时立即登记，登录期间不挤占普通会话的单主机名额
+                self._pinned[key] = self._pinned.get(key, 0) + 1
+
+        for entry in stale:
+            self._disconnect(entry)
+
+        entry = reuse
+        if entry and time.time() - entry.last_checked > self.health_check_interval:
+            if self._is_alive(entry):
+                entry.last_checked = time.time()
+            else:
+                # 会话过期（NotAuthenticated），沿用名额重新登录
+                print(f"[Pool] Session expired for {ip}, re-authenticating")
+                self._disconnect(entry)
+                entry = None
+
+        if entry is None:
+            try:
+                entry = self._connect(key, pwd)
+            except Exception:
+                with self._lock:
+                    if pinned:
+                        self._unpin(key)
+                    self._forget(key)
+                raise
+
+        entry.last_used = time.time()
+        entry.pinned = pinned
+        with self._lock:
+            self._in_use[id(entry.si)] = entry
+        return entry.si
+
+    def release(self, si, discard: bool = False):
+        with self._lock:
+            entry = self._in_use.pop(id(si), None)
+            if entry is None:
+                return
+            if entry.pinned:
+                entry.pinned = False
+                self._unpin(entry.key)
+            if discard:
+                self._forget(entry.key)
+            else:
+                entry.last_used = time.time()
+                self._idle.setdefault(entry.key, []).append(entry)
+                self._lock.notify_all()
+        if discard:
+            self._disconnect(entry)
+
+    @contextmanager
+    def session(self, ip: str, user: str, pwd: str, port: int = 443, pinned: bool = False):
+        """借出会话；块内出现 NotAuthenticated/连接异常时丢弃该会话，下次借出将重新登录"""
+        si = self.acquire(ip, user, pwd, port, pinned=pinned)
+        discard = False
+        try:
+            yield si
+        except (vim.fault.NotAuthenticated, OSError, http.client.HTTPException):
+            discard = True
+            raise
+        finally:
+            self.release(si, discard=discard)
+
+    def task_waiter(self, mo) -> Optional[TaskWaiter]:
+        """返回托管对象所属（已借出）会话的任务等待器，不属于池内会话时返回 None"""
+        stub = getattr(mo, "_stub", None)
+        with self._lock:
+            entry = next((e for e in self._in_use.values() if e.si._stub is stub), None)
+        if entry is None:
+            return None
+        if entry.waiter is None:
+            entry.waiter = TaskWaiter(entry.si)
+        return entry.waiter
+
+    def invalidate(self, ip: str):
+        """主机凭据变更/删除时淘汰该主机全部空闲会话"""
+        with self._lock:
+            stale = []
+            for key in [k for k in self._idle if k[0] == ip]:
+                for entry in self._idle.pop(key):
+                    self._forget(entry.key)
+                    stale.append(entry)
+        for entry in stale:
+            self._disconnect(entry)
+
+    def evict_idle(self):
+        with self._lock:
+            stale = self._collect_expired(time.time())
+        for entry in stale:
+            self._disconnect(entry)
+
+    def close_all(self):
+        with self._lock:
+            stale = [entry for entries in self._idle.values() for entry in entries]
+            for entry in stale:
+                self._forget(entry.key)
+            self._idle.clear()
+        for entry in stale:
+            self._disconnect(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": self._total(),
+                "in_use": len(self._in_use),
+                "idle": sum(len(v) for v in self._idle.values()),
+                "pinned": sum(self._pinned.values()),
+                "hosts": len(self._counts),
+            }
+
+
+esxi_session_pool = EsxiSessionPool(
+    max_sessions=int(os.getenv("ESXI_POOL_MAX_SESSIONS", "32")),
+    max_per_host=int(os.getenv("ESXI_POOL_MAX_PER_HOST", "10")),
+    idle_ttl=int(os.getenv("ESXI_POOL_IDLE_TTL", "600")),
+    health_check_interval=int(os.getenv("ESXI_POOL_HEALTH_CHECK_INTERVAL", "60")),
+    acquire_timeout=int(os.getenv("ESXI_POOL_ACQUIRE_TIMEOUT", "60")),
+)
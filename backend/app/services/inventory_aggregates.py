@@ -0,0 +1,204 @@
+"""
+清单预聚合：每台主机一行（VM 电源状态计数、vCPU / 内存 / 磁盘合计、数据存储容量）加一行全局汇总（host_ip="*"），
+全量同步、监听首个快照与删除主机在各自的事务内调用 refresh_aggregates 按主机重算；
+增量监听与定向刷新只改动少量 VM，调用 apply_vm_changes 按新旧行差值原地累加，不再扫描主机全部 VM。
+仪表盘类读取（主机列表计数、/datastores/stats）只需按主机数读取少量行，不再扫描全部 VM。
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from app.db.upsert import bulk_upsert
+from app.models.virtualization import Datastore, EsxiHost, InventoryAggregate, VirtualMachine
+
+GLOBAL_KEY = "*"
+
+# 由 VM 行汇总的字段（顺序与 _vm_sums 的查询列一致）
+_VM_FIELDS = [
+    "vm_total", "vm_powered_on", "vm_powered_off", "vm_suspended",
+    "vcpu_total", "vcpu_running", "memory_mb_total", "memory_mb_running",
+    "memory_usage_mb", "cpu_usage_mhz", "disk_provisioned_gb", "disk_used_gb",
+]
+_SUM_FIELDS = _VM_FIELDS + ["datastore_capacity_gb", "datastore_free_gb"]
+
+
+def _empty_row(host_ip: str) -> Dict:
+    row = {name: 0 for name in _SUM_FIELDS}
+    row.update(host_ip=host_ip, datastore_count=None)
+    return row
+
+
+def _vm_sums(db: Session, host_ips: Optional[List[str]]) -> Dict[str, Dict]:
+    on = VirtualMachine.status == "poweredOn"
+    query = db.query(
+        VirtualMachine.host_ip,
+        func.count(VirtualMachine.id),
+        func.sum(case((on, 1), else_=0)),
+        func.sum(case((VirtualMachine.status == "poweredOff", 1), else_=0)),
+        func.sum(case((VirtualMachine.status == "suspended", 1), else_=0)),
+        func.sum(VirtualMachine.cpu_count),
+        func.sum(case((on, VirtualMachine.cpu_count), else_=0)),
+        func.sum(VirtualMachine.memory_mb),
+        func.sum(case((on, VirtualMachine.memory_mb), else_=0)),
+        func.sum(VirtualMachine.memory_usage_mb),
+        func.sum(VirtualMachine.cpu_usage_mhz),
+        func.sum(VirtualMachine.disk_provisioned_gb),
+        func.sum(VirtualMachine.disk_used_gb),
+    )
+    if host_ips is not None:
+        query = query.filter(VirtualMachine.host_ip.in_(host_ips))
+    result = {}
+    for row in query.group_by(VirtualMachine.host_ip).all():
+        values = [v or 0 for v in row[1:]]
+        result[row[0]] = dict(zip(_VM_FIELDS, values))
+    return result
+
+
+def _vm_contribution(row: Dict[str, Any]) -> List[float]:
+    """单个 VM 行对 _VM_FIELDS 各字段的贡献（与 _vm_sums 的统计口径一致）"""
+    status = row.get("status")
+    on = status == "poweredOn"
+    cpu = row.get("cpu_count") or 0
+    memory = row.get("memory_mb") or 0
+    return [
+        1, int(on), int(status == "poweredOff"), int(status == "suspended"),
+        cpu, cpu if on else 0, memory, memory if on else 0,
+        row.get("memory_usage_mb") or 0, row.get("cpu_usage_mhz") or 0,
+        row.get("disk_provisioned_gb") or 0, row.get("disk_used_gb") or 0,
+    ]
+
+
+def apply_vm_changes(db: Session, changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+    """增量更新：changes 为 (旧行, 新行)，新增 VM 旧行为 None、删除 VM 新行为 None；
+    按差值原地累加到所属主机行与全局行。主机行尚不存在时退回该主机的全量重算。不提交"""
+    deltas: Dict[str, List[float]] = {}
+    for old, new in changes:
+        for row, sign in ((old, -1), (new, 1)):
+            if not row or not row.get("host_ip"):
+                continue
+            delta = deltas.setdefault(row["host_ip"], [0] * len(_VM_FIELDS))
+            for i, value in enumerate(_vm_contribution(row)):
+                delta[i] += sign * value
+    deltas = {ip: delta for ip, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    now = datetime.now(timezone.utc)
+    total = [0] * len(_VM_FIELDS)
+    missing = []
+    for ip, delta in deltas.items():
+        if _add(db, ip, delta, now):
+            total = [a + b for a, b in zip(total, delta)]
+        else:
+            missing.append(ip)
+    if missing:
+        # 全量重算会顺带按主机行重算全局行（已包含上面累加的差值）
+        refresh_aggregates(db, missing)
+    else:
+        _add(db, GLOBAL_KEY, total, now)
+
+
+def _add(db: Session, host_ip: str, delta: List[float], now: datetime) -> bool:
+    """聚合行各字段加上 delta；行不存在返回 False"""
+    values = {name: getattr(InventoryAggregate, name) + value for name, value in zip(_VM_FIELDS, delta) if value}
+    result = db.execute(
+        update(InventoryAggregate)
+        .where(InventoryAggregate.host_ip == host_ip)
+        .values(updated_at=now, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return bool(result.rowcount)
+
+
+def refresh_storage_aggregates(db: Session, host_ips: Iterable[str]):
+    """只刷新主机行与全局行的数据存储容量字段（宿主机资源 / 数据存储变化后调用）；不提交"""
+    db.flush()
+    now = datetime.now(timezone.utc)
+    ips = list(dict.fromkeys(host_ips))
+    for ip, storage_total, storage_free in db.query(
+        EsxiHost.ip, EsxiHost.storage_total_gb, EsxiHost.storage_free_gb
+    ).filter(EsxiHost.ip.in_(ips)).all():
+        db.execute(
+            update(InventoryAggregate)
+            .where(InventoryAggregate.host_ip == ip)
+            .values(datastore_capacity_gb=storage_total or 0, datastore_free_gb=storage_free or 0, updated_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    ds_count, ds_capacity, ds_free = db.query(
+        func.count(Datastore.id), func.sum(Datastore.capacity_gb), func.sum(Datastore.free_gb)
+    ).one()
+    db.execute(
+        update(InventoryAggregate)
+        .where(InventoryAggregate.host_ip == GLOBAL_KEY)
+        .values(
+            datastore_count=ds_count or 0,
+            datastore_capacity_gb=ds_capacity or 0,
+            datastore_free_gb=ds_free or 0,
+            updated_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def refresh_aggregates(db: Session, host_ips: Optional[Iterable[str]] = None):
+    """重算指定主机（None 表示全部）的聚合行与全局行；不提交，由调用方随同步事务一起提交"""
+    # SessionLocal 关闭了 autoflush：先把本事务中待写的主机资源字段刷到数据库
+    db.flush()
+    ips = None if host_ips is None else list(dict.fromkeys(host_ips))
+    now = datetime.now(timezone.utc)
+
+    host_query = db.query(EsxiHost.ip, EsxiHost.storage_total_gb, EsxiHost.storage_free_gb)
+    if ips is not None:
+        host_query = host_query.filter(EsxiHost.ip.in_(ips))
+    hosts = {ip: (total, free) for ip, total, free in host_query.all()}
+    sums = _vm_sums(db, list(hosts.keys()) if ips is not None else None)
+
+    rows = []
+    for ip, (storage_total, storage_free) in hosts.items():
+        row = _empty_row(ip)
+        row.update(sums.get(ip, {}))
+        row.update(datastore_capacity_gb=storage_total or 0, datastore_free_gb=storage_free or 0, updated_at=now)
+        rows.append(row)
+    bulk_upsert(db, InventoryAggregate, rows)
+
+    # 已删除主机的聚合行
+    if ips is None:
+        stale = InventoryAggregate.host_ip.notin_([*hosts.keys(), GLOBAL_KEY])
+    else:
+        gone = [ip for ip in ips if ip not in hosts]
+        stale = InventoryAggregate.host_ip.in_(gone) if gone else None
+    if stale is not None:
+        db.query(InventoryAggregate).filter(stale).delete(synchronize_session=False)
+
+    _refresh_global(db, now)
+
+
+def _refresh_global(db: Session, now: datetime):
+    """全局行 = 各主机行求和（O(主机数)）+ 数据存储表合计（共享存储只计一次）"""
+    row = _empty_row(GLOBAL_KEY)
+    totals = db.query(*[func.sum(getattr(InventoryAggregate, name)) for name in _VM_FIELDS]).filter(
+        InventoryAggregate.host_ip != GLOBAL_KEY
+    ).one()
+    row.update({name: value or 0 for name, value in zip(_VM_FIELDS, totals)})
+    ds_count, ds_capacity, ds_free = db.query(
+        func.count(Datastore.id), func.sum(Datastore.capacity_gb), func.sum(Datastore.free_gb)
+    ).one()
+    row.update(
+        datastore_count=ds_count or 0,
+        datastore_capacity_gb=ds_capacity or 0,
+        datastore_free_gb=ds_free or 0,
+        updated_at=now,
+    )
+    bulk_upsert(db, InventoryAggregate, [row])
+
+
+def load_aggregates(db: Session) -> Dict[str, InventoryAggregate]:
+    """读取全部聚合行（host_ip -> 行）；缺少全局行（升级后首次）时先全量重算并提交"""
+    rows = {row.host_ip: row for row in db.query(InventoryAggregate).all()}
+    if GLOBAL_KEY not in rows:
+        refresh_aggregates(db)
+        db.commit()
+        rows = {row.host_ip: row for row in db.query(InventoryAggregate).all()}
+    return rows
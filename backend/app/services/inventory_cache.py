@@ -0,0 +1,152 @@
+"""
+清单读缓存：主机列表（含各主机 VM 总数 / 运行数）与 host id <-> ip 映射按版本号缓存在内存中，
+并为 GET /hosts、GET /vms 提供 ETag，内容未变的轮询直接返回 304、不访问数据库。
+
+失效方式：
+- 进程内：会话提交时若写过 virtual_machines / esxi_hosts / datastores（ORM flush 或 Core DML），
+  提交完成后自动递增版本，同步、增量监听、定向刷新与各 API 写路径无需单独调用；
+- 跨进程（独立 worker.py 的写入）：每 ttl 秒用一次廉价的聚合指纹（行数 + 最近同步时间）核对，变化则递增版本。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from itertools import chain
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models.virtualization import Datastore, EsxiHost, VirtualMachine
+from app.schemas.virtualization import EsxiHostResponse
+from app.services.inventory_aggregates import load_aggregates
+
+_TABLES = {"virtual_machines", "esxi_hosts", "datastores", "inventory_aggregates"}
+_DIRTY_KEY = "inventory_dirty"
+
+
+class InventoryCache:
+    def __init__(self, ttl: float = 10):
+        self.ttl = ttl
+        # 进程级前缀：重启或多进程时 ETag 不会误命中
+        self._epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._version = 0
+        self._checked_at = 0.0
+        self._fingerprint: Optional[tuple] = None
+        self._hosts: Optional[Dict[str, Any]] = None
+
+    # ---------- 失效 ----------
+
+    def install(self, session_factory):
+        """在会话工厂上挂载事件：提交了清单表写入的会话在提交完成后使缓存失效"""
+
+        @event.listens_for(session_factory, "after_flush")
+        def _after_flush(session, _ctx):
+            for obj in chain(session.new, session.dirty, session.deleted):
+                if getattr(obj, "__tablename__", None) in _TABLES:
+                    session.info[_DIRTY_KEY] = True
+                    return
+
+        @event.listens_for(session_factory, "do_orm_execute")
+        def _on_execute(state):
+            if state.is_select:
+                return
+            table = getattr(state.statement, "table", None)
+            if getattr(table, "name", None) in _TABLES:
+                state.session.info[_DIRTY_KEY] = True
+
+        @event.listens_for(session_factory, "after_commit")
+        def _after_commit(session):
+            if session.info.pop(_DIRTY_KEY, False):
+                self.invalidate()
+
+        @event.listens_for(session_factory, "after_rollback")
+        def _after_rollback(session):
+            session.info.pop(_DIRTY_KEY, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._hosts = None
+
+    def _current_fingerprint(self, db: Session) -> tuple:
+        vm_count, vm_synced = db.query(func.count(VirtualMachine.id), func.max(VirtualMachine.last_sync)).one()
+        host_count, host_updated = db.query(func.count(EsxiHost.id), func.max(EsxiHost.updated_at)).one()
+        ds_synced = db.query(func.max(Datastore.last_sync)).scalar()
+        return (vm_count, str(vm_synced), host_count, str(host_updated), str(ds_synced))
+
+    def version(self, session_factory: Callable[[], Session]) -> int:
+        """当前版本；距上次核对超过 ttl 时查询一次指纹，其余情况不访问数据库"""
+        now = time.monotonic()
+        if now - self._checked_at < self.ttl:
+            return self._version
+        db = session_factory()
+        try:
+            fingerprint = self._current_fingerprint(db)
+        finally:
+            db.close()
+        with self._lock:
+            if self._fingerprint is not None and fingerprint != self._fingerprint:
+                self._version += 1
+                self._hosts = None
+            self._fingerprint = fingerprint
+            self._checked_at = now
+            return self._version
+
+    # ---------- ETag ----------
+
+    def etag(self, session_factory: Callable[[], Session], scope: str, params: Optional[Dict[str, Any]] = None) -> str:
+        version = self.version(session_factory)
+        digest = ""
+        if params:
+            raw = json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+            digest = "-" + hashlib.sha1(raw).hexdigest()[:12]
+        return f'W/"{scope}-{self._epoch}-{version}{digest}"'
+
+    # ---------- 主机快照 ----------
+
+    def hosts(self, session_factory: Callable[[], Session]) -> Dict[str, Any]:
+        """{"version", "items": [EsxiHostResponse dict], "ip_by_id", "id_by_ip"}"""
+        version = self.version(session_factory)
+        snapshot = self._hosts
+        if snapshot is not None and snapshot["version"] == version:
+            return snapshot
+        db = session_factory()
+        try:
+            snapshot = self._build_hosts(db, version)
+        finally:
+            db.close()
+        with self._lock:
+            # 构建期间若已失效则不缓存，下次重新构建
+            if self._version == version:
+                self._hosts = snapshot
+        return snapshot
+
+    def _build_hosts(self, db: Session, version: int) -> Dict[str, Any]:
+        hosts = db.query(EsxiHost).order_by(EsxiHost.sort_order.asc(), EsxiHost.id.asc()).all()
+        # VM 计数来自预聚合表，读取量与主机数成正比
+        aggregates = load_aggregates(db)
+
+        items: List[Dict[str, Any]] = []
+        for h in hosts:
+            agg = aggregates.get(h.ip)
+            h.vm_count = agg.vm_total if agg else 0
+            h.vms_running = agg.vm_powered_on if agg else 0
+            items.append(EsxiHostResponse.model_validate(h).model_dump())
+        return {
+            "version": version,
+            "items": items,
+            "ip_by_id": {h.id: h.ip for h in hosts},
+            "id_by_ip": {h.ip: h.id for h in hosts},
+        }
+
+    def host_ip(self, session_factory: Callable[[], Session], host_id: int) -> Optional[str]:
+        return self.hosts(session_factory)["ip_by_id"].get(host_id)
+
+
+inventory_cache = InventoryCache(ttl=float(os.getenv("INVENTORY_CACHE_TTL", "10")))
+inventory_cache.install(SessionLocal)
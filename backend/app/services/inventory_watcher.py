@@ -0,0 +1,354 @@
+"""
+增量清单同步：每台主机一个常驻监听线程，基于 PropertyFilter + WaitForUpdatesEx 版本号，
+只把变化的属性写回 VirtualMachine / EsxiHost / Datastore，替代周期性的全量 sync_host_vms。
+"""
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from pyVmomi import vim, vmodl
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db import SessionLocal
+from app.db.upsert import load_rows, diff_rows, bulk_upsert
+from app.models.virtualization import EsxiHost, VirtualMachine, Datastore
+from app.services.esxi_inventory import (
+    INVENTORY_SPECS,
+    VM_COLUMNS,
+    DATASTORE_COLUMNS,
+    build_filter_spec,
+    build_vm_fields,
+    build_host_fields,
+    build_host_storage_fields,
+    build_datastore_fields,
+)
+from app.services.esxi_session_pool import esxi_session_pool
+from app.services.inventory_aggregates import apply_vm_changes, refresh_aggregates, refresh_storage_aggregates
+from app.services.virtualization_service import virtualization_service
+
+
+class HostInventoryWatcher:
+    def __init__(self, host_id: int, host_ip: str, wait_seconds: int = 30):
+        self.host_id = host_id
+        self.host_ip = host_ip
+        self.wait_seconds = wait_seconds
+        self.live = False
+        self.last_update_at: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._collector = None
+        # moref -> 已知属性全集（增量变更合并到这里，以便重新推导派生字段）
+        self._objects: Dict[str, Dict[str, Any]] = {}
+        # VM moref -> 数据库行 ID（uuid 变化或 VM 移除时需要旧 ID）
+        self._vm_ids: Dict[str, str] = {}
+        self._thread = threading.Thread(target=self._run, name=f"watch-{host_ip}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        collector = self._collector
+        if collector is not None:
+            try:
+                collector.CancelWaitForUpdates()
+            except Exception:
+                pass
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    # ---------- 监听循环 ----------
+
+    def _run(self):
+        backoff = 5
+        while not self._stop.is_set():
+            try:
+                self._watch()
+                backoff = 5
+            except SQLAlchemyError as e:
+                # 读取主机记录失败：数据库问题，主机状态保持不变
+                if self._stop.is_set():
+                    break
+                print(f"[Watch] {self.host_ip} database error: {e}")
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                # _watch 内只剩 ESXi 会话 / PropertyCollector 调用会抛出（写库失败已在循环内处理）
+                print(f"[Watch] {self.host_ip} watcher error: {e}")
+                self._mark_offline()
+            self.live = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 300)
+
+    def _watch(self):
+        db = SessionLocal()
+        try:
+            host = db.query(EsxiHost).filter(EsxiHost.id == self.host_id).first()
+            if not host:
+                print(f"[Watch] Host {self.host_id} removed, watcher exits")
+                self._stop.set()
+                return
+            username, pwd = virtualization_service._resolve_credentials(host)
+            ip, port = host.ip, host.port
+        finally:
+            db.close()
+
+        # 监听常驻持有会话，使用不占单主机名额的常驻会话，避免挤占 worker 与采集器
+        with esxi_session_pool.session(ip, username, pwd, port, pinned=True) as si:
+            content = si.RetrieveContent()
+            collector = content.propertyCollector.CreatePropertyCollector()
+            view = content.viewManager.CreateContainerView(content.rootFolder, list(INVENTORY_SPECS.keys()), True)
+            self._collector = collector
+            try:
+                collector.CreateFilter(build_filter_spec(view, INVENTORY_SPECS), partialUpdates=True)
+                self._objects = {}
+                self._vm_ids = {}
+                version = ""
+                # 首个全量快照可能因 maxObjectUpdates 等限制被分成多批（truncated=True），
+                # 收到最后一批之前只写入不清理，避免把尚未下发的 VM 当作已删除
+                initial = True
+                apply_failures = 0
+                options = vim.WaitOptions(maxWaitSeconds=self.wait_seconds)
+                print(f"[Watch] Watching inventory changes on {self.host_ip}")
+                while not self._stop.is_set():
+                    try:
+                        update = collector.WaitForUpdatesEx(version, options)
+                    except vmodl.fault.RequestCanceled:
+                        break
+                    if update is None:
+                        continue
+                    snapshot_done = initial and not update.truncated
+                    try:
+                        self._apply(update, snapshot_complete=snapshot_done)
+                    except Exception as e:
+                        # 写库失败（写锁超时、约束冲突等）与 ESXi 连接无关：不标记离线、不拆会话，
+                        # 本地缓存已被这批更新部分修改，清空后从 version="" 重新取完整快照
+                        print(f"[Watch] {self.host_ip} apply failed, resyncing: {e}")
+                        self._objects = {}
+                        self._vm_ids = {}
+                        version = ""
+                        initial = True
+                        self.live = False
+                        apply_failures += 1
+                        self._stop.wait(min(5 * 2 ** (apply_failures - 1), 300))
+                        continue
+                    apply_failures = 0
+                    version = update.version
+                    if snapshot_done:
+                        initial = False
+                    # 快照完整之前不视为在线，全量同步不会跳过该主机
+                    self.live = not initial
+                    self.last_update_at = datetime.now(timezone.utc)
+            finally:
+                self._collector = None
+                try:
+                    collector.DestroyPropertyCollector()
+                    view.Destroy()
+                except Exception:
+                    pass
+
+    def _mark_offline(self):
+        db = SessionLocal()
+        try:
+            host = db.query(EsxiHost).filter(EsxiHost.id == self.host_id).first()
+            if host and host.status != "offline":
+                host.status = "offline"
+                db.commit()
+        except Exception as e:
+            print(f"[Watch] mark offline failed for {self.host_ip}: {e}")
+        finally:
+            db.close()
+
+    # ---------- 变更合并 ----------
+
+    def _merge(self, update) -> Dict[str, Any]:
+        """把 UpdateSet 合并进本地属性缓存，返回各类对象的变更 moref 集合"""
+        changed: Dict[type, Set[str]] = {obj_type: set() for obj_type in INVENTORY_SPECS}
+        left_vms: List[str] = []
+        for filter_update in update.filterSet or []:
+            for obj_update in filter_update.objectSet or []:
+                obj = obj_update.obj
+                moref = obj._GetMoId()
+                obj_type = next((t for t in INVENTORY_SPECS if isinstance(obj, t)), None)
+                if obj_type is None:
+                    continue
+                if obj_update.kind == "leave":
+                    self._objects.pop(moref, None)
+                    if obj_type is vim.VirtualMachine:
+                        left_vms.append(moref)
+                    else:
+                        changed[obj_type].add(moref)
+                    continue
+                props = self._objects.setdefault(moref, {"obj": obj, "moref": moref})
+                for change in obj_update.changeSet or []:
+                    if change.op in ("remove", "indirectRemove"):
+                        props.pop(change.name, None)
+                    else:
+                        props[change.name] = change.val
+                changed[obj_type].add(moref)
+        return {"changed": changed, "left_vms": left_vms}
+
+    def _apply(self, update, snapshot_complete: bool = False):
+        """合并并写回一批更新；snapshot_complete 表示这是首个全量快照的最后一批，此时清理库中多余的 VM"""
+        merged = self._merge(update)
+        changed = merged["changed"]
+        left_vms = merged["left_vms"]
+        now = datetime.now(timezone.utc)
+
+        db = SessionLocal()
+        try:
+            host = db.query(EsxiHost).filter(EsxiHost.id == self.host_id).first()
+            if not host:
+                self._stop.set()
+                return
+            host_ip = host.ip
+            host.status = "online"
+            host.last_sync_at = now
+
+            # 宿主机资源
+            for moref in changed[vim.HostSystem]:
+                props = self._objects.get(moref)
+                if props:
+                    for key, value in build_host_fields(props).items():
+                        setattr(host, key, value)
+
+            # 存储
+            if changed[vim.Datastore]:
+                ds_props = [p for p in self._objects.values() if isinstance(p["obj"], vim.Datastore)]
+                for key, value in build_host_storage_fields(ds_props).items():
+                    setattr(host, key, value)
+                ds_rows = []
+                for moref in changed[vim.Datastore]:
+                    props = self._objects.get(moref)
+                    fields = build_datastore_fields(props) if props else None
+                    if fields:
+                        ds_rows.append(fields)
+                if ds_rows:
+                    existing_ds = load_rows(db, Datastore, DATASTORE_COLUMNS, Datastore.id.in_([r["id"] for r in ds_rows]))
+                    changed_ds = diff_rows(existing_ds, ds_rows, compare=DATASTORE_COLUMNS)
+                    for row in changed_ds:
+                        row["last_sync"] = now
+                    bulk_upsert(db, Datastore, changed_ds)
+
+            # 虚拟机：只写入真正变化的列
+            vm_fields: Dict[str, Dict[str, Any]] = {}
+            stale_ids: Set[str] = set()
+            for moref in changed[vim.VirtualMachine]:
+                fields = build_vm_fields(host_ip, self._objects.get(moref) or {})
+                if not fields:
+                    print(f"[Watch] {host_ip}: skipping VM {moref} without usable properties")
+                    continue
+                old_id = self._vm_ids.get(moref)
+                if old_id and old_id != fields["id"]:
+                    stale_ids.add(old_id)
+                self._vm_ids[moref] = fields["id"]
+                vm_fields[fields["id"]] = fields
+            for moref in left_vms:
+                old_id = self._vm_ids.pop(moref, None)
+                if old_id:
+                    stale_ids.add(old_id)
+
+            written = 0
+            # (旧行, 新行)：用于增量更新聚合
+            vm_changes = []
+            if vm_fields:
+                existing = load_rows(db, VirtualMachine, VM_COLUMNS, VirtualMachine.id.in_(list(vm_fields.keys())))
+                changed_vms = diff_rows(existing, vm_fields.values(), compare=VM_COLUMNS)
+                for row in changed_vms:
+                    row["last_sync"] = now
+                written = bulk_upsert(db, VirtualMachine, changed_vms)
+                vm_changes.extend((existing.get(row["id"]), row) for row in changed_vms)
+
+            stale_ids -= set(vm_fields.keys())
+            if stale_ids:
+                removed = load_rows(db, VirtualMachine, VM_COLUMNS, VirtualMachine.id.in_(list(stale_ids)))
+                db.query(VirtualMachine).filter(VirtualMachine.id.in_(list(stale_ids))).delete(synchronize_session=False)
+                vm_changes.extend((row, None) for row in removed.values())
+            if snapshot_complete:
+                # 首个全量快照的最后一批：清理监听启动前已被删除的 VM
+                db.query(VirtualMachine).filter(
+                    VirtualMachine.host_ip == host_ip,
+                    VirtualMachine.id.notin_(list(self._vm_ids.values()) or [""]),
+                ).delete(synchronize_session=False)
+
+            if snapshot_complete:
+                refresh_aggregates(db, [host_ip])
+            else:
+                apply_vm_changes(db, vm_changes)
+                if changed[vim.Datastore]:
+                    refresh_storage_aggregates(db, [host_ip])
+            db.commit()
+            if not snapshot_complete and (written or stale_ids):
+                print(f"[Watch] {host_ip}: applied {written} VM changes, removed {len(stale_ids)}")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class InventoryWatcherManager:
+    def __init__(self, enabled: bool = True, wait_seconds: int = 30):
+        self.enabled = enabled
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._watchers: Dict[int, HostInventoryWatcher] = {}
+
+    def start_all(self):
+        if not self.enabled:
+            return
+        db = SessionLocal()
+        try:
+            hosts = [(h.id, h.ip) for h in db.query(EsxiHost).all()]
+        finally:
+            db.close()
+        for host_id, host_ip in hosts:
+            self.ensure(host_id, host_ip)
+
+    def ensure(self, host_id: int, host_ip: str):
+        """确保主机有监听线程；主机 IP 变化时重建"""
+        if not self.enabled:
+            return
+        with self._lock:
+            watcher = self._watchers.get(host_id)
+            if watcher and watcher.host_ip == host_ip and watcher._thread.is_alive():
+                return
+            if watcher:
+                watcher.stop()
+            watcher = HostInventoryWatcher(host_id, host_ip, wait_seconds=self.wait_seconds)
+            self._watchers[host_id] = watcher
+            watcher.start()
+
+    def restart(self, host_id: int, host_ip: str):
+        self.stop(host_id)
+        self.ensure(host_id, host_ip)
+
+    def stop(self, host_id: int):
+        with self._lock:
+            watcher = self._watchers.pop(host_id, None)
+        if watcher:
+            watcher.stop()
+
+    def stop_all(self):
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+        for watcher in watchers:
+            watcher.stop()
+        for watcher in watchers:
+            watcher.join(timeout=5)
+
+    def is_live(self, host_ip: str) -> bool:
+        with self._lock:
+            return any(w.live and w.host_ip == host_ip for w in self._watchers.values())
+
+    def live_ips(self) -> Set[str]:
+        with self._lock:
+            return {w.host_ip for w in self._watchers.values() if w.live}
+
+
+inventory_watcher = InventoryWatcherManager(
+    enabled=os.getenv("ESXI_WATCH_ENABLED", "True") == "True",
+    wait_seconds=int(os.getenv("ESXI_WATCH_WAIT_SECONDS", "30")),
+)
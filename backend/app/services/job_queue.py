@@ -0,0 +1,351 @@
+"""
+持久化任务队列：直接复用 tasks 表。API 只负责写入 pending 任务，独立的 worker 线程池按租约领取执行，
+心跳续租；进程重启后租约过期的 running 任务会被重新排队（或在超过最大次数后标记失败）。
+"""
+import os
+import socket
+import threading
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models.task import Task, TaskSecret
+from app.services.task_events import task_events
+from app.services.task_service import task_service
+
+
+def _utcnow() -> datetime:
+    # 队列时间统一用 naive UTC，SQLite/MySQL 比较时不受时区存储差异影响
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class _JobHandler:
+    def __init__(self, fn: Callable, max_attempts: int, retry_on: tuple):
+        self.fn = fn
+        self.max_attempts = max_attempts
+        self.retry_on = retry_on
+
+
+class JobQueue:
+    def __init__(
+        self,
+        workers: int = 4,
+        poll_interval: float = 2,
+        lease_seconds: int = 60,
+        heartbeat_interval: float = 20,
+        retry_backoff: float = 30,
+        max_backoff: float = 600,
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers: Dict[str, _JobHandler] = {}
+        self._held: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list = []
+
+    # ---------- 注册与入队 ----------
+
+    def register(self, type: str, fn: Callable, max_attempts: int = 1, retry_on: tuple = (Exception,)):
+        """注册任务处理函数 fn(db, task_id, payload) -> {"message", "result"}；
+        仅 retry_on 中的异常会按退避重试，ValueError 视为参数错误直接失败"""
+        self._handlers[type] = _JobHandler(fn, max_attempts, retry_on)
+
+    def enqueue(
+        self,
+        db: Session,
+        type: str,
+        payload: Dict[str, Any],
+        target_id: Optional[str] = None,
+        message: str = "等待开始",
+        secrets: Optional[Dict[str, Any]] = None,
+    ) -> Task:
+        """secrets 为密码等敏感参数，单独存入 task_secrets，处理函数通过 secrets() 读取，任务终态时删除"""
+        handler = self._handlers.get(type)
+        if not handler:
+            raise ValueError(f"未注册的任务类型: {type}")
+        task_id = str(uuid.uuid4())
+        if secrets:
+            # 与任务同一事务提交，worker 领取时密码一定已就绪
+            db.add(TaskSecret(task_id=task_id, data=secrets))
+        task = task_service.create_task(
+            db,
+            type=type,
+            target_id=target_id,
+            message=message,
+            payload=payload,
+            max_attempts=handler.max_attempts,
+            task_id=task_id,
+        )
+        self._wakeup.set()
+        return task
+
+    def secrets(self, db: Session, task_id: str) -> Dict[str, Any]:
+        row = db.query(TaskSecret).filter(TaskSecret.task_id == task_id).first()
+        return dict(row.data) if row else {}
+
+    @staticmethod
+    def _drop_secrets(db: Session, task_id: str):
+        db.execute(delete(TaskSecret).where(TaskSecret.task_id == task_id))
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        recovered = self.recover_orphans()
+        if recovered:
+            print(f"[JobQueue] Recovered {recovered} orphaned tasks")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        print(f"[JobQueue] Started {self.workers} workers as {self.owner}")
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # ---------- 领取 / 续租 / 回收 ----------
+
+    def _claim(self) -> Optional[str]:
+        """原子领取一个到期的 pending 任务：条件 UPDATE 只有一个 worker 能成功"""
+        if not self._handlers:
+            return None
+        db = SessionLocal()
+        try:
+            now = _utcnow()
+            candidates = (
+                db.query(Task.id)
+                .filter(
+                    Task.status == "pending",
+                    Task.type.in_(list(self._handlers.keys())),
+                    or_(Task.available_at.is_(None), Task.available_at <= now),
+                )
+                .order_by(Task.created_at)
+                .limit(self.workers)
+                .all()
+            )
+            for (task_id,) in candidates:
+                claimed = db.execute(
+                    update(Task)
+                    .where(Task.id == task_id, Task.status == "pending")
+                    .values(
+                        status="running",
+                        lease_owner=self.owner,
+                        lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                        attempts=Task.attempts + 1,
+                    )
+                ).rowcount
+                db.commit()
+                if claimed:
+                    with self._lock:
+                        self._held.add(task_id)
+                    self._publish(db, task_id)
+                    return task_id
+            return None
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self):
+        last_reap = 0.0
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                held = list(self._held)
+            db = SessionLocal()
+            try:
+                if held:
+                    db.execute(
+                        update(Task)
+                        .where(Task.id.in_(held), Task.lease_owner == self.owner, Task.status == "running")
+                        .values(lease_expires_at=_utcnow() + timedelta(seconds=self.lease_seconds))
+                    )
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"[JobQueue] heartbeat failed: {e}")
+            finally:
+                db.close()
+            # 顺带回收其他进程遗留的过期租约
+            if self._stop.is_set():
+                break
+            now_ts = _utcnow().timestamp()
+            if now_ts - last_reap >= self.lease_seconds:
+                last_reap = now_ts
+                try:
+                    self.recover_orphans()
+                except Exception as e:
+                    print(f"[JobQueue] recover orphans failed: {e}")
+
+    def recover_orphans(self) -> int:
+        """把租约过期（或无租约，即队列接管前遗留）的 running 任务重新排队；次数用尽则标记失败"""
+        db = SessionLocal()
+        recovered = 0
+        try:
+            now = _utcnow()
+            orphans = (
+                db.query(Task)
+                .filter(
+                    Task.status == "running",
+                    or_(Task.lease_expires_at.is_(None), Task.lease_expires_at < now),
+                )
+                .all()
+            )
+            for task in orphans:
+                if task.lease_owner == self.owner and task.id in self._held:
+                    continue
+                attempts = task.attempts or 0
+                if task.payload is not None and task.type in self._handlers and attempts < (task.max_attempts or 1):
+                    task.status = "pending"
+                    task.available_at = now + timedelta(seconds=self._backoff(attempts))
+                    task.message = f"执行中断（worker 失联），第 {attempts + 1} 次重试排队中"
+                else:
+                    task.status = "failed"
+                    task.progress = 100
+                    task.message = "执行中断：服务重启或 worker 失联，任务未完成"
+                    task.payload = None
+                    self._drop_secrets(db, task.id)
+                task.lease_owner = None
+                task.lease_expires_at = None
+                recovered += 1
+            db.commit()
+            for task in orphans:
+                task_events.publish(task)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return recovered
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.retry_backoff * (2 ** max(attempts - 1, 0)), self.max_backoff)
+
+    # ---------- 执行 ----------
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                task_id = self._claim()
+            except Exception as e:
+                print(f"[JobQueue] claim failed: {e}")
+                task_id = None
+            if not task_id:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            try:
+                self._execute(task_id)
+            finally:
+                with self._lock:
+                    self._held.discard(task_id)
+
+    def _execute(self, task_id: str):
+        db = SessionLocal()
+        try:
+            task = db.query(Task).filter(Task.id == task_id).first()
+            handler = self._handlers.get(task.type) if task else None
+            if not task or not handler:
+                return
+            if task.payload is None:
+                self._finish(db, task_id, status="failed", message="缺少任务参数，无法执行")
+                return
+            print(f"[JobQueue] Running {task.type} {task_id} (attempt {task.attempts}/{task.max_attempts})")
+            try:
+                outcome = handler.fn(db, task_id, dict(task.payload)) or {}
+            except Exception as e:
+                db.rollback()
+                print(f"[JobQueue] {task.type} {task_id} failed: {e}")
+                print(f"[JobQueue] 异常堆栈: {traceback.format_exc()}")
+                self._fail_or_retry(db, task_id, handler, e)
+                return
+            self._finish(
+                db,
+                task_id,
+                status=outcome.get("status", "success"),
+                message=outcome.get("message"),
+                result=outcome.get("result"),
+            )
+        finally:
+            db.close()
+
+    def _fail_or_retry(self, db: Session, task_id: str, handler: _JobHandler, error: Exception):
+        # 先落库缓冲中的进度，避免之后的定时刷新覆盖最终状态
+        task_service.forget(task_id)
+        db.expire_all()
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task:
+            return
+        attempts = task.attempts or 0
+        retryable = isinstance(error, handler.retry_on) and not isinstance(error, ValueError)
+        if retryable and attempts < (task.max_attempts or 1):
+            delay = self._backoff(attempts)
+            values = {
+                "status": "pending",
+                "available_at": _utcnow() + timedelta(seconds=delay),
+                "message": f"第 {attempts} 次执行失败：{error}，{int(delay)}s 后重试",
+            }
+        else:
+            # 终态不再需要参数，连同密码一起清掉
+            values = {"status": "failed", "progress": 100, "message": str(error), "payload": None}
+        updated = db.execute(
+            update(Task)
+            .where(Task.id == task_id, Task.lease_owner == self.owner)
+            .values(last_error=str(error), lease_owner=None, lease_expires_at=None, **values)
+        ).rowcount
+        if updated and values["status"] == "failed":
+            self._drop_secrets(db, task_id)
+        db.commit()
+        self._publish(db, task_id)
+
+    def _finish(self, db: Session, task_id: str, status: str, message: Optional[str] = None, result: Any = None):
+        task_service.forget(task_id)
+        values = {"status": status, "progress": 100, "lease_owner": None, "lease_expires_at": None, "payload": None}
+        if message is not None:
+            values["message"] = message
+        if result is not None:
+            values["result"] = result
+        updated = db.execute(
+            update(Task).where(Task.id == task_id, Task.lease_owner == self.owner).values(**values)
+        ).rowcount
+        if updated:
+            self._drop_secrets(db, task_id)
+        db.commit()
+        if not updated:
+            print(f"[JobQueue] lease of {task_id} lost before finish, result discarded")
+            return
+        self._publish(db, task_id)
+
+    def _publish(self, db: Session, task_id: str):
+        """条件 UPDATE 不经过 ORM 对象，状态变化后重新读取一次并发布给订阅者"""
+        db.expire_all()
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if task:
+            task_events.publish(task)
+
+
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "4")),
+    poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "2")),
+    lease_seconds=int(os.getenv("JOB_LEASE_SECONDS", "60")),
+    heartbeat_interval=float(os.getenv("JOB_HEARTBEAT_INTERVAL", "20")),
+    retry_backoff=float(os.getenv("JOB_RETRY_BACKOFF", "30")),
+)
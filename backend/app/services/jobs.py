@@ -0,0 +1,137 @@
+"""
+长耗时任务的处理函数，注册到持久化队列 job_queue；API 只负责入队。
+处理函数签名：fn(db, task_id, payload) -> {"message", "result"[, "status"]}，异常交给队列决定重试或失败。
+"""
+import os
+
+from sqlalchemy.orm import Session
+
+from app.models.credential import Credential
+from app.models.virtualization import EsxiHost, VirtualMachine
+from app.services.esxi_session_pool import EsxiConnectionError
+from app.services.job_queue import job_queue
+from app.services.task_service import task_service
+from app.services.virtualization_service import virtualization_service
+
+
+def _load_host_vm(db: Session, payload: dict):
+    host = db.query(EsxiHost).filter(EsxiHost.id == payload["host_id"]).first()
+    vm = db.query(VirtualMachine).filter(VirtualMachine.id == payload["vm_id"]).first()
+    if not host or not vm:
+        raise ValueError("未找到 Host 或 VM")
+    return host, vm
+
+
+def _guest_options(db: Session, task_id: str, payload: dict) -> dict:
+    """payload 中的克隆参数不含 Guest 密码，执行时从 task_secrets 合并回来"""
+    options = dict(payload["options"])
+    password = job_queue.secrets(db, task_id).get("guest_password")
+    if password:
+        options["guest_password"] = password
+    return options
+
+
+def run_clone_job(db: Session, task_id: str, payload: dict) -> dict:
+    host, vm = _load_host_vm(db, payload)
+    options = _guest_options(db, task_id, payload)
+    new_name = options["new_name"]
+    print(f"[Job] Starting clone for {vm.name} -> {new_name}")
+    task_service.update_task(
+        db, task_id, progress=5,
+        message=f"正在克隆: {vm.name} -> {new_name}",
+        result={"source": vm.name, "target": new_name},
+    )
+    res = virtualization_service.clone_vm(db=db, host=host, vm=vm, task_id=task_id, task_service=task_service, **options)
+
+    ip_msg = res.get("ip_message")
+    ip_configured = res.get("ip_configured")
+    final_msg = res.get("message")
+    if ip_msg and not ip_configured:
+        final_msg += f" [IP配置失败: {ip_msg}]"
+        print(f"[Job] ⚠️ IP 配置失败，但克隆任务标记为成功")
+    print(f"[Job] ✅ 克隆任务完成: {new_name}")
+    return {
+        "message": final_msg,
+        "result": {
+            "source": vm.name,
+            "target": new_name,
+            "new_vm_moref": res.get("new_vm_moref"),
+            "new_vmx_path": res.get("new_vmx_path"),
+            "ip_configured": ip_configured,
+            "ip_message": ip_msg,
+        },
+    }
+
+
+def run_batch_clone_job(db: Session, task_id: str, payload: dict) -> dict:
+    host, vm = _load_host_vm(db, payload)
+    items = payload["items"]
+    print(f"[Job] Starting batch clone for {vm.name} -> {[item['new_name'] for item in items]}")
+    task_service.update_task(
+        db, task_id, progress=5,
+        message=f"正在批量克隆: {vm.name} -> {len(items)} 台",
+        result={"source": vm.name, "targets": [item["new_name"] for item in items]},
+    )
+    res = virtualization_service.batch_clone_vms(
+        db=db, host=host, vm=vm, items=items, task_id=task_id, task_service=task_service,
+        **_guest_options(db, task_id, payload),
+    )
+    print(f"[Job] ✅ 批量克隆任务结束: {res['message']}")
+    return {
+        "status": "success" if res["success"] else "failed",
+        "message": res["message"],
+        "result": {"source": res["source"], "children": res["children"]},
+    }
+
+
+def run_install_tools_job(db: Session, task_id: str, payload: dict) -> dict:
+    ip = payload["ip"]
+    if payload.get("credential_id"):
+        cred = db.query(Credential).filter(Credential.id == payload["credential_id"]).first()
+        if not cred:
+            raise ValueError("凭据已被删除")
+        username, password = cred.username, cred.password
+    else:
+        # 兼容升级前入队、payload 里仍带密码的任务
+        username = payload["username"]
+        password = job_queue.secrets(db, task_id).get("password") or payload.get("password")
+        if not password:
+            raise ValueError("缺少 SSH 密码")
+    task_service.update_task(db, task_id, progress=10, message=f"正在连接 SSH: {ip}")
+    virtualization_service.install_tools_ssh(ip, username, password)
+    return {"message": "Tools 安装命令执行成功，请稍候同步"}
+
+
+def run_power_job(db: Session, task_id: str, payload: dict) -> dict:
+    host, vm = _load_host_vm(db, payload)
+    action = payload["action"]
+    task_service.update_task(db, task_id, progress=10, message=f"正在执行 {action}: {vm.name}")
+    res = virtualization_service.power_vm(db, host, vm, action)
+    return {
+        "message": f"[{vm.name}] {res['message']}",
+        "result": {"vm_id": vm.id, "name": vm.name, "action": action, "power_state": res.get("power_state")},
+    }
+
+
+def run_bulk_power_job(db: Session, task_id: str, payload: dict) -> dict:
+    action = payload["action"]
+    vm_ids = payload["vm_ids"]
+    print(f"[Job] Starting bulk {action} for {len(vm_ids)} VMs")
+    task_service.update_task(db, task_id, progress=5, message=f"正在批量 {action}: {len(vm_ids)} 台")
+    res = virtualization_service.bulk_power_vms(db, vm_ids, action, task_service=task_service, task_id=task_id)
+    return {
+        "status": "success" if res["success"] else "failed",
+        "message": res["message"],
+        "result": {"action": action, "children": res["children"]},
+    }
+
+
+_max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# 克隆只在连不上 ESXi（尚未产生任何副作用）时重试；安装 Tools 可整体重跑
+job_queue.register("clone_vm", run_clone_job, max_attempts=_max_attempts, retry_on=(EsxiConnectionError,))
+job_queue.register("batch_clone_vm", run_batch_clone_job, max_attempts=_max_attempts, retry_on=(EsxiConnectionError,))
+job_queue.register("install_tools", run_install_tools_job, max_attempts=_max_attempts)
+# 电源动作非幂等（重启/重置），只执行一次
+job_queue.register("power_vm", run_power_job)
+job_queue.register("bulk_power_vm", run_bulk_power_job)
@@ -0,0 +1,192 @@
+"""
+性能指标采集：后台线程每 interval 秒对每台主机通过 perf_query 批量查询主机本身与全部开机 VM 的
+实时（20 秒）采样（计数器 ID 按主机版本缓存、按单次上限分批），换算单位后写入 metrics_store；
+每个采集周期从上次最新采样时间续取，重叠部分由存储按槽位去重。
+另按周期记录主机已用存储（来自清单同步的 storage_total_gb - storage_free_gb），供容量报告估算增长趋势。
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pyVmomi import vim
+
+from app.db import SessionLocal
+from app.models.virtualization import EsxiHost, VirtualMachine
+from app.services.esxi_inventory import retrieve_inventory
+from app.services.esxi_session_pool import esxi_session_pool
+from app.services.metrics_store import RAW_STEP, metrics_store
+from app.services.perf_query import PerfResult, perf_query
+from app.services.virtualization_service import virtualization_service
+
+# 指标名 -> (性能计数器 group.name.rollup, 换算系数)；百分比计数器单位为 0.01%，内存单位为 KB
+METRIC_COUNTERS: Dict[str, Tuple[str, float]] = {
+    "cpu_usage_pct": ("cpu.usage.average", 0.01),
+    "cpu_usage_mhz": ("cpu.usagemhz.average", 1.0),
+    "mem_usage_pct": ("mem.usage.average", 0.01),
+    "mem_active_mb": ("mem.active.average", 1 / 1024),
+    "net_kbps": ("net.usage.average", 1.0),
+    "disk_kbps": ("disk.usage.average", 1.0),
+}
+# 非性能计数器的主机指标：每个采集周期从数据库记录一个点
+HOST_GAUGES: List[str] = ["storage_used_gb"]
+_METRICS = list(METRIC_COUNTERS)
+_COUNTERS = [counter for counter, _ in METRIC_COUNTERS.values()]
+_SCALES = np.array([scale for _, scale in METRIC_COUNTERS.values()])
+
+
+class MetricsCollector:
+    def __init__(self, enabled: bool = True, interval: int = 60, workers: int = 4, prune_interval: int = 3600):
+        self.enabled = enabled
+        self.interval = max(interval, RAW_STEP)
+        self.workers = workers
+        self.prune_interval = prune_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._host_morefs: Dict[str, str] = {}
+        # host_ip -> 最近一次采样的时间戳（主机时钟）
+        self._last_sample: Dict[str, datetime] = {}
+        self._last_prune = 0.0
+
+    def start(self):
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-collector", daemon=True)
+        self._thread.start()
+        print(f"[Metrics] Collector started, interval {self.interval}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.collect_all()
+                if time.time() - self._last_prune >= self.prune_interval:
+                    self._prune()
+            except Exception as e:
+                print(f"[Metrics] collect cycle failed: {e}")
+            self._stop.wait(max(1.0, self.interval - (time.monotonic() - started)))
+
+    def _prune(self):
+        db = SessionLocal()
+        try:
+            removed = metrics_store.prune(db)
+            db.commit()
+            if removed:
+                print(f"[Metrics] pruned {removed} expired chunks")
+        finally:
+            db.close()
+        self._last_prune = time.time()
+
+    # ---------- 采集 ----------
+
+    def collect_all(self):
+        db = SessionLocal()
+        try:
+            targets = []
+            for host in db.query(EsxiHost).all():
+                try:
+                    user, pwd = virtualization_service._resolve_credentials(host)
+                except ValueError:
+                    continue
+                targets.append((host.ip, host.port, user, pwd))
+        finally:
+            db.close()
+        if not targets:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(targets)), thread_name_prefix="metrics") as pool:
+            for target, future in [(t, pool.submit(self.collect_host, *t)) for t in targets]:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"[Metrics] {target[0]} collect failed: {e}")
+
+    def collect_host(self, ip: str, port: int, user: str, pwd: str) -> int:
+        """采集一台主机及其开机 VM；返回新增采样数"""
+        db = SessionLocal()
+        try:
+            vms = db.query(VirtualMachine.id, VirtualMachine.moref).filter(
+                VirtualMachine.host_ip == ip,
+                VirtualMachine.status == "poweredOn",
+                VirtualMachine.moref.isnot(None),
+            ).all()
+            storage = db.query(EsxiHost.storage_total_gb, EsxiHost.storage_free_gb).filter(EsxiHost.ip == ip).first()
+        finally:
+            db.close()
+
+        with esxi_session_pool.session(ip, user, pwd, port) as si:
+            content = si.RetrieveContent()
+            stub = content.propertyCollector._stub
+            host_moref = self._host_morefs.get(ip)
+            if host_moref is None:
+                hosts = retrieve_inventory(content, {vim.HostSystem: ["name"]})[vim.HostSystem]
+                host_moref = self._host_morefs[ip] = hosts[0]["moref"] if hosts else None
+
+            # moref -> (entity_type, entity_id)
+            entities: Dict[str, Tuple[str, str]] = {moref: ("vm", vm_id) for vm_id, moref in vms}
+            objects = [vim.VirtualMachine(moref, stub) for moref in entities]
+            if host_moref:
+                entities[host_moref] = ("host", ip)
+                objects.append(vim.HostSystem(host_moref, stub))
+            if not objects:
+                return 0
+            start_time, max_sample = self._window(ip)
+            result = perf_query.query(
+                content, ip, objects, _COUNTERS, interval_id=RAW_STEP, start_time=start_time, max_sample=max_sample
+            )
+
+        series, latest = self._to_series(result, entities)
+        if latest:
+            self._last_sample[ip] = latest
+        if storage and storage[0]:
+            now = int(time.time())
+            series.append(("host", ip, "storage_used_gb", [(now - now % RAW_STEP, storage[0] - (storage[1] or 0))]))
+        db = SessionLocal()
+        try:
+            written = metrics_store.write(db, ip, series)
+            db.commit()
+        finally:
+            db.close()
+        return written
+
+    def _window(self, ip: str) -> Tuple[Optional[datetime], Optional[int]]:
+        """(startTime, maxSample)：上次采样后续取（多取两个槽位防止边界遗漏）；首次或中断超过 1 小时则取最近一个周期的采样"""
+        last = self._last_sample.get(ip)
+        if last and datetime.now(timezone.utc) - last < timedelta(hours=1):
+            return last - timedelta(seconds=2 * RAW_STEP), None
+        return None, self.interval // RAW_STEP + 1
+
+    @staticmethod
+    def _to_series(result: PerfResult, entities: Dict[str, Tuple[str, str]]):
+        """换算单位（整块向量化）并拆分为存储写入格式；返回 (series, 最新采样时间)"""
+        if not len(result) or not len(result.timestamps):
+            return [], None
+        scaled = result.values * _SCALES[None, :, None]
+        present = ~np.isnan(scaled)
+        series: List = []
+        for i, moref in enumerate(result.morefs):
+            entity = entities.get(moref)
+            if entity is None:
+                continue
+            for j, metric in enumerate(_METRICS):
+                mask = present[i, j]
+                if mask.any():
+                    points = list(zip(result.timestamps[mask].tolist(), scaled[i, j][mask].tolist()))
+                    series.append((entity[0], entity[1], metric, points))
+        latest = datetime.fromtimestamp(int(result.timestamps[-1]), timezone.utc)
+        return series, latest
+
+
+metrics_collector = MetricsCollector(
+    enabled=os.getenv("METRICS_ENABLED", "True") == "True",
+    interval=int(os.getenv("METRICS_COLLECT_INTERVAL", "60")),
+    workers=int(os.getenv("METRICS_COLLECT_WORKERS", "4")),
+)
@@ -0,0 +1,320 @@
+"""
+性能指标时序存储（SQLite / MySQL 通用）：
+- 原始采样：20 秒槽位，每个 实体 x 指标 x 20 分钟 一行（60 个 float32 槽位），写入时按槽位去重；
+- 降采样：5 分钟（按 2 小时分块）与 1 小时（按天分块）两级，写入原始采样的同一事务内增量累加 sum / count / max；
+- 块跨度较短：每个采集周期只重写当前块（几百字节），而长范围查询读取的块数仍只有几十到上百个；
+- 保留期：各粒度按块整体删除；
+- 范围查询按时间跨度自动选择粒度，长时间范围只读取少量汇总块，不扫描原始采样。
+"""
+import math
+import os
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.db.upsert import bulk_upsert
+from app.models.metrics import MetricRawChunk, MetricRollupChunk
+
+RAW_STEP = 20
+RAW_SPAN = 1200
+# (粒度秒, 块跨度秒)
+ROLLUPS: List[Tuple[int, int]] = [(300, 7200), (3600, 86400)]
+RESOLUTIONS = [RAW_STEP] + [step for step, _ in ROLLUPS]
+
+_NAN = float("nan")
+
+# 写入输入：(entity_type, entity_id, metric, [(unix 秒, 值), ...])
+Series = Tuple[str, str, str, Sequence[Tuple[int, float]]]
+
+
+def _unpack(blob: bytes) -> array:
+    values = array("f")
+    values.frombytes(blob)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _pack(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array("f", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _filled(n: int, value: float) -> array:
+    return array("f", [value]) * n
+
+
+def _chunk_span(resolution: int) -> int:
+    if resolution == RAW_STEP:
+        return RAW_SPAN
+    for step, span in ROLLUPS:
+        if step == resolution:
+            return span
+    raise ValueError(f"不支持的粒度: {resolution}")
+
+
+class MetricsStore:
+    def __init__(
+        self,
+        raw_retention: int = 24 * 3600,
+        rollup_retention: Optional[Dict[int, int]] = None,
+        max_points: int = 1000,
+    ):
+        self.retention = {RAW_STEP: raw_retention}
+        self.retention.update(rollup_retention or {300: 7 * 86400, 3600: 90 * 86400})
+        self.max_points = max_points
+
+    # ---------- 写入 ----------
+
+    def write(self, db: Session, host_ip: str, series: Iterable[Series]) -> int:
+        """写入一台主机的采样并更新各级汇总；返回新增采样数。不提交，由调用方提交"""
+        series = list(series)
+        raw_starts = {ts - ts % RAW_SPAN for _, _, _, points in series for ts, _ in points}
+        if not raw_starts:
+            return 0
+        raw = {
+            (row.entity_type, row.entity_id, row.metric, row.chunk_start): _unpack(row.samples)
+            for row in db.query(
+                MetricRawChunk.entity_type, MetricRawChunk.entity_id, MetricRawChunk.metric,
+                MetricRawChunk.chunk_start, MetricRawChunk.samples,
+            ).filter(
+                MetricRawChunk.host_ip == host_ip, MetricRawChunk.chunk_start.in_(raw_starts)
+            )
+        }
+        slots = RAW_SPAN // RAW_STEP
+        dirty = set()
+        fresh: List[Tuple[str, str, str, int, float]] = []
+        for entity_type, entity_id, metric, points in series:
+            for ts, value in points:
+                start = ts - ts % RAW_SPAN
+                key = (entity_type, entity_id, metric, start)
+                samples = raw.get(key)
+                if samples is None:
+                    samples = raw[key] = _filled(slots, _NAN)
+                slot = (ts - start) // RAW_STEP
+                # 采样窗口有重叠：槽位已有值说明已写过（汇总也已累加）
+                if not math.isnan(samples[slot]):
+                    continue
+                samples[slot] = value
+                dirty.add(key)
+                fresh.append((entity_type, entity_id, metric, ts, value))
+        if not fresh:
+            return 0
+
+        bulk_upsert(db, MetricRawChunk, [
+            {
+                "entity_type": key[0], "entity_id": key[1], "metric": key[2], "chunk_start": key[3],
+                "host_ip": host_ip, "samples": _pack(raw[key]),
+            }
+            for key in dirty
+        ])
+        for step, span in ROLLUPS:
+            self._accumulate(db, host_ip, step, span, fresh)
+        return len(fresh)
+
+    def _accumulate(self, db: Session, host_ip: str, step: int, span: int, fresh):
+        starts = {ts - ts % span for _, _, _, ts, _ in fresh}
+        chunks = {
+            (row.entity_type, row.entity_id, row.metric, row.chunk_start): (
+                _unpack(row.sums), _unpack(row.counts), _unpack(row.maxes)
+            )
+            for row in db.query(
+                MetricRollupChunk.entity_type, MetricRollupChunk.entity_id, MetricRollupChunk.metric,
+                MetricRollupChunk.chunk_start, MetricRollupChunk.sums, MetricRollupChunk.counts, MetricRollupChunk.maxes,
+            ).filter(
+                MetricRollupChunk.host_ip == host_ip,
+                MetricRollupChunk.resolution == step,
+                MetricRollupChunk.chunk_start.in_(starts),
+            )
+        }
+        slots = span // step
+        dirty = set()
+        for entity_type, entity_id, metric, ts, value in fresh:
+            start = ts - ts % span
+            key = (entity_type, entity_id, metric, start)
+            chunk = chunks.get(key)
+            if chunk is None:
+                chunk = chunks[key] = (_filled(slots, 0.0), _filled(slots, 0.0), _filled(slots, _NAN))
+            sums, counts, maxes = chunk
+            slot = (ts - start) // step
+            sums[slot] += value
+            counts[slot] += 1
+            if math.isnan(maxes[slot]) or value > maxes[slot]:
+                maxes[slot] = value
+            dirty.add(key)
+        bulk_upsert(db, MetricRollupChunk, [
+            {
+                "entity_type": key[0], "entity_id": key[1], "metric": key[2], "resolution": step,
+                "chunk_start": key[3], "host_ip": host_ip,
+                "sums": _pack(chunks[key][0]), "counts": _pack(chunks[key][1]), "maxes": _pack(chunks[key][2]),
+            }
+            for key in dirty
+        ])
+
+    # ---------- 查询 ----------
+
+    def pick_resolution(self, start: int, end: int, now: Optional[float] = None) -> int:
+        """点数不超过 max_points 且仍在保留期内的最细粒度；都不满足时用最粗粒度"""
+        now = now or time.time()
+        for step in RESOLUTIONS:
+            if (end - start) / step <= self.max_points and start >= now - self.retention[step]:
+                return step
+        return RESOLUTIONS[-1]
+
+    def query(
+        self,
+        db: Session,
+        entity_type: str,
+        entity_id: str,
+        metrics: List[str],
+        start: int,
+        end: int,
+        resolution: Optional[int] = None,
+    ) -> Dict:
+        """
+        返回 {"resolution", "timestamps": [...], "series": {metric: {"avg": [...], "max": [...]}}}，
+        时间轴按粒度对齐、等间隔，缺失点为 None。参数非法时抛 ValueError
+        """
+        if end <= start:
+            raise ValueError("结束时间必须晚于开始时间")
+        if resolution is None:
+            resolution = self.pick_resolution(start, end)
+        span = _chunk_span(resolution)
+        first = start - start % resolution
+        count = (end - first) // resolution + 1
+        if count > self.max_points and resolution != RESOLUTIONS[-1]:
+            raise ValueError(f"时间范围过大：{count} 个点超过上限 {self.max_points}，请使用更粗的粒度")
+        timestamps = [first + i * resolution for i in range(count)]
+        series = {metric: {"avg": [None] * count, "max": [None] * count} for metric in metrics}
+        if not metrics:
+            return {"resolution": resolution, "timestamps": timestamps, "series": series}
+
+        lo = first - first % span
+        if resolution == RAW_STEP:
+            rows = db.query(MetricRawChunk).filter(
+                MetricRawChunk.entity_type == entity_type,
+                MetricRawChunk.entity_id == entity_id,
+                MetricRawChunk.metric.in_(metrics),
+                MetricRawChunk.chunk_start >= lo,
+                MetricRawChunk.chunk_start <= end,
+            )
+            for row in rows:
+                samples = _unpack(row.samples)
+                self._fill(series[row.metric], samples, samples, None, row.chunk_start, resolution, first, count)
+        else:
+            rows = db.query(MetricRollupChunk).filter(
+                MetricRollupChunk.entity_type == entity_type,
+                MetricRollupChunk.entity_id == entity_id,
+                MetricRollupChunk.metric.in_(metrics),
+                MetricRollupChunk.resolution == resolution,
+                MetricRollupChunk.chunk_start >= lo,
+                MetricRollupChunk.chunk_start <= end,
+            )
+            for row in rows:
+                self._fill(
+                    series[row.metric], _unpack(row.sums), _unpack(row.maxes), _unpack(row.counts),
+                    row.chunk_start, resolution, first, count,
+                )
+        return {"resolution": resolution, "timestamps": timestamps, "series": series}
+
+    @staticmethod
+    def _fill(out: Dict, sums: array, maxes: array, counts: Optional[array], chunk_start: int, step: int, first: int, count: int):
+        """把块内落在查询范围的槽位拷贝到输出（原始采样 counts 为 None，sums 即采样值）"""
+        offset = (chunk_start - first) // step
+        lo = max(0, -offset)
+        hi = min(len(sums), count - offset)
+        avg, peak = out["avg"], out["max"]
+        for slot in range(lo, hi):
+            if counts is None:
+                value = sums[slot]
+                if math.isnan(value):
+                    continue
+                avg[offset + slot] = round(value, 2)
+                peak[offset + slot] = round(value, 2)
+            elif counts[slot] > 0:
+                avg[offset + slot] = round(sums[slot] / counts[slot], 2)
+                peak[offset + slot] = round(maxes[slot], 2)
+
+    def load_matrix(
+        self,
+        db: Session,
+        entity_type: str,
+        entity_ids: Sequence[str],
+        metric: str,
+        start: int,
+        end: int,
+        resolution: int = 3600,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        批量读取多个实体同一指标的汇总平均值：返回 (timestamps (T,), values (实体, T))，缺失为 NaN。
+        仅支持汇总粒度，供容量分析等跨实体向量化计算使用
+        """
+        if resolution == RAW_STEP:
+            raise ValueError("load_matrix 仅支持汇总粒度")
+        span = _chunk_span(resolution)
+        first = start - start % resolution
+        count = max(0, (end - first) // resolution + 1)
+        timestamps = first + resolution * np.arange(count, dtype=np.int64)
+        sums = np.zeros((len(entity_ids), count))
+        counts = np.zeros((len(entity_ids), count))
+        if not entity_ids or not count:
+            return timestamps, np.full((len(entity_ids), count), np.nan)
+
+        index = {entity_id: i for i, entity_id in enumerate(entity_ids)}
+        rows = db.query(
+            MetricRollupChunk.entity_id, MetricRollupChunk.chunk_start, MetricRollupChunk.sums, MetricRollupChunk.counts,
+        ).filter(
+            MetricRollupChunk.entity_type == entity_type,
+            MetricRollupChunk.entity_id.in_(list(entity_ids)),
+            MetricRollupChunk.metric == metric,
+            MetricRollupChunk.resolution == resolution,
+            MetricRollupChunk.chunk_start >= first - first % span,
+            MetricRollupChunk.chunk_start <= end,
+        )
+        for entity_id, chunk_start, chunk_sums, chunk_counts in rows:
+            offset = (chunk_start - first) // resolution
+            chunk_sums = np.frombuffer(chunk_sums, dtype="<f4")
+            lo, hi = max(0, -offset), min(len(chunk_sums), count - offset)
+            if lo >= hi:
+                continue
+            i = index[entity_id]
+            sums[i, offset + lo : offset + hi] = chunk_sums[lo:hi]
+            counts[i, offset + lo : offset + hi] = np.frombuffer(chunk_counts, dtype="<f4")[lo:hi]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return timestamps, np.where(counts > 0, sums / counts, np.nan)
+
+    # ---------- 保留期 ----------
+
+    def prune(self, db: Session, now: Optional[float] = None) -> int:
+        """删除整块超出保留期的数据；不提交"""
+        now = int(now or time.time())
+        removed = db.query(MetricRawChunk).filter(
+            MetricRawChunk.chunk_start < now - self.retention[RAW_STEP] - RAW_SPAN
+        ).delete(synchronize_session=False)
+        for step, span in ROLLUPS:
+            removed += db.query(MetricRollupChunk).filter(
+                MetricRollupChunk.resolution == step,
+                MetricRollupChunk.chunk_start < now - self.retention[step] - span,
+            ).delete(synchronize_session=False)
+        return removed
+
+    def delete_entities(self, db: Session, host_ip: str):
+        """删除主机及其 VM 的全部指标（删除主机时调用）；不提交"""
+        db.query(MetricRawChunk).filter(MetricRawChunk.host_ip == host_ip).delete(synchronize_session=False)
+        db.query(MetricRollupChunk).filter(MetricRollupChunk.host_ip == host_ip).delete(synchronize_session=False)
+
+
+metrics_store = MetricsStore(
+    raw_retention=int(float(os.getenv("METRICS_RAW_RETENTION_HOURS", "24")) * 3600),
+    rollup_retention={
+        300: int(float(os.getenv("METRICS_5M_RETENTION_DAYS", "7")) * 86400),
+        3600: int(float(os.getenv("METRICS_1H_RETENTION_DAYS", "90")) * 86400),
+    },
+    max_points=int(os.getenv("METRICS_MAX_POINTS", "1000")),
+)
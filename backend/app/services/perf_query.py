@@ -0,0 +1,188 @@
+"""
+PerformanceManager 查询层：
+- 计数器 ID（如 cpu.usage.average）按 主机 + 版本（about.instanceUuid / build）解析一次并缓存，升级后自动重新解析；
+- 一台主机的多个实体合并为一组 QuerySpec 批量查询，按 实体数 x 计数器数 不超过单次上限分批，
+  上限优先读取 config.vpxd.stats.maxQueryMetrics（vCenter），ESXi 上没有该选项时使用配置值；
+- 结果解码为 NumPy 数组：所有实体对齐到同一时间轴，values 形状为 (实体, 计数器, 时间)，无数据为 NaN，
+  可直接做跨实体 / 跨时间的向量化聚合。
+"""
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pyVmomi import vim
+
+REALTIME_INTERVAL = 20
+_LIMIT_OPTION = "config.vpxd.stats.maxQueryMetrics"
+
+
+class PerfResult:
+    """
+    一次批量查询的解码结果：
+    - morefs: 实体 moref 列表（values 第 0 维顺序）
+    - counters: 计数器名列表（values 第 1 维顺序，与查询时传入的顺序一致）
+    - timestamps: (T,) int64，Unix 秒，升序
+    - values: (实体, 计数器, T) float64，原始单位（未换算），无数据为 NaN
+    """
+
+    def __init__(self, morefs: List[str], counters: List[str], timestamps: np.ndarray, values: np.ndarray):
+        self.morefs = morefs
+        self.counters = counters
+        self.timestamps = timestamps
+        self.values = values
+        self._index = {moref: i for i, moref in enumerate(morefs)}
+
+    def __len__(self) -> int:
+        return len(self.morefs)
+
+    def entity(self, moref: str) -> Optional[np.ndarray]:
+        """单个实体的 (计数器, T) 视图"""
+        i = self._index.get(moref)
+        return None if i is None else self.values[i]
+
+    @classmethod
+    def empty(cls, counters: List[str]) -> "PerfResult":
+        return cls([], counters, np.empty(0, dtype=np.int64), np.empty((0, len(counters), 0)))
+
+
+class PerfQuery:
+    def __init__(self, max_metrics: int = 256):
+        # 单次 QueryPerf 最多查询的 实体 x 计数器 数
+        self.max_metrics = max_metrics
+        self._lock = threading.Lock()
+        # host_ip -> (版本键, {计数器名: counterId})
+        self._counters: Dict[str, Tuple[Tuple[str, str], Dict[str, int]]] = {}
+        # host_ip -> (版本键, 单次上限)
+        self._limits: Dict[str, Tuple[Tuple[str, str], int]] = {}
+
+    # ---------- 计数器 / 上限缓存 ----------
+
+    @staticmethod
+    def _version_key(content) -> Tuple[str, str]:
+        about = content.about
+        return (getattr(about, "instanceUuid", None) or "", getattr(about, "build", None) or "")
+
+    def counter_ids(self, content, host_ip: str) -> Dict[str, int]:
+        """{group.name.rollup: counterId}；同一主机版本只读取一次 perfCounter 列表"""
+        version = self._version_key(content)
+        cached = self._counters.get(host_ip)
+        if cached and cached[0] == version:
+            return cached[1]
+        ids = {
+            f"{c.groupInfo.key}.{c.nameInfo.key}.{c.rollupType}": c.key
+            for c in content.perfManager.perfCounter or []
+        }
+        with self._lock:
+            self._counters[host_ip] = (version, ids)
+        print(f"[Perf] {host_ip} resolved {len(ids)} counters (build {version[1] or '-'})")
+        return ids
+
+    def query_limit(self, content, host_ip: str) -> int:
+        version = self._version_key(content)
+        cached = self._limits.get(host_ip)
+        if cached and cached[0] == version:
+            return cached[1]
+        limit = self.max_metrics
+        try:
+            options = content.setting.QueryOptions(_LIMIT_OPTION) if content.setting else []
+            if options:
+                value = int(options[0].value)
+                # -1 表示不限制；仍按配置值分批，避免单个响应过大
+                if value > 0:
+                    limit = min(limit, value)
+        except Exception:
+            pass
+        with self._lock:
+            self._limits[host_ip] = (version, limit)
+        return limit
+
+    def invalidate(self, host_ip: str):
+        with self._lock:
+            self._counters.pop(host_ip, None)
+            self._limits.pop(host_ip, None)
+
+    # ---------- 查询 ----------
+
+    def build_specs(
+        self,
+        entities: Sequence,
+        counter_keys: Sequence[int],
+        limit: int,
+        interval_id: int = REALTIME_INTERVAL,
+        start_time: Optional[datetime] = None,
+        max_sample: Optional[int] = None,
+    ) -> List[List]:
+        """每个实体一个 QuerySpec，按 实体数 x 计数器数 <= limit 分批"""
+        metric_ids = [vim.PerformanceManager.MetricId(counterId=key, instance="") for key in counter_keys]
+        window = {}
+        if start_time is not None:
+            window["startTime"] = start_time
+        if max_sample is not None:
+            window["maxSample"] = max_sample
+        specs = [
+            vim.PerformanceManager.QuerySpec(
+                entity=entity, metricId=metric_ids, intervalId=interval_id, format="normal", **window
+            )
+            for entity in entities
+        ]
+        per_batch = max(1, limit // max(1, len(metric_ids)))
+        return [specs[i : i + per_batch] for i in range(0, len(specs), per_batch)]
+
+    def query(
+        self,
+        content,
+        host_ip: str,
+        entities: Sequence,
+        counters: Sequence[str],
+        interval_id: int = REALTIME_INTERVAL,
+        start_time: Optional[datetime] = None,
+        max_sample: Optional[int] = None,
+    ) -> PerfResult:
+        """批量查询 entities 的 counters（计数器全名，不存在的计数器对应行全为 NaN），汇总 instance="" 的值"""
+        counters = list(counters)
+        ids = self.counter_ids(content, host_ip)
+        rows = {ids[name]: i for i, name in enumerate(counters) if name in ids}
+        if not entities or not rows:
+            return PerfResult.empty(counters)
+
+        perf_manager = content.perfManager
+        batches = self.build_specs(
+            entities, list(rows), self.query_limit(content, host_ip), interval_id, start_time, max_sample
+        )
+        results = []
+        for specs in batches:
+            results.extend(perf_manager.QueryPerf(querySpec=specs) or [])
+        return self.decode(results, rows, counters)
+
+    @staticmethod
+    def decode(results, rows: Dict[int, int], counters: List[str]) -> PerfResult:
+        """EntityMetric 列表 -> PerfResult（各实体的采样按时间对齐到并集时间轴）"""
+        decoded = []
+        for entity_metric in results:
+            infos = entity_metric.sampleInfo or []
+            if not infos:
+                continue
+            stamps = np.fromiter((int(info.timestamp.timestamp()) for info in infos), dtype=np.int64, count=len(infos))
+            block = np.full((len(counters), len(infos)), np.nan)
+            for series in entity_metric.value or []:
+                row = rows.get(series.id.counterId)
+                if row is None or series.id.instance:
+                    continue
+                values = np.asarray(series.value, dtype=np.float64)[: len(infos)]
+                block[row, : len(values)] = values
+            decoded.append((entity_metric.entity._GetMoId(), stamps, block))
+        if not decoded:
+            return PerfResult.empty(counters)
+
+        timestamps = np.unique(np.concatenate([stamps for _, stamps, _ in decoded]))
+        values = np.full((len(decoded), len(counters), len(timestamps)), np.nan)
+        for i, (_, stamps, block) in enumerate(decoded):
+            values[i][:, np.searchsorted(timestamps, stamps)] = block
+        # -1 表示该时间点无数据
+        values[values < 0] = np.nan
+        return PerfResult([moref for moref, _, _ in decoded], counters, timestamps, values)
+
+
+perf_query = PerfQuery(max_metrics=int(os.getenv("PERF_QUERY_MAX_METRICS", "256")))
@@ -0,0 +1,138 @@
+"""
+任务状态进程内发布/订阅：update_task 等写库后发布任务快照，SSE 客户端订阅推送，
+保留最近 N 条事件供断线重连按游标补发，客户端之间无任务变化时不再查询数据库。
+事件 ID 形如 "<进程纪元>:<序号>"：序号随进程重启归零，纪元不同（或格式无法识别）的游标一律回落为全量快照。
+"""
+import asyncio
+import os
+import threading
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.schemas.task import TaskBase
+
+
+class _Subscriber:
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_pending: int):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def push(self, event: Tuple[int, Dict[str, Any]]):
+        # 在订阅者所在事件循环中执行；积压过多时标记溢出，由连接发送 reset 让客户端重新拉取
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class TaskEventBus:
+    def __init__(self, buffer_size: int = 1000, max_pending: int = 500):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # 进程纪元：区分重启前后的序号
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._events: deque = deque(maxlen=buffer_size)
+        self._subscribers: List[_Subscriber] = []
+        self._watch_thread: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+
+    @property
+    def cursor(self) -> int:
+        return self._seq
+
+    def event_id(self, seq: int) -> str:
+        """序号 -> 对外的事件 ID（SSE id / Last-Event-ID）"""
+        return f"{self.epoch}:{seq}"
+
+    def parse_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        """事件 ID -> 本进程序号；为空、格式不符或来自其他进程纪元时返回 None（应发送全量快照）"""
+        if not event_id:
+            return None
+        epoch, sep, seq = event_id.partition(":")
+        if not sep or epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, task) -> int:
+        """发布任务当前状态（Task ORM 对象或字典），返回事件序号；可在任意线程调用"""
+        data = TaskBase.model_validate(task).model_dump(mode="json") if not isinstance(task, dict) else task
+        with self._lock:
+            self._seq += 1
+            event = (self._seq, data)
+            self._events.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.loop.call_soon_threadsafe(sub.push, event)
+            except RuntimeError:
+                # 事件循环已关闭
+                self.unsubscribe(sub)
+        return event[0]
+
+    def subscribe(self, cursor: Optional[int] = None) -> Tuple[_Subscriber, Optional[List[Tuple[int, Dict[str, Any]]]]]:
+        """注册订阅者；返回 (订阅者, 需补发的事件)。游标已超出缓冲区时补发为 None，调用方应发送全量快照"""
+        sub = _Subscriber(asyncio.get_running_loop(), self.max_pending)
+        with self._lock:
+            self._subscribers.append(sub)
+            if cursor is None or cursor > self._seq:
+                return sub, None
+            if cursor == self._seq:
+                return sub, []
+            oldest = self._events[0][0] if self._events else self._seq + 1
+            if cursor + 1 < oldest:
+                return sub, None
+            return sub, [event for event in self._events if event[0] > cursor]
+
+    def unsubscribe(self, sub: _Subscriber):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    # ---------- 跨进程 worker 的兜底 ----------
+
+    def start_db_watch(self, interval: float = 2):
+        """worker 以独立进程运行时，本进程收不到其发布的事件：由单个线程按 updated_at 轮询变化并转发，
+        轮询开销与客户端数量无关"""
+        if self._watch_thread is not None:
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._db_watch_loop, args=(interval,), name="task-events-db", daemon=True)
+        self._watch_thread.start()
+
+    def stop_db_watch(self):
+        self._watch_stop.set()
+        self._watch_thread = None
+
+    def _db_watch_loop(self, interval: float):
+        from app.db import SessionLocal
+        from app.models.task import Task
+
+        # updated_at 由数据库 CURRENT_TIMESTAMP 生成（秒级），按回看窗口 + 指纹去重
+        since = datetime.now(timezone.utc).replace(tzinfo=None)
+        seen: Dict[str, tuple] = {}
+        while not self._watch_stop.wait(interval):
+            db = SessionLocal()
+            try:
+                rows = db.query(Task).filter(Task.updated_at >= since - timedelta(seconds=2)).all()
+                for task in rows:
+                    fingerprint = (task.status, task.progress, task.message, task.updated_at)
+                    if seen.get(task.id) != fingerprint:
+                        seen[task.id] = fingerprint
+                        self.publish(task)
+                if rows:
+                    since = max(task.updated_at for task in rows)
+                if len(seen) > 10000:
+                    seen.clear()
+            except Exception as e:
+                print(f"[TaskEvents] db watch failed: {e}")
+            finally:
+                db.close()
+
+
+task_events = TaskEventBus(
+    buffer_size=int(os.getenv("TASK_EVENT_BUFFER", "1000")),
+)
@@ -1,22 +1,64 @@
+import os
+import threading
 import uuid
+from datetime import datetime, timezone
 from typing import Optional, Any, List, Dict
+from sqlalchemy import update
 from sqlalchemy.orm import Session
+from app.db import SessionLocal
 from app.models.task import Task
+from app.schemas.task import TaskBase
+from app.services.task_events import task_events
+
+# 结束状态：之后到达的进度类更新一律丢弃
+TERMINAL_STATUSES = ("success", "failed")
 
 
 class AsyncTaskService:
-    def create_task(self, db: Session, type: str, target_id: Optional[str] = None, message: str = "") -> Task:
+    """任务记录读写。
+
+    进度类更新（progress/message/result）先写入内存中的最新状态并立即推送给订阅者，
+    由后台线程按 flush_interval 合并为一个事务落库；状态变化（running/success/failed）立即落库。
+    读取时用内存状态覆盖数据库中尚未刷新的字段。
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        # task_id -> 最新完整状态（TaskBase 字段），仅保存有缓冲写入的活跃任务
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        # task_id -> 尚未落库的字段
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        # 状态写入 / forget 计数：无锁读取基线期间若发生变化，说明基线可能已过期
+        self._generation = 0
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def create_task(
+        self,
+        db: Session,
+        type: str,
+        target_id: Optional[str] = None,
+        message: str = "",
+        payload: Optional[Dict[str, Any]] = None,
+        max_attempts: int = 1,
+        task_id: Optional[str] = None,
+    ) -> Task:
         task = Task(
-            id=str(uuid.uuid4()),
+            id=task_id or str(uuid.uuid4()),
             type=type,
             target_id=target_id,
             status="pending",
             progress=0,
             message=message,
+            payload=payload,
+            attempts=0,
+            max_attempts=max_attempts,
         )
         db.add(task)
         db.commit()
         db.refresh(task)
+        task_events.publish(task)
         return task
 
     def update_task(
@@ -27,23 +69,144 @@ class AsyncTaskService:
         progress: Optional[int] = None,
         message: Optional[str] = None,
         result: Optional[Any] = None,
-    ) -> Optional[Task]:
-        task = db.query(Task).filter(Task.id == task_id).first()
-        if not task:
-            return None
-        if status:
-            task.status = status
+    ) -> Optional[Dict[str, Any]]:
+        fields: Dict[str, Any] = {}
         if progress is not None:
-            task.progress = progress
+            fields["progress"] = progress
         if message is not None:
-            task.message = message
+            fields["message"] = message
         if result is not None:
-            task.result = result
+            fields["result"] = result
+
+        if status:
+            return self._write_now(db, task_id, status, fields)
+        if not fields:
+            return self._latest.get(task_id)
+
+        while True:
+            with self._lock:
+                latest = self._latest.get(task_id)
+                generation = self._generation
+            if latest is None:
+                # 首次缓冲写入：读取一次完整记录作为内存基线
+                task = db.query(Task).populate_existing().filter(Task.id == task_id).first()
+                if not task:
+                    return None
+                latest = TaskBase.model_validate(task).model_dump()
+                if latest["status"] in TERMINAL_STATUSES:
+                    return latest
+            with self._lock:
+                if task_id not in self._latest and self._generation != generation:
+                    # 读取期间任务被 _write_now / forget 处理过：重新读取基线，避免把旧状态放回内存
+                    continue
+                latest = self._latest.setdefault(task_id, latest)
+                latest.update(fields)
+                latest["updated_at"] = datetime.now(timezone.utc)
+                self._dirty.setdefault(task_id, {}).update(fields)
+                snapshot = dict(latest)
+            break
+        task_events.publish(TaskBase.model_validate(snapshot).model_dump(mode="json"))
+        self._ensure_flusher()
+        return snapshot
+
+    def _write_now(self, db: Session, task_id: str, status: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """状态变化：连同尚未落库的进度一起立即提交"""
+        with self._lock:
+            pending = self._dirty.pop(task_id, {})
+            self._latest.pop(task_id, None)
+            self._generation += 1
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task:
+            return None
+        for key, value in {**pending, **fields, "status": status}.items():
+            setattr(task, key, value)
         db.commit()
+        if status in TERMINAL_STATUSES:
+            # 提交前并发进入缓冲的进度已过期，丢弃
+            with self._lock:
+                self._dirty.pop(task_id, None)
+                self._latest.pop(task_id, None)
+                self._generation += 1
         db.refresh(task)
-        return task
+        task_events.publish(task)
+        return TaskBase.model_validate(task).model_dump()
+
+    # ---------- 缓冲刷新 ----------
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._stop.clear()
+                self._flusher = threading.Thread(target=self._flush_loop, name="task-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[Task] flush failed: {e}")
+
+    def flush(self, task_id: Optional[str] = None) -> int:
+        """把缓冲的进度字段在一个事务内写库；指定 task_id 时只刷新该任务"""
+        with self._lock:
+            if task_id is not None:
+                batch = {task_id: self._dirty.pop(task_id)} if task_id in self._dirty else {}
+            else:
+                batch, self._dirty = self._dirty, {}
+        if not batch:
+            return 0
+        db = SessionLocal()
+        finished = []
+        try:
+            for tid, fields in batch.items():
+                matched = db.execute(
+                    update(Task).where(Task.id == tid, Task.status.notin_(TERMINAL_STATUSES)).values(**fields)
+                ).rowcount
+                if not matched:
+                    finished.append(tid)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # 写入失败：放回缓冲，期间产生的更新值优先
+            with self._lock:
+                for tid, fields in batch.items():
+                    self._dirty[tid] = {**fields, **self._dirty.get(tid, {})}
+            raise
+        finally:
+            db.close()
+        if finished:
+            # 任务已结束（或已删除）：丢弃其内存状态，读取回落到数据库
+            with self._lock:
+                for tid in finished:
+                    if tid not in self._dirty:
+                        self._latest.pop(tid, None)
+        return len(batch)
+
+    def forget(self, task_id: str):
+        """外部（如任务队列的条件 UPDATE）直接改写了任务行：先落库缓冲字段，再丢弃内存状态"""
+        try:
+            self.flush(task_id)
+        except Exception as e:
+            print(f"[Task] flush {task_id} failed: {e}")
+        with self._lock:
+            self._latest.pop(task_id, None)
+            self._generation += 1
+
+    def close(self):
+        self._stop.set()
+        self._flusher = None
+        self.flush()
+
+    # ---------- 读取 ----------
 
-    def get_task(self, db: Session, task_id: str) -> Optional[Task]:
+    def get_task(self, db: Session, task_id: str):
+        with self._lock:
+            latest = self._latest.get(task_id)
+            if latest is not None:
+                return dict(latest)
         return db.query(Task).filter(Task.id == task_id).first()
 
     def list_tasks(
@@ -60,8 +223,11 @@ class AsyncTaskService:
         if type:
             query = query.filter(Task.type == type)
         total = query.count()
-        items = query.order_by(Task.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+        items: List[Any] = query.order_by(Task.created_at.desc()).offset((page - 1) * page_size).limit(page_size).all()
+        with self._lock:
+            if self._latest:
+                items = [dict(self._latest[task.id]) if task.id in self._latest else task for task in items]
         return {"total": total, "items": items}
 
 
-task_service = AsyncTaskService()
+task_service = AsyncTaskService(flush_interval=float(os.getenv("TASK_FLUSH_INTERVAL", "1")))
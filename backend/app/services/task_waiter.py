@@ -0,0 +1,241 @@
+"""
+vSphere 任务等待器：每个会话一个私有 PropertyCollector + 调度线程，
+通过 WaitForUpdatesEx 监听 info.state/info.progress，同时等待多个任务，任务结束即唤醒对应等待方。
+WaitForUpdatesEx 出错（如短暂断线）时先按原版本重试，再重建 PropertyCollector 与全部过滤器从头续等，
+恢复失败才让所有等待中的任务失败。
+"""
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from pyVmomi import vim, vmodl
+
+TASK_PROPERTIES = ["info.state", "info.progress", "info.error", "info.result"]
+
+
+class _TaskWatch:
+    def __init__(self, task, future: Future, on_progress=None, question_vm=None, on_question=None):
+        self.task = task
+        self.future = future
+        self.on_progress = on_progress
+        self.question_vm = question_vm
+        self.on_question = on_question
+        self.filter = None
+        # 创建 filter 时所用的 PropertyCollector（重建 collector 后据此判断是否需要补建）
+        self.collector = None
+        self.props: Dict[str, Any] = {}
+        self.progress: Optional[int] = None
+
+
+class TaskWaiter:
+    def __init__(self, si, wait_seconds: int = 30, max_retries: int = 3, retry_delay: float = 2):
+        self._si = si
+        self.wait_seconds = wait_seconds
+        # 连续出错的恢复次数上限与间隔（秒，逐次翻倍）
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._collector = si.RetrieveContent().propertyCollector.CreatePropertyCollector()
+        self._lock = threading.Lock()
+        self._watches: Dict[str, _TaskWatch] = {}
+        # VM moref -> 等待该 VM 提问的任务（同一台 VM 可能同时有多个任务）
+        self._vm_watches: Dict[str, List[_TaskWatch]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _filter_spec(self, task, question_vm=None):
+        PC = vim.PropertyCollector
+        obj_set = [PC.ObjectSpec(obj=task, skip=False)]
+        prop_set = [PC.PropertySpec(type=vim.Task, pathSet=TASK_PROPERTIES, all=False)]
+        if question_vm is not None:
+            obj_set.append(PC.ObjectSpec(obj=question_vm, skip=False))
+            prop_set.append(PC.PropertySpec(type=vim.VirtualMachine, pathSet=["runtime.question"], all=False))
+        return PC.FilterSpec(objectSet=obj_set, propSet=prop_set)
+
+    def track(
+        self,
+        task,
+        on_progress: Optional[Callable[[int], None]] = None,
+        question_vm=None,
+        on_question: Optional[Callable[[Any], None]] = None,
+    ) -> Future:
+        """登记任务，返回在任务成功（result）或失败（exception）时完成的 Future"""
+        future: Future = Future()
+        watch = _TaskWatch(task, future, on_progress, question_vm, on_question)
+        task_id = task._GetMoId()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("TaskWaiter 已关闭")
+            self._watches[task_id] = watch
+            if question_vm is not None:
+                self._vm_watches.setdefault(question_vm._GetMoId(), []).append(watch)
+            collector = self._collector
+        try:
+            watch.filter = collector.CreateFilter(self._filter_spec(task, question_vm), partialUpdates=False)
+            watch.collector = collector
+        except Exception:
+            self._forget(task_id)
+            raise
+        with self._lock:
+            finished = task_id not in self._watches
+        if finished:
+            # 任务在 CreateFilter 返回前已被调度线程处理完毕
+            try:
+                watch.filter.DestroyPropertyFilter()
+            except Exception:
+                pass
+            return future
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="task-waiter", daemon=True)
+                self._thread.start()
+        return future
+
+    def untrack(self, task):
+        """放弃等待（如超时），销毁对应 PropertyFilter"""
+        self._forget(task._GetMoId())
+
+    def _forget(self, task_id: str):
+        with self._lock:
+            watch = self._watches.pop(task_id, None)
+            if watch and watch.question_vm is not None:
+                vm_id = watch.question_vm._GetMoId()
+                others = [w for w in self._vm_watches.get(vm_id, []) if w is not watch]
+                if others:
+                    self._vm_watches[vm_id] = others
+                else:
+                    self._vm_watches.pop(vm_id, None)
+        if watch and watch.filter is not None:
+            try:
+                watch.filter.DestroyPropertyFilter()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            watches = list(self._watches.values())
+        for watch in watches:
+            if not watch.future.done():
+                watch.future.set_exception(RuntimeError("ESXi 会话已关闭，任务等待中断"))
+        try:
+            self._collector.CancelWaitForUpdates()
+        except Exception:
+            pass
+        try:
+            self._collector.DestroyPropertyCollector()
+        except Exception:
+            pass
+
+    # ---------- 调度线程 ----------
+
+    def _run(self):
+        version = ""
+        options = vim.WaitOptions(maxWaitSeconds=self.wait_seconds)
+        failures = 0
+        while True:
+            with self._lock:
+                if self._closed or not self._watches:
+                    self._thread = None
+                    return
+                collector = self._collector
+            try:
+                update = collector.WaitForUpdatesEx(version, options)
+            except Exception as e:
+                with self._lock:
+                    if self._closed:
+                        self._thread = None
+                        return
+                failures += 1
+                if failures > self.max_retries:
+                    self._fail_all(e)
+                    return
+                print(f"[TaskWaiter] WaitForUpdatesEx failed ({failures}/{self.max_retries}): {e}")
+                time.sleep(self.retry_delay * 2 ** (failures - 1))
+                # 首次出错按原版本续等；再次出错（或 collector 已失效）则重建 collector，从头获取全部任务的当前状态
+                if failures > 1 or isinstance(e, vmodl.fault.ManagedObjectNotFound):
+                    try:
+                        self._rebuild()
+                    except Exception as rebuild_error:
+                        print(f"[TaskWaiter] rebuild collector failed: {rebuild_error}")
+                        continue
+                    version = ""
+                continue
+            failures = 0
+            if update is None:
+                continue
+            version = update.version
+            for filter_update in update.filterSet or []:
+                for obj_update in filter_update.objectSet or []:
+                    self._dispatch(obj_update)
+
+    def _rebuild(self):
+        """新建 PropertyCollector 并为所有等待中的任务补建过滤器（partialUpdates=False，首个结果即完整状态）"""
+        collector = self._si.RetrieveContent().propertyCollector.CreatePropertyCollector()
+        with self._lock:
+            old, self._collector = self._collector, collector
+            watches = list(self._watches.values())
+        for watch in watches:
+            if watch.collector is collector:
+                continue
+            watch.filter = collector.CreateFilter(self._filter_spec(watch.task, watch.question_vm), partialUpdates=False)
+            watch.collector = collector
+        try:
+            old.DestroyPropertyCollector()
+        except Exception:
+            pass
+        print(f"[TaskWaiter] collector rebuilt, {len(watches)} task(s) re-registered")
+
+    def _fail_all(self, error: Exception):
+        with self._lock:
+            self._thread = None
+            watches = list(self._watches.values())
+        for watch in watches:
+            if not watch.future.done():
+                watch.future.set_exception(error)
+            self._forget(watch.task._GetMoId())
+
+    def _dispatch(self, obj_update):
+        moref = obj_update.obj._GetMoId()
+        changes = {change.name: change.val for change in obj_update.changeSet or []}
+
+        if isinstance(obj_update.obj, vim.VirtualMachine):
+            question = changes.get("runtime.question")
+            with self._lock:
+                # 同一提问只需回答一次：交给最早登记且带回调的任务
+                watch = next((w for w in self._vm_watches.get(moref, []) if w.on_question), None)
+            if watch and question:
+                try:
+                    watch.on_question(question)
+                except Exception as e:
+                    print(f"[TaskWaiter] answer question failed: {e}")
+            return
+
+        watch = self._watches.get(moref)
+        if not watch:
+            return
+        watch.props.update(changes)
+        progress = watch.props.get("info.progress")
+        if progress is not None and progress != watch.progress:
+            watch.progress = progress
+            if watch.on_progress:
+                try:
+                    watch.on_progress(progress)
+                except Exception as e:
+                    print(f"[TaskWaiter] progress callback failed: {e}")
+
+        state = watch.props.get("info.state")
+        if state == vim.TaskInfo.State.success:
+            if watch.on_progress and watch.progress != 100:
+                try:
+                    watch.on_progress(100)
+                except Exception:
+                    pass
+            self._forget(moref)
+            if not watch.future.done():
+                watch.future.set_result(watch.props.get("info.result"))
+        elif state == vim.TaskInfo.State.error:
+            self._forget(moref)
+            err = watch.props.get("info.error")
+            if not watch.future.done():
+                watch.future.set_exception(Exception(str(err) if err else "unknown error"))
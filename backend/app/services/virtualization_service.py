@@ -1,31 +1,112 @@
-import ssl
-import atexit
 import os
 import time
+import threading
 import ipaddress
-from typing import List, Optional, Tuple
+import http.client
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from pyVim.connect import SmartConnect, Disconnect
 from pyVmomi import vim
 
+from app.db import SessionLocal
+from app.db.upsert import load_rows, diff_rows, bulk_upsert
 from app.models.virtualization import EsxiHost, VirtualMachine, Datastore
+from app.services.esxi_session_pool import esxi_session_pool, EsxiConnectionError
+from app.services.inventory_aggregates import apply_vm_changes, refresh_aggregates, refresh_storage_aggregates
+from app.services.esxi_inventory import (
+    VM_PROPERTIES,
+    HOST_PROPERTIES,
+    DATASTORE_PROPERTIES,
+    retrieve_inventory,
+    retrieve_object,
+    build_vm_fields,
+    build_host_fields,
+    build_host_storage_fields,
+    build_datastore_fields,
+    VM_COLUMNS,
+    DATASTORE_COLUMNS,
+)
+
+# 等待任务期间的连接 / 认证异常：原样抛出，会话池据此丢弃失效会话，任务队列据此判断是否重试
+_CONNECTION_ERRORS = (EsxiConnectionError, vim.fault.NotAuthenticated, OSError, http.client.HTTPException)
+
+# power_vm 支持的动作（不区分大小写，含别名）
+POWER_ACTIONS = {
+    "poweron", "on", "start",
+    "shutdown", "shutdownguest", "guestshutdown",
+    "poweroff", "off", "halt",
+    "reboot", "rebootguest",
+    "reset", "hardreset",
+}
+
+
+class _CopyProgress:
+    """按磁盘容量加权汇总多个 CopyVirtualDisk_Task 的进度，并推导吞吐与 ETA（回调线程安全）"""
+
+    def __init__(self, disk_sizes: dict, start_pct: int, end_pct: int):
+        self.disk_sizes = {k: max(v, 1) for k, v in disk_sizes.items()}
+        self.total_bytes = sum(self.disk_sizes.values())
+        self.start_pct = start_pct
+        self.end_pct = end_pct
+        self.started_at = time.time()
+        self._done = {k: 0 for k in disk_sizes}
+        self._lock = threading.Lock()
+        self.reported_pct = None
+
+    def update(self, key: str, pct: int):
+        with self._lock:
+            self._done[key] = max(self._done.get(key, 0), min(int(pct or 0), 100))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            done_bytes = sum(self.disk_sizes[k] * pct / 100 for k, pct in self._done.items())
+        ratio = done_bytes / self.total_bytes if self.total_bytes else 1
+        elapsed = max(time.time() - self.started_at, 0.001)
+        throughput = done_bytes / elapsed
+        eta = int((self.total_bytes - done_bytes) / throughput) if throughput > 0 else None
+        return {
+            "progress": self.start_pct + int((self.end_pct - self.start_pct) * ratio),
+            "percent": round(ratio * 100, 1),
+            "total_gb": round(self.total_bytes / (1024 ** 3), 2),
+            "copied_gb": round(done_bytes / (1024 ** 3), 2),
+            "throughput_mb_s": round(throughput / (1024 ** 2), 1),
+            "eta_seconds": eta,
+        }
+
 
 class VirtualizationService:
     def __init__(self):
-        # 忽略 SSL 警告
-        self.ssl_context = ssl._create_unverified_context()
+        self.sync_host_timeout = int(os.getenv("ESXI_SYNC_HOST_TIMEOUT", "300"))
+        # 整轮全量同步的截止时间（从开始计），到期仍在排队的主机直接取消
+        self.sync_total_timeout = int(os.getenv("ESXI_SYNC_TOTAL_TIMEOUT", "600"))
+        # 克隆进度写库最小间隔（秒），避免高频进度回调压垮数据库
+        self.progress_interval = float(os.getenv("CLONE_PROGRESS_INTERVAL", "3"))
+        # 克隆时每个数据存储上同时进行的磁盘复制数
+        self.copy_per_datastore = int(os.getenv("CLONE_COPY_PER_DATASTORE", "2"))
+        # 各数据存储上进行中的复制数：所有克隆请求 / 批量克隆子任务共享同一份计数
+        self._copy_slots = threading.Condition()
+        self._copy_active: Dict[str, int] = {}
+        # 批量克隆流水线各阶段的并发上限
+        self.batch_stage_limits = {
+            "copy": int(os.getenv("BATCH_CLONE_COPY_CONCURRENCY", "2")),
+            "register": int(os.getenv("BATCH_CLONE_REGISTER_CONCURRENCY", "4")),
+            "power_on": int(os.getenv("BATCH_CLONE_POWER_CONCURRENCY", "4")),
+            "guest_ip": int(os.getenv("BATCH_CLONE_GUEST_CONCURRENCY", "4")),
+        }
+        # 批量电源操作：单台主机上同时执行的电源动作数
+        self.bulk_power_per_host = int(os.getenv("BULK_POWER_PER_HOST", "4"))
+        self._sync_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("ESXI_SYNC_WORKERS", "8")),
+            thread_name_prefix="host-sync",
+        )
+        # 已提交且尚未结束的主机同步（含超时后仍在后台运行的），同一主机同时最多一个
+        self._sync_lock = threading.Lock()
+        self._sync_inflight: Set[int] = set()
 
-    def _get_connection(self, ip, user, pwd, port=443):
-        try:
-            print(f"[Debug] Connecting to {ip} port {port} user {user}")
-            si = SmartConnect(host=ip, user=user, pwd=pwd, port=port, sslContext=self.ssl_context)
-            atexit.register(Disconnect, si)
-            print(f"[Debug] Connected to {ip}")
-            return si
-        except Exception as e:
-            print(f"[Error] Failed to connect to {ip}: {e}")
-            return None
+    def _session(self, ip, user, pwd, port=443):
+        """从会话池借出 ESXi 会话（with 语句），连接失败抛 EsxiConnectionError"""
+        return esxi_session_pool.session(ip, user, pwd, port)
 
     def _resolve_credentials(self, host: EsxiHost, user_override: Optional[str] = None, pwd_override: Optional[str] = None):
         user = user_override or host.username or os.getenv("ESXI_USER", "root")
@@ -35,10 +116,121 @@ class VirtualizationService:
             raise ValueError("缺少 ESXi 密码，请传递 password 或配置 ESXI_PASSWORD")
         return user, pwd
 
-    def _wait_task(self, task, task_name: str, timeout: int = 1800):
-        """轮询等待 vSphere 任务完成"""
+    def _wait_task(self, task, task_name: str, timeout: int = 1800, on_progress=None, question_vm=None):
+        """等待 vSphere 任务完成：基于会话级 PropertyCollector 事件唤醒，可回调真实进度并自动回答 VM 提问"""
+        waiter = esxi_session_pool.task_waiter(task)
+        if waiter is None:
+            return self._poll_task(task, task_name, timeout, question_vm)
+        on_question = (lambda q: self._answer_vm_question(question_vm)) if question_vm is not None else None
+        future = waiter.track(task, on_progress=on_progress, question_vm=question_vm, on_question=on_question)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if future.done():
+                # 任务自身以超时类异常（如 socket 超时）结束，属于连接异常
+                raise
+            waiter.untrack(task)
+            raise TimeoutError(f"{task_name} 超时")
+        except _CONNECTION_ERRORS:
+            raise
+        except Exception as e:
+            raise Exception(f"{task_name} 失败: {e}") from e
+
+    def _track_task(self, task, task_name: str, on_progress=None) -> Future:
+        """登记任务并立即返回 Future；会话不在池中时同步轮询后返回已完成的 Future"""
+        waiter = esxi_session_pool.task_waiter(task)
+        if waiter is not None:
+            return waiter.track(task, on_progress=on_progress)
+        future: Future = Future()
+        try:
+            future.set_result(self._poll_task(task, task_name))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _acquire_copy_slots(self, datastores) -> bool:
+        """同时占用 datastores 上各一个复制名额；任一已满则不占用并返回 False"""
+        with self._copy_slots:
+            if any(self._copy_active.get(ds, 0) >= self.copy_per_datastore for ds in datastores):
+                return False
+            for ds in datastores:
+                self._copy_active[ds] = self._copy_active.get(ds, 0) + 1
+            return True
+
+    def _release_copy_slots(self, datastores):
+        with self._copy_slots:
+            for ds in datastores:
+                remaining = self._copy_active.get(ds, 0) - 1
+                if remaining > 0:
+                    self._copy_active[ds] = remaining
+                else:
+                    self._copy_active.pop(ds, None)
+            self._copy_slots.notify_all()
+
+    def _run_copy_jobs(self, jobs: List[dict], on_tick=None):
+        """并发执行复制任务，同一数据存储上同时进行的复制不超过 copy_per_datastore（跨所有调用方计数）；
+        任一失败则取消其余并抛出
+
+        job: name / datastores（占用名额的数据存储集合）/ start（发起任务，返回 vim.Task）/
+             on_progress / on_done（可选回调）/ timeout（秒）
+        """
+        queued = list(jobs)
+        running = {}
+        try:
+            while queued or running:
+                for job in list(queued):
+                    if not self._acquire_copy_slots(job["datastores"]):
+                        continue
+                    queued.remove(job)
+                    print(f"[Clone] 开始 {job['name']}")
+                    try:
+                        task = job["start"]()
+                    except Exception:
+                        self._release_copy_slots(job["datastores"])
+                        raise
+                    future = self._track_task(task, job["name"], on_progress=job.get("on_progress"))
+                    running[future] = (job, task, time.time())
+
+                if running:
+                    done, _ = wait(set(running.keys()), timeout=self.progress_interval, return_when=FIRST_COMPLETED)
+                else:
+                    # 名额全被其他调用方占用：等待释放通知
+                    with self._copy_slots:
+                        self._copy_slots.wait(self.progress_interval)
+                    done = set()
+                for future in done:
+                    job, _, _ = running.pop(future)
+                    self._release_copy_slots(job["datastores"])
+                    err = future.exception()
+                    if isinstance(err, _CONNECTION_ERRORS):
+                        raise err
+                    if err is not None:
+                        raise Exception(f"{job['name']} 失败: {err}") from err
+                    if job.get("on_done"):
+                        job["on_done"]()
+                now = time.time()
+                for job, _, started in running.values():
+                    if now - started > job.get("timeout", 3600):
+                        raise TimeoutError(f"{job['name']} 超时")
+                if on_tick:
+                    on_tick()
+        except Exception:
+            for future, (job, task, _) in running.items():
+                try:
+                    task.CancelTask()
+                except Exception:
+                    pass
+            raise
+        finally:
+            for job, _, _ in running.values():
+                self._release_copy_slots(job["datastores"])
+
+    def _poll_task(self, task, task_name: str, timeout: int = 1800, question_vm=None):
+        """轮询等待 vSphere 任务完成（会话不在池中时的兜底）"""
         start = time.time()
         while task.info.state in [vim.TaskInfo.State.queued, vim.TaskInfo.State.running]:
+            if question_vm is not None and question_vm.runtime.question:
+                self._answer_vm_question(question_vm)
             if time.time() - start > timeout:
                 raise TimeoutError(f"{task_name} 超时")
             time.sleep(2)
@@ -56,10 +248,27 @@ class VirtualizationService:
         rel = path[path.find("]") + 1 :].strip()
         return ds, rel
 
+    def _vm_from_moref(self, content, vm: VirtualMachine):
+        """按缓存的 moref 直接构造 VM 对象，并用一次属性读取校验其仍存在且 UUID 未变（moref 可能被复用）"""
+        if not vm.moref:
+            return None
+        vm_obj = vim.VirtualMachine(vm.moref, content.propertyCollector._stub)
+        try:
+            props = retrieve_object(content, vm_obj, ["summary.config.uuid"])
+        except Exception as e:
+            print(f"[VM] moref {vm.moref} check failed: {e}")
+            return None
+        if not props or props.get("summary.config.uuid") != vm.uuid:
+            return None
+        return vm_obj
+
     def _find_vm(self, content, dc, vm: VirtualMachine):
-        """在 ESXi 中查找 VM 对象，尝试 instanceUuid/Bios UUID/IP/name 多种方式"""
+        """在 ESXi 中查找 VM 对象：优先使用缓存的 moref，校验失败再依次尝试 instanceUuid/Bios UUID/IP/name"""
+        target = self._vm_from_moref(content, vm)
+        if target:
+            return target
+
         search_index = content.searchIndex
-        target = None
         # 先按 instanceUuid
         try:
             target = search_index.FindByUuid(dc, vm.uuid, True, True)
@@ -83,6 +292,9 @@ class VirtualizationService:
                 target = search_index.FindByDnsName(dc, vm.name, True)
             except Exception:
                 target = None
+        if target:
+            # 更新缓存，随调用方的下一次提交（或随后的 refresh_vm）落库
+            vm.moref = target._GetMoId()
         return target
 
     def _reset_identity_and_nic(self, vm_obj, new_name: str, disconnect_nic: bool = True):
@@ -278,28 +490,25 @@ class VirtualizationService:
 
     def probe_host(self, ip, user, pwd, port=443) -> dict:
         """测试连接并返回基本信息"""
-        si = self._get_connection(ip, user, pwd, port)
-        if not si:
-            return {"success": False, "message": "Connection failed"}
-        
         try:
-            content = si.RetrieveContent()
-            about = content.about
-            return {
-                "success": True,
-                "message": "Connected",
-                "info": {
-                    "hostname": about.name or "localhost",
-                    "vendor": about.vendor,
-                    "model": about.osType,
-                    "version": about.fullName,
-                },
-            }
+            with self._session(ip, user, pwd, port) as si:
+                content = si.RetrieveContent()
+                about = content.about
+                return {
+                    "success": True,
+                    "message": "Connected",
+                    "info": {
+                        "hostname": about.name or "localhost",
+                        "vendor": about.vendor,
+                        "model": about.osType,
+                        "version": about.fullName,
+                    },
+                }
+        except EsxiConnectionError:
+            return {"success": False, "message": "Connection failed"}
         except Exception as e:
             print(f"[Error] Probe failed: {e}")
             return {"success": False, "message": str(e)}
-        finally:
-            Disconnect(si)
 
     def sync_host_vms(self, db: Session, host: EsxiHost, user_override: Optional[str] = None, pwd_override: Optional[str] = None) -> List[VirtualMachine]:
         """同步指定宿主机的 VM 到数据库，同时采集宿主机资源信息"""
@@ -310,240 +519,172 @@ class VirtualizationService:
             print(f"[Sync] Credential error: {e}")
             return []
             
-        si = self._get_connection(host.ip, username, pwd, host.port)
-        if not si:
+        try:
+            with self._session(host.ip, username, pwd, host.port) as si:
+                return self._sync_host_inventory(db, host, si.RetrieveContent())
+        except EsxiConnectionError:
             print(f"[Sync] Connection failed for {host.ip}, marking offline")
             host.status = "offline"
             db.commit()
             return []
 
+    def _sync_host_inventory(self, db: Session, host: EsxiHost, content) -> List[VirtualMachine]:
+        """使用已借出的会话同步宿主机资源、存储与 VM 列表（单次 PropertyCollector 批量拉取）"""
+        now = datetime.now(timezone.utc)
         host.status = "online"
-        host.last_sync_at = datetime.now(timezone.utc)
+        host.last_sync_at = now
 
-        content = si.RetrieveContent()
+        print(f"[Sync] Retrieving inventory from {host.ip}...")
+        inventory = retrieve_inventory(content)
+        host_props = inventory[vim.HostSystem]
+        ds_props = inventory[vim.Datastore]
+        vm_props = inventory[vim.VirtualMachine]
+        print(f"[Sync] Retrieved {len(vm_props)} VMs, {len(ds_props)} datastores from {host.ip}")
 
         # 宿主机资源信息
         try:
-            h_view = content.viewManager.CreateContainerView(content.rootFolder, [vim.HostSystem], True)
-            host_obj = h_view.view[0] if h_view.view else None
-            if host_obj and host_obj.summary:
-                hw = host_obj.summary.hardware
-                quick = host_obj.summary.quickStats
-                
-                print(f"[Debug] Host HW: Cores={hw.numCpuCores}, Mem={hw.memorySize}")
-                
-                total_cpu_mhz = (hw.cpuMhz or 0) * (hw.numCpuCores or 0)
-                used_cpu_mhz = quick.overallCpuUsage or 0
-                host.cpu_usage = round(used_cpu_mhz / total_cpu_mhz * 100, 2) if total_cpu_mhz > 0 else 0
-                host.cpu_cores = hw.numCpuCores
-
-                mem_total_bytes = hw.memorySize or 0
-                mem_used_bytes = (quick.overallMemoryUsage or 0) * 1024 * 1024
-                host.memory_usage = round(mem_used_bytes / mem_total_bytes * 100, 2) if mem_total_bytes > 0 else 0
-                host.memory_total_gb = round(mem_total_bytes / (1024**3), 2) if mem_total_bytes else None
-
-                host.hostname = host_obj.name
-                host.model = hw.model
-                if host_obj.summary.config:
-                    host.version = host_obj.summary.config.product.fullName
-
-                total_cap = 0
-                total_free = 0
-                for ds in host_obj.datastore:
-                    s = getattr(ds, "summary", None)
-                    if not s:
-                        continue
-                    print(f"[Debug] Datastore: {s.name}, Cap={s.capacity}, Free={s.freeSpace}")
-                    total_cap += getattr(s, "capacity", 0) or 0
-                    total_free += getattr(s, "freeSpace", 0) or 0
-                if total_cap:
-                    host.storage_total_gb = round(total_cap / (1024**3), 2)
-                    host.storage_free_gb = round(total_free / (1024**3), 2)
-                
+            if host_props:
+                for key, value in build_host_fields(host_props[0]).items():
+                    setattr(host, key, value)
+                for key, value in build_host_storage_fields(ds_props).items():
+                    setattr(host, key, value)
                 print(f"[Sync] Stats updated: CPU={host.cpu_usage}%, Mem={host.memory_usage}%, Storage={host.storage_free_gb}/{host.storage_total_gb}GB")
 
-                # Sync Datastores
-                for ds in host_obj.datastore:
-                    try:
-                        summary = getattr(ds, "summary", None)
-                        if not summary: continue
-                        
-                        ds_url = summary.url
-                        ds_name = summary.name
-                        ds_type = summary.type
-                        ds_capacity = round(summary.capacity / (1024**3), 2)
-                        ds_free = round(summary.freeSpace / (1024**3), 2)
-                        
-                        # Upsert
-                        db_ds = db.query(Datastore).filter(Datastore.id == ds_url).first()
-                        if not db_ds:
-                            db_ds = Datastore(id=ds_url)
-                            db.add(db_ds)
-                        
-                        db_ds.name = ds_name
-                        db_ds.type = ds_type
-                        db_ds.capacity_gb = ds_capacity
-                        db_ds.free_gb = ds_free
-                        db_ds.last_sync = datetime.now(timezone.utc)
-                        print(f"[Sync] Datastore updated: {ds_name}")
-                        
-                    except Exception as e:
-                        print(f"[Sync] Error syncing datastore: {e}")
-
-            h_view.Destroy()
+            # Sync Datastores：一次加载、内存比对、批量 upsert
+            ds_rows = [f for f in (build_datastore_fields(p) for p in ds_props) if f]
+            if ds_rows:
+                existing_ds = load_rows(db, Datastore, DATASTORE_COLUMNS, Datastore.id.in_([r["id"] for r in ds_rows]))
+                changed_ds = diff_rows(existing_ds, ds_rows, compare=DATASTORE_COLUMNS)
+                for row in changed_ds:
+                    row["last_sync"] = now
+                bulk_upsert(db, Datastore, changed_ds)
         except Exception as e:
             print(f"[Sync] host stats fetch failed for {host.ip}: {e}")
             import traceback
             traceback.print_exc()
 
-        # 获取虚拟机
-        print(f"[Sync] Retrieving VM list from {host.ip}...")
-        container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-        vms_data = []
-
-        vm_list = container.view
-        print(f"[Sync] Found {len(vm_list)} VMs on {host.ip}")
-        try:
-            print(f"[Sync] VM List: {[v.name for v in vm_list]}")
-        except:
-            pass
-
-        for vm in vm_list:
-            try:
-                summary = vm.summary
-                config = summary.config
-                
-                # 尝试获取基本信息，即使 config 为空（如果是新注册 VM，config 可能尚未就绪，但 summary.config 应该有）
-                # 注意：如果 config 为 None，vm.summary.config 也是 None
-                if not config:
-                    # 尝试直接从 vm.config 获取
-                    config = vm.config
-                
-                if not config:
-                    print(f"[Sync] Warning: Skipping VM '{vm.name}' because config is None. State: {vm.runtime.powerState}")
-                    continue
-                    
-                guest = summary.guest
-                runtime = summary.runtime
-
-                vm_id = f"{host.ip}-{config.uuid}"
-                print(f"[Sync] Processing VM: {config.name} (UUID: {config.uuid})")
-
-                status_map = {
-                    "poweredOn": "poweredOn",
-                    "poweredOff": "poweredOff",
-                    "suspended": "suspended",
-                }
-                status = status_map.get(runtime.powerState, "unknown")
-
-                quick = summary.quickStats
-                storage = summary.storage
-                cpu_usage_mhz = getattr(quick, "overallCpuUsage", None)
-                mem_usage_mb = getattr(quick, "guestMemoryUsage", None)
-                uptime_seconds = getattr(quick, "uptimeSeconds", None)
-                tools_status = getattr(guest, "toolsStatus", None)
-                annotation = getattr(config, "annotation", None)
-                committed = getattr(storage, "committed", None) if storage else None
-                uncommitted = getattr(storage, "uncommitted", None) if storage else None
-                disk_used_gb = round(committed / (1024**3), 2) if committed else None
-                if committed is not None and uncommitted is not None:
-                    disk_provisioned_gb = round((committed + uncommitted) / (1024**3), 2)
-                else:
-                    disk_provisioned_gb = None
-
-                vm_obj = VirtualMachine(
-                    id=vm_id,
-                    uuid=config.uuid,
-                    name=config.name,
-                    host_ip=host.ip,
-                    status=status,
-                    ip_address=getattr(guest, "ipAddress", None),
-                    os_name=getattr(guest, "guestFullName", None) or getattr(config, "guestFullName", None),
-                    description=annotation,
-                    cpu_count=config.numCpu,
-                    memory_mb=config.memorySizeMB,
-                    cpu_usage_mhz=cpu_usage_mhz,
-                    memory_usage_mb=mem_usage_mb,
-                    uptime_seconds=uptime_seconds,
-                    disk_used_gb=disk_used_gb,
-                    disk_provisioned_gb=disk_provisioned_gb,
-                    tools_status=tools_status,
-                    last_sync=datetime.now(timezone.utc),
-                )
-
-                # Update or Insert
-                existing = db.query(VirtualMachine).filter(VirtualMachine.id == vm_id).first()
-                if existing:
-                    existing.name = vm_obj.name
-                    existing.status = vm_obj.status
-                    existing.ip_address = vm_obj.ip_address
-                    existing.os_name = vm_obj.os_name
-                    existing.description = vm_obj.description
-                    existing.cpu_count = vm_obj.cpu_count
-                    existing.memory_mb = vm_obj.memory_mb
-                    existing.cpu_usage_mhz = vm_obj.cpu_usage_mhz
-                    existing.memory_usage_mb = vm_obj.memory_usage_mb
-                    existing.uptime_seconds = vm_obj.uptime_seconds
-                    existing.disk_used_gb = vm_obj.disk_used_gb
-                    existing.disk_provisioned_gb = vm_obj.disk_provisioned_gb
-                    existing.tools_status = vm_obj.tools_status
-                    existing.last_sync = vm_obj.last_sync
-                    print(f"[Sync] Updated VM {vm_obj.name}")
-                else:
-                    db.add(vm_obj)
-                    print(f"[Sync] Added new VM {vm_obj.name}")
-
-                vms_data.append(vm_obj)
-            except Exception as e:
-                print(f"[Sync] Error parsing VM: {e}")
+        # 虚拟机：一次加载该主机已有行，仅写入新增/变化的行
+        vm_rows = {}
+        for props in vm_props:
+            fields = build_vm_fields(host.ip, props)
+            if not fields:
+                print(f"[Sync] Warning: Skipping VM {props.get('moref')} without uuid/moref. State: {props.get('summary.runtime.powerState')}")
                 continue
+            if not fields["uuid"]:
+                print(f"[Sync] Warning: VM {fields['moref']} has no config.uuid (orphaned/invalid/registering), keyed by moref")
+            vm_rows[fields["id"]] = fields
+
+        existing_vms = load_rows(db, VirtualMachine, VM_COLUMNS, VirtualMachine.host_ip == host.ip)
+        changed_vms = diff_rows(existing_vms, vm_rows.values(), compare=VM_COLUMNS)
+        for row in changed_vms:
+            row["last_sync"] = now
+        bulk_upsert(db, VirtualMachine, changed_vms)
 
         # 清理已删除的 VM
-        if vms_data:
-            current_ids = [vm.id for vm in vms_data]
-            deleted = db.query(VirtualMachine).filter(
-                VirtualMachine.host_ip == host.ip,
-                VirtualMachine.id.notin_(current_ids)
-            ).delete(synchronize_session=False)
-            if deleted > 0:
-                print(f"[Sync] Removed {deleted} stale VMs from DB")
-        else:
-            # 如果没抓到任何 VM（但也连接成功了），说明该主机下所有 VM 都没了
-            deleted = db.query(VirtualMachine).filter(
-                VirtualMachine.host_ip == host.ip
-            ).delete(synchronize_session=False)
-            if deleted > 0:
-                print(f"[Sync] Removed all {deleted} stale VMs from DB (Host empty)")
+        stale_ids = [vm_id for vm_id in existing_vms if vm_id not in vm_rows]
+        if stale_ids:
+            db.query(VirtualMachine).filter(VirtualMachine.id.in_(stale_ids)).delete(synchronize_session=False)
+        print(f"[Sync] VMs on {host.ip}: {len(vm_rows)} total, {len(changed_vms)} written, {len(stale_ids)} removed")
 
+        refresh_aggregates(db, [host.ip])
         print(f"[Sync] Committing to DB...")
         db.commit()
         print(f"[Sync] Sync complete for {host.ip}")
-        Disconnect(si)
-        return vms_data
+        return [VirtualMachine(**fields) for fields in vm_rows.values()]
+
+    def refresh_vm(
+        self,
+        db: Session,
+        host: EsxiHost,
+        vm_moref: str,
+        content=None,
+        refresh_host: bool = False,
+        with_storage: bool = False,
+    ) -> Optional[dict]:
+        """变更后的定向刷新：只拉取 moref 对应这一台 VM 的属性并写回其一行（无变化不写），
+        refresh_host 时顺带刷新宿主机 quickStats，with_storage 时再刷新数据存储容量。
+        content 为空时自行借用会话；VM 已不存在时返回 None。"""
+        if content is None:
+            username, password = self._resolve_credentials(host)
+            with self._session(host.ip, username, password, host.port) as si:
+                return self.refresh_vm(db, host, vm_moref, si.RetrieveContent(), refresh_host, with_storage)
+
+        # 先完成全部远程读取，再在一个短事务内写库：首条 DML 即占用进程级 SQLite 写锁，
+        # 不能在持锁期间等待 ESXi 往返
+        vm_obj = vim.VirtualMachine(vm_moref, content.propertyCollector._stub)
+        props = retrieve_object(content, vm_obj, VM_PROPERTIES)
+        fields = build_vm_fields(host.ip, props) if props else None
+        host_inventory = None
+        if refresh_host:
+            try:
+                host_inventory = self._fetch_host_stats(content, with_storage)
+            except Exception as e:
+                print(f"[Sync] host stats refresh failed for {host.ip}: {e}")
+
+        now = datetime.now(timezone.utc)
+        changes = []
+        if fields:
+            existing = load_rows(db, VirtualMachine, VM_COLUMNS, VirtualMachine.id == fields["id"])
+            changed = diff_rows(existing, [fields], compare=VM_COLUMNS)
+            for row in changed:
+                row["last_sync"] = now
+            bulk_upsert(db, VirtualMachine, changed)
+            changes = [(existing.get(row["id"]), row) for row in changed]
+        if host_inventory is not None:
+            self._apply_host_stats(db, host, host_inventory, with_storage)
+        apply_vm_changes(db, changes)
+        if host_inventory is not None and with_storage:
+            refresh_storage_aggregates(db, [host.ip])
+        db.commit()
+        return fields
+
+    def _fetch_host_stats(self, content, with_storage: bool = False) -> dict:
+        """拉取宿主机资源属性（以及可选的数据存储容量），不触碰数据库"""
+        specs = {vim.HostSystem: HOST_PROPERTIES}
+        if with_storage:
+            specs[vim.Datastore] = DATASTORE_PROPERTIES
+        return retrieve_inventory(content, specs)
+
+    def _apply_host_stats(self, db: Session, host: EsxiHost, inventory: dict, with_storage: bool = False):
+        """把 _fetch_host_stats 的结果写回宿主机字段与数据存储行（不提交）"""
+        host_props = inventory[vim.HostSystem]
+        if host_props:
+            for key, value in build_host_fields(host_props[0]).items():
+                setattr(host, key, value)
+        if with_storage:
+            ds_props = inventory[vim.Datastore]
+            for key, value in build_host_storage_fields(ds_props).items():
+                setattr(host, key, value)
+            ds_rows = [f for f in (build_datastore_fields(p) for p in ds_props) if f]
+            if ds_rows:
+                existing = load_rows(db, Datastore, DATASTORE_COLUMNS, Datastore.id.in_([r["id"] for r in ds_rows]))
+                changed = diff_rows(existing, ds_rows, compare=DATASTORE_COLUMNS)
+                for row in changed:
+                    row["last_sync"] = datetime.now(timezone.utc)
+                bulk_upsert(db, Datastore, changed)
+
+    def _refresh_host_stats(self, db: Session, host: EsxiHost, content, with_storage: bool = False):
+        """只刷新宿主机资源字段（以及可选的数据存储容量），不触碰 VM 列表；先拉取再写库"""
+        self._apply_host_stats(db, host, self._fetch_host_stats(content, with_storage), with_storage)
 
     def list_vms_direct(self, host_ip, user, pwd) -> List[dict]:
         """不通过数据库，直接连 ESXi 列出 VM (用于调试)"""
-        si = self._get_connection(host_ip, user, pwd)
-        if not si:
-            raise Exception("Connect failed")
-        
-        content = si.RetrieveContent()
-        container = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True)
-        
+        with self._session(host_ip, user, pwd) as si:
+            inventory = retrieve_inventory(si.RetrieveContent(), {vim.VirtualMachine: VM_PROPERTIES})
+
         res = []
-        for vm in container.view:
+        for props in inventory[vim.VirtualMachine]:
             res.append({
-                "id": vm.summary.config.uuid,
-                "uuid": vm.summary.config.uuid,
-                "name": vm.summary.config.name,
+                "id": props.get("summary.config.uuid"),
+                "uuid": props.get("summary.config.uuid"),
+                "name": props.get("summary.config.name"),
                 "host_ip": host_ip,
-                "status": vm.summary.runtime.powerState,
-                "ip_address": vm.summary.guest.ipAddress,
-                "os_name": vm.summary.guest.guestFullName,
-                "cpu_count": vm.summary.config.numCpu,
-                "memory_mb": vm.summary.config.memorySizeMB,
+                "status": props.get("summary.runtime.powerState"),
+                "ip_address": props.get("summary.guest.ipAddress"),
+                "os_name": props.get("summary.guest.guestFullName"),
+                "cpu_count": props.get("summary.config.numCpu"),
+                "memory_mb": props.get("summary.config.memorySizeMB"),
             })
-        Disconnect(si)
         return res
 
     def update_host(self, db: Session, host: EsxiHost, username: Optional[str] = None, password: Optional[str] = None, port: Optional[int] = None):
@@ -555,20 +696,102 @@ class VirtualizationService:
             host.port = port
         db.commit()
         db.refresh(host)
+        esxi_session_pool.invalidate(host.ip)
         return host
 
     def delete_host(self, db: Session, host: EsxiHost):
         db.query(VirtualMachine).filter(VirtualMachine.host_ip == host.ip).delete(synchronize_session=False)
         db.delete(host)
         db.commit()
+        esxi_session_pool.invalidate(host.ip)
 
-    def sync_all_hosts(self, db: Session):
-        hosts = db.query(EsxiHost).all()
-        for host in hosts:
+    def _sync_host_job(self, host_id: int, started_at: dict) -> dict:
+        """线程池任务：独立 DB 会话同步单台主机，返回该主机的同步结果"""
+        started_at[host_id] = time.time()
+        result = {"host_id": host_id, "host_ip": None, "success": False, "skipped": False, "vm_count": 0, "duration_ms": 0, "error": None}
+        db = SessionLocal()
+        try:
+            host = db.query(EsxiHost).filter(EsxiHost.id == host_id).first()
+            if not host:
+                raise ValueError("Host not found")
+            result["host_ip"] = host.ip
+            username, pwd = self._resolve_credentials(host)
             try:
-                self.sync_host_vms(db, host)
-            except Exception as e:
-                print(f"sync host {host.ip} failed: {e}")
+                with self._session(host.ip, username, pwd, host.port) as si:
+                    vms = self._sync_host_inventory(db, host, si.RetrieveContent())
+            except EsxiConnectionError:
+                host.status = "offline"
+                db.commit()
+                raise
+            result["success"] = True
+            result["vm_count"] = len(vms)
+        except Exception as e:
+            db.rollback()
+            print(f"[Sync] sync host {result['host_ip'] or host_id} failed: {e}")
+            result["error"] = str(e)
+        finally:
+            db.close()
+            result["duration_ms"] = int((time.time() - started_at[host_id]) * 1000)
+        return result
+
+    def sync_all_hosts(self, db: Session, skip_ips: Optional[set] = None) -> List[dict]:
+        """并发同步所有主机：有界线程池 + 单主机超时 + 整轮截止时间，总耗时约等于最慢的一台。
+        超时的主机线程无法中断，会在后台继续运行直至完成或失败；期间该主机不会再被提交，
+        避免反复卡住的主机占满线程池"""
+        hosts = db.query(EsxiHost).order_by(EsxiHost.sort_order.asc(), EsxiHost.id.asc()).all()
+        results = {}
+        futures = {}
+        started_at = {}
+        overall_start = time.time()
+
+        def failed(host, error: str, duration_ms: int = 0) -> dict:
+            return {"host_id": host.id, "host_ip": host.ip, "success": False, "skipped": False, "vm_count": 0, "duration_ms": duration_ms, "error": error}
+
+        for host in hosts:
+            if skip_ips and host.ip in skip_ips:
+                results[host.id] = {"host_id": host.id, "host_ip": host.ip, "success": True, "skipped": True, "vm_count": 0, "duration_ms": 0, "error": None}
+                continue
+            with self._sync_lock:
+                busy = host.id in self._sync_inflight
+                if not busy:
+                    self._sync_inflight.add(host.id)
+            if busy:
+                print(f"[Sync] sync host {host.ip} skipped: previous sync still running")
+                results[host.id] = failed(host, "上一次同步仍在进行")
+                continue
+            future = self._sync_executor.submit(self._sync_host_job, host.id, started_at)
+            future.add_done_callback(lambda _f, host_id=host.id: self._sync_done(host_id))
+            futures[future] = host
+
+        pending = set(futures.keys())
+        while pending:
+            done, pending = wait(pending, timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                host = futures[future]
+                results[host.id] = failed(host, "同步未开始（已取消）") if future.cancelled() else future.result()
+            now = time.time()
+            overdue = now - overall_start > self.sync_total_timeout
+            for future in list(pending):
+                host = futures[future]
+                started = started_at.get(host.id)
+                if started is None:
+                    # 仍在排队：整轮截止后取消，不再占用线程
+                    if overdue and future.cancel():
+                        pending.discard(future)
+                        print(f"[Sync] sync host {host.ip} cancelled: not started within {self.sync_total_timeout}s")
+                        results[host.id] = failed(host, f"整轮同步超时（>{self.sync_total_timeout}s），未开始")
+                elif now - started > self.sync_host_timeout:
+                    # 超时主机不再等待（线程仍在后台完成或失败），不拖慢整体返回
+                    pending.discard(future)
+                    print(f"[Sync] sync host {host.ip} timed out after {self.sync_host_timeout}s")
+                    results[host.id] = failed(host, f"同步超时（>{self.sync_host_timeout}s）", int((now - started) * 1000))
+
+        db.expire_all()
+        return [results[h.id] for h in hosts if h.id in results]
+
+    def _sync_done(self, host_id: int):
+        with self._sync_lock:
+            self._sync_inflight.discard(host_id)
 
     def _answer_vm_question(self, vm_obj):
         """检查并自动回答 VM 提问（默认为 'I copied it'）"""
@@ -605,11 +828,7 @@ class VirtualizationService:
     def power_vm(self, db: Session, host: EsxiHost, vm: VirtualMachine, action: str):
         """执行电源相关动作：powerOn/shutdown/powerOff/reboot/reset"""
         username, password = self._resolve_credentials(host)
-        si = self._get_connection(host.ip, username, password, host.port)
-        if not si:
-            raise Exception(f"连接 {host.ip} 失败")
-
-        try:
+        with self._session(host.ip, username, password, host.port) as si:
             content = si.RetrieveContent()
             dc = content.rootFolder.childEntity[0] if content.rootFolder.childEntity else None
             if not dc:
@@ -625,21 +844,8 @@ class VirtualizationService:
                     msg = "虚拟机已处于开机状态"
                 else:
                     task = vm_obj.PowerOnVM_Task()
-                    # 不等待完全成功，因为可能有 Question 阻塞
-                    # 但我们需要等待它进入 Running 或者抛出 Question
-                    # self._wait_task(task, "power-on", timeout=600) 
-                    # 改为手动轮询以便处理 Question
-                    start = time.time()
-                    while task.info.state in [vim.TaskInfo.State.queued, vim.TaskInfo.State.running]:
-                        if vm_obj.runtime.question:
-                            self._answer_vm_question(vm_obj)
-                        if time.time() - start > 60:
-                            raise TimeoutError("PowerOn 等待超时")
-                        time.sleep(1)
-                    
-                    if task.info.state == vim.TaskInfo.State.error:
-                        raise Exception(f"PowerOn 失败: {task.info.error}")
-                        
+                    # 开机可能被 Question（移动/复制）阻塞，等待器监听 runtime.question 并自动回答
+                    self._wait_task(task, "PowerOn", timeout=60, question_vm=vm_obj)
                     msg = "已开机"
             elif act in ["shutdown", "shutdownguest", "guestshutdown"]:
                 if vm_obj.runtime.powerState == vim.VirtualMachinePowerState.poweredOff:
@@ -674,19 +880,97 @@ class VirtualizationService:
             else:
                 raise ValueError("不支持的动作")
 
-            # 同步一次状态（失败不影响返回）
+            # 只刷新这一台 VM 与宿主机负载（失败不影响返回）
+            fields = None
             try:
-                self.sync_host_vms(db, host)
+                fields = self.refresh_vm(db, host, vm_obj._GetMoId(), content, refresh_host=True)
             except Exception as e:
-                print(f"[Power] Sync warning: {e}")
+                print(f"[Power] Refresh warning: {e}")
 
             return {
-                "task_id": f"power-{vm.id}-{int(time.time())}",
-                "status": "success",
                 "message": msg,
+                "power_state": fields["status"] if fields else None,
             }
-        finally:
-            Disconnect(si)
+
+    def bulk_power_vms(self, db: Session, vm_ids: List[str], action: str, task_service=None, task_id: Optional[str] = None) -> dict:
+        """对多台 VM（可跨主机）执行同一电源动作：各主机并行，单主机内并发不超过 bulk_power_per_host；
+        每台 VM 的结果写在 children 中，单台失败不影响其余"""
+        vms = {vm.id: vm for vm in db.query(VirtualMachine).filter(VirtualMachine.id.in_(vm_ids)).all()}
+        hosts = {h.ip: h for h in db.query(EsxiHost).filter(EsxiHost.ip.in_({vm.host_ip for vm in vms.values()})).all()}
+        children = []
+        for vm_id in vm_ids:
+            vm = vms.get(vm_id)
+            child = {
+                "vm_id": vm_id,
+                "name": vm.name if vm else None,
+                "host_ip": vm.host_ip if vm else None,
+                "status": "pending",
+                "message": "等待执行",
+                "power_state": None,
+            }
+            if not vm:
+                child.update(status="failed", message="VM not found")
+            elif vm.host_ip not in hosts:
+                child.update(status="failed", message="Host not found")
+            children.append(child)
+
+        report_lock = threading.Lock()
+        last_report = [0.0]
+
+        def report(force: bool = False):
+            if not (task_service and task_id):
+                return
+            with report_lock:
+                now = time.time()
+                if not force and now - last_report[0] < self.progress_interval:
+                    return
+                last_report[0] = now
+                finished = [c for c in children if c["status"] in ("success", "failed")]
+                failed = sum(1 for c in finished if c["status"] == "failed")
+                try:
+                    task_service.update_task(
+                        db,
+                        task_id,
+                        progress=5 + int(len(finished) * 90 / len(children)),
+                        message=f"批量 {action} {len(children)} 台：完成 {len(finished) - failed}，失败 {failed}",
+                        result={"action": action, "children": [dict(c) for c in children]},
+                    )
+                except Exception as e:
+                    print(f"[Task] update failed: {e}")
+
+        host_slots = {ip: threading.BoundedSemaphore(max(self.bulk_power_per_host, 1)) for ip in hosts}
+
+        def run_child(child: dict):
+            with host_slots[child["host_ip"]]:
+                child["status"] = "running"
+                child_db = SessionLocal()
+                try:
+                    vm = child_db.query(VirtualMachine).filter(VirtualMachine.id == child["vm_id"]).first()
+                    host = child_db.query(EsxiHost).filter(EsxiHost.ip == child["host_ip"]).first()
+                    if not vm or not host:
+                        raise ValueError("未找到 Host 或 VM")
+                    res = self.power_vm(child_db, host, vm, action)
+                    child.update(status="success", message=res["message"], power_state=res.get("power_state"))
+                except Exception as e:
+                    print(f"[Power] {child['name']} {action} failed: {e}")
+                    child.update(status="failed", message=str(e))
+                finally:
+                    child_db.close()
+            report()
+
+        runnable = [c for c in children if c["status"] == "pending"]
+        if runnable:
+            workers = min(len(runnable), len(hosts) * max(self.bulk_power_per_host, 1))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-power") as pool:
+                list(pool.map(run_child, runnable))
+        report(force=True)
+
+        failed = [c for c in children if c["status"] == "failed"]
+        return {
+            "success": not failed,
+            "message": f"批量 {action}：成功 {len(children) - len(failed)}/{len(children)} 台",
+            "children": children,
+        }
 
     def update_vm_basic_info(
         self,
@@ -698,11 +982,7 @@ class VirtualizationService:
     ) -> VirtualMachine:
         """更新 VM 的名称/备注（同步操作 ESXi），成功后更新本地数据库。"""
         username, password = self._resolve_credentials(host)
-        si = self._get_connection(host.ip, username, password, host.port)
-        if not si:
-            raise Exception(f"连接 {host.ip} 失败")
-
-        try:
+        with self._session(host.ip, username, password, host.port) as si:
             content = si.RetrieveContent()
             dc = content.rootFolder.childEntity[0] if content.rootFolder.childEntity else None
             if not dc:
@@ -735,13 +1015,221 @@ class VirtualizationService:
                     changed = True
 
             if changed:
-                vm.last_sync = datetime.now(timezone.utc)
-                db.commit()
+                # 以 ESXi 上的最新属性为准回写这一行
+                try:
+                    self.refresh_vm(db, host, vm_obj._GetMoId(), content)
+                except Exception as e:
+                    print(f"[VM] Refresh warning: {e}")
+                    vm.last_sync = datetime.now(timezone.utc)
+                    db.commit()
                 db.refresh(vm)
 
             return vm
+
+    # ---------- 克隆各阶段（单个克隆与批量克隆共用） ----------
+
+    def _clone_name_taken(self, content, dc, new_name: str) -> bool:
+        """数据中心 vmFolder 下是否已有同名虚拟机（RegisterVM 注册到该目录）"""
+        try:
+            return content.searchIndex.FindChild(dc.vmFolder, new_name) is not None
+        except Exception:
+            return False
+
+    def _clone_target_paths(self, config, target_datastore: Optional[str], new_name: str) -> Tuple[str, str]:
+        """返回目标目录与新 vmx 路径"""
+        src_ds, src_rel_path = self._parse_datastore_path(config.files.vmPathName)
+        target_dir = f"[{target_datastore or src_ds}] {new_name}"
+        return target_dir, f"{target_dir}/{os.path.basename(src_rel_path)}"
+
+    def _clone_prepare_dir(self, content, dc, target_dir: str):
+        """清理已存在的目标目录后重新创建"""
+        file_mgr = content.fileManager
+        try:
+            # 直接尝试删除（目录不存在会抛错，catch 住即可）
+            print(f"[Clone] 尝试清理目标目录 {target_dir}")
+            del_task = file_mgr.DeleteDatastoreFile_Task(name=target_dir, datacenter=dc)
+            self._wait_task(del_task, f"cleanup-{target_dir}", timeout=60)
+            print(f"[Clone] 已清理旧目录 {target_dir}")
+        except Exception as e:
+            # 如果目录不存在，Delete 会报错，属于正常情况
+            print(f"[Clone] Cleanup skipped (probably not exists): {e}")
+
+        print(f"[Clone] 创建目录 {target_dir}")
+        try:
+            file_mgr.MakeDirectory(name=target_dir, datacenter=dc, createParentDirectories=True)
+        except Exception as e:
+            print(f"[Clone] MakeDirectory warning: {e}")
+
+    def _clone_copy_progress(self, config, start_pct: int, end_pct: int) -> _CopyProgress:
+        disks = [dev for dev in config.hardware.device if isinstance(dev, vim.vm.device.VirtualDisk)]
+        return _CopyProgress(
+            {os.path.basename(dev.backing.fileName): (dev.capacityInKB or 0) * 1024 for dev in disks},
+            start_pct=start_pct,
+            end_pct=end_pct,
+        )
+
+    def _clone_copy_files(self, content, dc, config, target_dir: str, copy_progress: _CopyProgress, on_tick=None):
+        """并发复制磁盘与 vmx / nvram / vmxf 配置文件；任一失败删除目标目录后抛出"""
+        file_mgr = content.fileManager
+        disk_mgr = content.virtualDiskManager
+        target_ds = self._parse_datastore_path(target_dir)[0]
+
+        copy_jobs = []
+        for dev in config.hardware.device:
+            if not isinstance(dev, vim.vm.device.VirtualDisk):
+                continue
+            src_disk = dev.backing.fileName
+            disk_name = os.path.basename(src_disk)
+            dst_disk = f"{target_dir}/{disk_name}"
+            copy_jobs.append({
+                "name": f"copy-disk-{disk_name}",
+                "datastores": {self._parse_datastore_path(src_disk)[0], target_ds},
+                "start": lambda src=src_disk, dst=dst_disk: disk_mgr.CopyVirtualDisk_Task(
+                    sourceName=src,
+                    sourceDatacenter=dc,
+                    destName=dst,
+                    destDatacenter=dc,
+                    destSpec=None,
+                    force=True,
+                ),
+                "on_progress": lambda pct, key=disk_name: copy_progress.update(key, pct),
+                "on_done": lambda key=disk_name: copy_progress.update(key, 100),
+                "timeout": 3600,
+            })
+        # 配置文件存在才复制
+        copy_files = [config.files.vmPathName, getattr(config.files, "nvram", None), getattr(config.files, "vmxfFile", None)]
+        for fpath in copy_files:
+            if not fpath:
+                continue
+            dst_path = f"{target_dir}/{os.path.basename(fpath)}"
+            copy_jobs.append({
+                "name": f"copy-file-{os.path.basename(fpath)}",
+                "datastores": set(),  # 小文件不占用数据存储并发名额
+                "start": lambda src=fpath, dst=dst_path: file_mgr.CopyDatastoreFile_Task(
+                    sourceName=src,
+                    sourceDatacenter=dc,
+                    destinationName=dst,
+                    destinationDatacenter=dc,
+                    force=True,
+                ),
+                "timeout": 600,
+            })
+
+        try:
+            self._run_copy_jobs(copy_jobs, on_tick=on_tick)
+        except Exception as e:
+            # 任一复制失败：删除目标目录，清理已复制的文件
+            print(f"[Clone] 复制失败，清理目标目录 {target_dir}: {e}")
+            try:
+                del_task = file_mgr.DeleteDatastoreFile_Task(name=target_dir, datacenter=dc)
+                self._wait_task(del_task, f"cleanup-{target_dir}", timeout=300)
+            except Exception as cleanup_err:
+                print(f"[Clone] Cleanup failed: {cleanup_err}")
+            raise
+
+    def _clone_register(self, dc, vm_obj, target_vmx: str, new_name: str):
+        """在源 VM 所在资源池/主机上注册新 vmx"""
+        reg_task = dc.vmFolder.RegisterVM_Task(
+            path=target_vmx,
+            name=new_name,
+            asTemplate=False,
+            pool=vm_obj.resourcePool,
+            host=vm_obj.runtime.host,
+        )
+        return self._wait_task(reg_task, "register-vm", timeout=600)
+
+    def _clone_power_on(self, new_vm, new_name: str):
+        """开机并自动回答“移动/复制”问题；超时只记录日志"""
+        print(f"[Clone] 开机新虚拟机 {new_name}")
+        task = new_vm.PowerOnVM_Task()
+        try:
+            self._wait_task(task, "开机", timeout=120, question_vm=new_vm)
+        except TimeoutError:
+            print("[Clone] PowerOn wait timeout")
+
+    def _clone_configure_ip(
+        self,
+        content,
+        new_vm,
+        host_ip: str,
+        guest_username: Optional[str],
+        guest_password: Optional[str],
+        nic_name: Optional[str],
+        new_ip: Optional[str],
+        netmask: Optional[str],
+        gateway: Optional[str],
+        dns: Optional[List[str]],
+        on_ready=None,
+    ) -> Tuple[bool, Optional[str]]:
+        """等待 Tools 后在 Guest 内改 IP，无论成功与否都重连网卡；返回 (是否成功, 说明)"""
+        ip_configured = False
+        ip_message = None
+        print(f"[Clone] ========== 开始自动改 IP 流程 ==========")
+        print(f"[Clone] 请求参数:")
+        print(f"[Clone]   guest_username: {guest_username}")
+        print(f"[Clone]   guest_password: {'*' * len(guest_password) if guest_password else '(空)'}")
+        print(f"[Clone]   nic_name: {nic_name}")
+        print(f"[Clone]   new_ip: {new_ip}")
+        print(f"[Clone]   netmask: {netmask}")
+        print(f"[Clone]   gateway: {gateway}")
+        print(f"[Clone]   dns: {dns}")
+        try:
+            print(f"[Clone] 等待 VMware Tools 就绪 (timeout=180s)...")
+            self._ensure_tools_ready(new_vm, timeout=180)
+            print(f"[Clone] ✅ VMware Tools 已就绪")
+            if on_ready:
+                on_ready()
+            self._run_guest_ip_config(
+                content,
+                new_vm,
+                username=guest_username or "root",
+                password=guest_password or "",
+                nic=nic_name or "eth0",
+                ip=new_ip,
+                netmask=netmask,
+                gateway=gateway,
+                dns=dns,
+                host_ip=host_ip,  # 传入 ESXi IP 用于修正上传 URL
+            )
+            ip_configured = True
+            ip_message = f"已在 {nic_name or 'eth0'} 上设置 {new_ip}"
+            print(f"[Clone] ✅ {ip_message}")
+        except Exception as e:
+            ip_message = f"自动改 IP 失败: {e}"
+            print(f"[Clone] ❌ {ip_message}")
+            import traceback
+            print(f"[Clone] 异常堆栈: {traceback.format_exc()}")
+            # raise # 不抛出异常，以免影响后续重连网卡和同步流程
         finally:
-            Disconnect(si)
+            # 重连网卡
+            print(f"[Clone] ========== 重连网卡 ==========")
+            try:
+                device_changes = []
+                for dev in new_vm.config.hardware.device:
+                    if isinstance(dev, vim.vm.device.VirtualEthernetCard):
+                        print(f"[Clone] 发现网卡: {dev.deviceInfo.label}, MAC: {dev.macAddress}")
+                        nic_spec = vim.vm.device.VirtualDeviceSpec()
+                        nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+                        nic_spec.device = dev
+                        if nic_spec.device.connectable:
+                            old_connected = nic_spec.device.connectable.connected
+                            nic_spec.device.connectable.connected = True
+                            nic_spec.device.connectable.startConnected = True
+                            print(f"[Clone] 设置网卡 {dev.deviceInfo.label}: connected={old_connected}->True")
+                        device_changes.append(nic_spec)
+                if device_changes:
+                    print(f"[Clone] 执行 ReconfigVM_Task 重连 {len(device_changes)} 个网卡...")
+                    spec = vim.vm.ConfigSpec(deviceChange=device_changes)
+                    task = new_vm.ReconfigVM_Task(spec)
+                    self._wait_task(task, "reconnect-nic", timeout=120)
+                    print(f"[Clone] ✅ 网卡重连完成")
+                else:
+                    print(f"[Clone] ⚠️ 未发现需要重连的网卡")
+            except Exception as e:
+                print(f"[Clone] ❌ reconnect nic 失败: {e}")
+                import traceback
+                print(f"[Clone] 异常堆栈: {traceback.format_exc()}")
+        return ip_configured, ip_message
 
     def clone_vm(
         self,
@@ -781,14 +1269,6 @@ class VirtualizationService:
                     print(f"[Task] update failed: {e}")
 
         username, password = self._resolve_credentials(host)
-        si = self._get_connection(host.ip, username, password, host.port)
-        if not si:
-            raise Exception(f"连接 {host.ip} 失败")
-
-        new_vm = None
-        ip_configured = False
-        ip_message = None
-        task_update(status="running", progress=5, message="连接 ESXi")
 
         if auto_config_ip:
             if not guest_username or not guest_password:
@@ -797,7 +1277,11 @@ class VirtualizationService:
                 raise ValueError("自动改 IP 需要提供 new_ip 与 netmask")
             power_on = True  # 需要开机才能执行 GuestOps
 
-        try:
+        new_vm = None
+        ip_configured = False
+        ip_message = None
+        with self._session(host.ip, username, password, host.port) as si:
+            task_update(status="running", progress=5, message="连接 ESXi")
             content = si.RetrieveContent()
             dc = content.rootFolder.childEntity[0] if content.rootFolder.childEntity else None
             if not dc:
@@ -812,86 +1296,36 @@ class VirtualizationService:
             config = vm_obj.config
             if not config:
                 raise ValueError("VM 缺少配置，无法克隆")
-
-            src_vmx = config.files.vmPathName
-            src_ds, src_rel_path = self._parse_datastore_path(src_vmx)
-            target_ds = target_datastore or src_ds
-            target_folder = new_name
-            target_dir = f"[{target_ds}] {target_folder}"
-            target_vmx = f"{target_dir}/{os.path.basename(src_rel_path)}"
-
-            file_mgr = content.fileManager
-            disk_mgr = content.virtualDiskManager
-
-            # 检查并清理目标目录
-            try:
-                # 尝试查找目标目录是否已存在（通过 ListDatastoreFile 或直接尝试删除）
-                # 为了简单起见，我们直接尝试删除（如果不存在会抛错，catch 住即可）
-                print(f"[Clone] 尝试清理目标目录 {target_dir}")
-                del_task = file_mgr.DeleteDatastoreFile_Task(name=target_dir, datacenter=dc)
-                self._wait_task(del_task, f"cleanup-{target_folder}", timeout=60)
-                print(f"[Clone] 已清理旧目录 {target_dir}")
-            except Exception as e:
-                # 如果目录不存在，Delete 会报错，属于正常情况
-                print(f"[Clone] Cleanup skipped (probably not exists): {e}")
-            task_update(progress=10, message="准备目标目录")
-
-            print(f"[Clone] 创建目录 {target_dir}")
-            try:
-                file_mgr.MakeDirectory(name=target_dir, datacenter=dc, createParentDirectories=True)
-            except Exception as e:
-                print(f"[Clone] MakeDirectory warning: {e}")
-            task_update(progress=15, message="创建目录完成")
-
-            # 复制磁盘
-            for idx, dev in enumerate(config.hardware.device):
-                if isinstance(dev, vim.vm.device.VirtualDisk):
-                    src_disk = dev.backing.fileName
-                    disk_name = os.path.basename(src_disk)
-                    dst_disk = f"{target_dir}/{disk_name}"
-                    print(f"[Clone] 复制磁盘 {src_disk} -> {dst_disk}")
-                    task = disk_mgr.CopyVirtualDisk_Task(
-                        sourceName=src_disk,
-                        sourceDatacenter=dc,
-                        destName=dst_disk,
-                        destDatacenter=dc,
-                        destSpec=None,
-                        force=True,
-                    )
-                    self._wait_task(task, f"copy-disk-{disk_name}", timeout=3600)
-                    task_update(progress=30, message=f"复制磁盘 {disk_name}")
-
-            # 复制 vmx / nvram / vmxf 等配置文件（存在才复制）
-            copy_files = [src_vmx, getattr(config.files, "nvram", None), getattr(config.files, "vmxfFile", None)]
-            for fpath in copy_files:
-                if not fpath:
-                    continue
-                fname = os.path.basename(fpath)
-                dst_path = f"{target_dir}/{fname}"
-                print(f"[Clone] 复制配置 {fpath} -> {dst_path}")
-                task = file_mgr.CopyDatastoreFile_Task(
-                    sourceName=fpath,
-                    sourceDatacenter=dc,
-                    destinationName=dst_path,
-                    destinationDatacenter=dc,
-                    force=True,
+            # 队列重试/恢复时避免覆盖已注册的同名虚拟机
+            if self._clone_name_taken(content, dc, new_name):
+                raise ValueError(f"已存在同名虚拟机: {new_name}")
+
+            target_dir, target_vmx = self._clone_target_paths(config, target_datastore, new_name)
+            self._clone_prepare_dir(content, dc, target_dir)
+            task_update(progress=15, message="准备目标目录完成")
+
+            # 复制磁盘：进度按磁盘容量加权映射到 15%~45%，按固定间隔写库
+            copy_progress = self._clone_copy_progress(config, start_pct=15, end_pct=45)
+            result_base = {"source": vm.name, "target": new_name}
+
+            def report_copy(message: str, force: bool = False):
+                snap = copy_progress.snapshot()
+                if not force and snap["progress"] == copy_progress.reported_pct:
+                    return
+                copy_progress.reported_pct = snap["progress"]
+                eta = f"，剩余约 {snap['eta_seconds']}s" if snap["eta_seconds"] is not None else ""
+                task_update(
+                    progress=snap["progress"],
+                    message=f"{message} {snap['copied_gb']}/{snap['total_gb']}GB，{snap['throughput_mb_s']}MB/s{eta}",
+                    result={**result_base, "copy": {k: v for k, v in snap.items() if k != "progress"}},
                 )
-                self._wait_task(task, f"copy-file-{fname}", timeout=600)
-            task_update(progress=50, message="复制配置文件完成")
 
-            resource_pool = vm_obj.resourcePool
-            host_ref = vm_obj.runtime.host
-            folder = dc.vmFolder
+            self._clone_copy_files(content, dc, config, target_dir, copy_progress, on_tick=lambda: report_copy("复制磁盘"))
+            report_copy("复制磁盘完成", force=True)
+            task_update(progress=50, message="复制磁盘及配置文件完成")
 
             print(f"[Clone] 注册新虚拟机 {new_name}，vmx: {target_vmx}")
-            reg_task = folder.RegisterVM_Task(
-                path=target_vmx,
-                name=new_name,
-                asTemplate=False,
-                pool=resource_pool,
-                host=host_ref,
-            )
-            new_vm = self._wait_task(reg_task, "register-vm", timeout=600)
+            new_vm = self._clone_register(dc, vm_obj, target_vmx, new_name)
             task_update(progress=65, message="注册虚拟机完成")
             # 重置 UUID/MAC，避免开机弹“移动/复制”，并按需断开网卡
             try:
@@ -902,25 +1336,14 @@ class VirtualizationService:
 
             # 开机（如需）并处理 Question
             if power_on:
-                print(f"[Clone] 开机新虚拟机 {new_name}")
-                task = new_vm.PowerOnVM_Task()
-                start = time.time()
-                while task.info.state in [vim.TaskInfo.State.queued, vim.TaskInfo.State.running]:
-                    if new_vm.runtime.question:
-                        self._answer_vm_question(new_vm)
-                    if time.time() - start > 120:
-                        print("[Clone] PowerOn wait timeout")
-                        break
-                    time.sleep(1)
-                if task.info.state == vim.TaskInfo.State.error:
-                    raise Exception(f"开机失败: {task.info.error}")
-                
-                # 开机成功后立即同步一次，更新 PowerState
+                self._clone_power_on(new_vm, new_name)
+
+                # 开机成功后立即刷新新 VM，更新 PowerState
                 try:
-                    self.sync_host_vms(db, host)
+                    self.refresh_vm(db, host, new_vm._GetMoId(), content)
                 except Exception as e:
                     print(f"[Clone] Intermediate sync warning: {e}")
-                
+
                 # 等待 OS 启动 (Heartbeat / Tools)
                 try:
                     task_update(progress=82, message="等待操作系统启动...")
@@ -934,75 +1357,25 @@ class VirtualizationService:
             ip_configured = False
             ip_message = None
             if auto_config_ip and new_vm:
-                print(f"[Clone] ========== 开始自动改 IP 流程 ==========")
-                print(f"[Clone] 请求参数:")
-                print(f"[Clone]   guest_username: {guest_username}")
-                print(f"[Clone]   guest_password: {'*' * len(guest_password) if guest_password else '(空)'}")
-                print(f"[Clone]   nic_name: {nic_name}")
-                print(f"[Clone]   new_ip: {new_ip}")
-                print(f"[Clone]   netmask: {netmask}")
-                print(f"[Clone]   gateway: {gateway}")
-                print(f"[Clone]   dns: {dns}")
-                try:
-                    print(f"[Clone] 等待 VMware Tools 就绪 (timeout=180s)...")
-                    self._ensure_tools_ready(new_vm, timeout=180)
-                    print(f"[Clone] ✅ VMware Tools 已就绪")
-                    task_update(progress=85, message="VMware Tools 就绪，开始改 IP")
-                    self._run_guest_ip_config(
-                        content,
-                        new_vm,
-                        username=guest_username or "root",
-                        password=guest_password or "",
-                        nic=nic_name or "eth0",
-                        ip=new_ip,
-                        netmask=netmask,
-                        gateway=gateway,
-                        dns=dns,
-                        host_ip=host.ip,  # 传入 ESXi IP 用于修正上传 URL
-                    )
-                    ip_configured = True
-                    ip_message = f"已在 {nic_name or 'eth0'} 上设置 {new_ip}"
-                    print(f"[Clone] ✅ {ip_message}")
+                ip_configured, ip_message = self._clone_configure_ip(
+                    content,
+                    new_vm,
+                    host_ip=host.ip,
+                    guest_username=guest_username,
+                    guest_password=guest_password,
+                    nic_name=nic_name,
+                    new_ip=new_ip,
+                    netmask=netmask,
+                    gateway=gateway,
+                    dns=dns,
+                    on_ready=lambda: task_update(progress=85, message="VMware Tools 就绪，开始改 IP"),
+                )
+                if ip_configured:
                     task_update(progress=90, message=ip_message)
-                except Exception as e:
-                    ip_message = f"自动改 IP 失败: {e}"
-                    print(f"[Clone] ❌ {ip_message}")
-                    import traceback
-                    print(f"[Clone] 异常堆栈: {traceback.format_exc()}")
-                    # raise # 不抛出异常，以免影响后续重连网卡和同步流程
-                finally:
-                    # 重连网卡
-                    print(f"[Clone] ========== 重连网卡 ==========")
-                    try:
-                        device_changes = []
-                        for dev in new_vm.config.hardware.device:
-                            if isinstance(dev, vim.vm.device.VirtualEthernetCard):
-                                print(f"[Clone] 发现网卡: {dev.deviceInfo.label}, MAC: {dev.macAddress}")
-                                nic_spec = vim.vm.device.VirtualDeviceSpec()
-                                nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
-                                nic_spec.device = dev
-                                if nic_spec.device.connectable:
-                                    old_connected = nic_spec.device.connectable.connected
-                                    nic_spec.device.connectable.connected = True
-                                    nic_spec.device.connectable.startConnected = True
-                                    print(f"[Clone] 设置网卡 {dev.deviceInfo.label}: connected={old_connected}->True")
-                                device_changes.append(nic_spec)
-                        if device_changes:
-                            print(f"[Clone] 执行 ReconfigVM_Task 重连 {len(device_changes)} 个网卡...")
-                            spec = vim.vm.ConfigSpec(deviceChange=device_changes)
-                            task = new_vm.ReconfigVM_Task(spec)
-                            self._wait_task(task, "reconnect-nic", timeout=120)
-                            print(f"[Clone] ✅ 网卡重连完成")
-                        else:
-                            print(f"[Clone] ⚠️ 未发现需要重连的网卡")
-                    except Exception as e:
-                        print(f"[Clone] ❌ reconnect nic 失败: {e}")
-                        import traceback
-                        print(f"[Clone] 异常堆栈: {traceback.format_exc()}")
 
-            # 同步一次数据库（非阻塞/失败不影响结果）
+            # 刷新新 VM 与宿主机资源/存储（失败不影响结果）
             try:
-                self.sync_host_vms(db, host)
+                self.refresh_vm(db, host, new_vm._GetMoId(), content, refresh_host=True, with_storage=True)
             except Exception as e:
                 print(f"[Clone] Sync warning: {e}")
 
@@ -1015,8 +1388,233 @@ class VirtualizationService:
                 "ip_configured": ip_configured if auto_config_ip else None,
                 "ip_message": ip_message if auto_config_ip else None,
             }
-        finally:
-            Disconnect(si)
+
+    def validate_batch_clone(
+        self,
+        items: List[dict],
+        auto_config_ip: bool = False,
+        guest_username: Optional[str] = None,
+        guest_password: Optional[str] = None,
+        netmask: Optional[str] = None,
+    ):
+        """批量克隆参数校验，不合法时抛 ValueError"""
+        if not items:
+            raise ValueError("至少需要一个克隆目标")
+        names = [item.get("new_name") for item in items]
+        if any(not name for name in names):
+            raise ValueError("new_name 不能为空")
+        duplicated = {name for name in names if names.count(name) > 1}
+        if duplicated:
+            raise ValueError(f"克隆名称重复: {', '.join(sorted(duplicated))}")
+        if auto_config_ip:
+            if not guest_username or not guest_password:
+                raise ValueError("开启自动改 IP 需要提供 guest_username 与 guest_password")
+            if not netmask:
+                raise ValueError("自动改 IP 需要提供 netmask")
+            missing = [item["new_name"] for item in items if not item.get("new_ip")]
+            if missing:
+                raise ValueError(f"以下克隆缺少 new_ip: {', '.join(missing)}")
+            ips = [item["new_ip"] for item in items]
+            duplicated = {ip for ip in ips if ips.count(ip) > 1}
+            if duplicated:
+                raise ValueError(f"IP 重复: {', '.join(sorted(duplicated))}")
+
+    def batch_clone_vms(
+        self,
+        db: Session,
+        host: EsxiHost,
+        vm: VirtualMachine,
+        items: List[dict],
+        target_datastore: Optional[str] = None,
+        power_on: bool = False,
+        auto_config_ip: bool = False,
+        guest_username: Optional[str] = None,
+        guest_password: Optional[str] = None,
+        netmask: Optional[str] = None,
+        gateway: Optional[str] = None,
+        dns: Optional[List[str]] = None,
+        nic_name: Optional[str] = "eth0",
+        disconnect_nic_first: bool = True,
+        task_service=None,
+        task_id: Optional[str] = None,
+    ):
+        """从同一源 VM 批量克隆：共享一个会话，按 复制→注册/重置→开机→改 IP 流水线执行，
+        每个阶段单独限流；单个克隆失败不影响其他克隆，最后只同步一次清单"""
+        self.validate_batch_clone(items, auto_config_ip, guest_username, guest_password, netmask)
+        if auto_config_ip:
+            power_on = True  # 需要开机才能执行 GuestOps
+
+        children = [
+            {
+                "name": item["new_name"],
+                "new_ip": item.get("new_ip"),
+                "stage": "pending",
+                "status": "pending",
+                "progress": 0,
+                "message": "等待开始",
+                "new_vm_moref": None,
+                "new_vmx_path": None,
+                "ip_configured": None,
+                "ip_message": None,
+            }
+            for item in items
+        ]
+        report_lock = threading.Lock()
+        last_report = [0.0]
+
+        def report(force: bool = False):
+            """汇总子任务进度写入父任务；按 progress_interval 限频"""
+            if not (task_service and task_id):
+                return
+            with report_lock:
+                now = time.time()
+                if not force and now - last_report[0] < self.progress_interval:
+                    return
+                last_report[0] = now
+                done = sum(1 for c in children if c["status"] == "success")
+                failed = sum(1 for c in children if c["status"] == "failed")
+                avg = sum(c["progress"] for c in children) / len(children)
+                try:
+                    task_service.update_task(
+                        db,
+                        task_id,
+                        progress=5 + int(avg * 0.9),
+                        message=f"[{vm.name}] 批量克隆 {len(children)} 台：完成 {done}，失败 {failed}",
+                        result={"source": vm.name, "children": [dict(c) for c in children]},
+                    )
+                except Exception as e:
+                    print(f"[Task] update failed: {e}")
+
+        def set_child(child: dict, stage: Optional[str] = None, progress: Optional[int] = None, message: Optional[str] = None, force: bool = False):
+            if stage:
+                child["stage"] = stage
+            if progress is not None:
+                child["progress"] = progress
+            if message:
+                child["message"] = message
+            report(force)
+
+        stage_slots = {name: threading.BoundedSemaphore(max(limit, 1)) for name, limit in self.batch_stage_limits.items()}
+
+        def run_child(child: dict, content, dc, vm_obj, config):
+            new_name = child["name"]
+            try:
+                child["status"] = "running"
+                if self._clone_name_taken(content, dc, new_name):
+                    raise ValueError(f"已存在同名虚拟机: {new_name}")
+                target_dir, target_vmx = self._clone_target_paths(config, target_datastore, new_name)
+                child["new_vmx_path"] = target_vmx
+
+                # 阶段一：复制文件（子任务进度 0~50）
+                set_child(child, stage="copy", message="等待复制")
+                with stage_slots["copy"]:
+                    set_child(child, progress=2, message="准备目标目录")
+                    self._clone_prepare_dir(content, dc, target_dir)
+                    copy_progress = self._clone_copy_progress(config, start_pct=5, end_pct=50)
+
+                    def on_tick():
+                        snap = copy_progress.snapshot()
+                        set_child(child, progress=snap["progress"], message=f"复制磁盘 {snap['copied_gb']}/{snap['total_gb']}GB，{snap['throughput_mb_s']}MB/s")
+
+                    self._clone_copy_files(content, dc, config, target_dir, copy_progress, on_tick=on_tick)
+                set_child(child, progress=50, message="复制完成")
+
+                # 阶段二：注册并重置 UUID/MAC（50~70）
+                set_child(child, stage="register", message="等待注册")
+                with stage_slots["register"]:
+                    new_vm = self._clone_register(dc, vm_obj, target_vmx, new_name)
+                    child["new_vm_moref"] = new_vm._GetMoId()
+                    set_child(child, progress=60, message="注册虚拟机完成")
+                    try:
+                        self._reset_identity_and_nic(new_vm, new_name, disconnect_nic=disconnect_nic_first)
+                    except Exception as e:
+                        print(f"[BatchClone] {new_name} reset uuid/mac warning: {e}")
+                set_child(child, progress=70, message="重置 UUID/MAC")
+
+                # 阶段三：开机并等待 Tools（70~85）
+                if power_on:
+                    set_child(child, stage="power_on", message="等待开机")
+                    with stage_slots["power_on"]:
+                        self._clone_power_on(new_vm, new_name)
+                        set_child(child, progress=78, message="等待操作系统启动...")
+                        try:
+                            self._ensure_tools_ready(new_vm, timeout=300)
+                            set_child(child, progress=85, message="操作系统已就绪")
+                        except Exception as e:
+                            print(f"[BatchClone] {new_name} wait tools warning: {e}")
+                            set_child(child, progress=85, message="开机完成 (Tools未就绪)")
+
+                # 阶段四：Guest 内改 IP（85~100）
+                if auto_config_ip:
+                    set_child(child, stage="guest_ip", message="等待改 IP")
+                    with stage_slots["guest_ip"]:
+                        ip_configured, ip_message = self._clone_configure_ip(
+                            content,
+                            new_vm,
+                            host_ip=host.ip,
+                            guest_username=guest_username,
+                            guest_password=guest_password,
+                            nic_name=nic_name,
+                            new_ip=child["new_ip"],
+                            netmask=netmask,
+                            gateway=gateway,
+                            dns=dns,
+                        )
+                    child["ip_configured"] = ip_configured
+                    child["ip_message"] = ip_message
+
+                child["status"] = "success"
+                message = "克隆完成"
+                if auto_config_ip and not child["ip_configured"]:
+                    message += f" [IP配置失败: {child['ip_message']}]"
+                set_child(child, stage="done", progress=100, message=message, force=True)
+            except Exception as e:
+                print(f"[BatchClone] ❌ {new_name} 失败: {e}")
+                child["status"] = "failed"
+                set_child(child, progress=100, message=str(e), force=True)
+
+        username, password = self._resolve_credentials(host)
+        with self._session(host.ip, username, password, host.port) as si:
+            content = si.RetrieveContent()
+            dc = content.rootFolder.childEntity[0] if content.rootFolder.childEntity else None
+            if not dc:
+                raise Exception("未找到数据中心对象")
+
+            vm_obj = self._find_vm(content, dc, vm)
+            if not vm_obj:
+                raise ValueError("未在 ESXi 上找到对应的虚拟机（UUID/IP/名称均未命中）")
+            if vm_obj.runtime.powerState != vim.VirtualMachinePowerState.poweredOff:
+                raise ValueError("克隆前请先关机（已在前端限制）")
+            config = vm_obj.config
+            if not config:
+                raise ValueError("VM 缺少配置，无法克隆")
+
+            print(f"[BatchClone] {vm.name} -> {len(children)} 台，阶段并发 {self.batch_stage_limits}")
+            report(force=True)
+            # 每个子克隆一个线程，真正的并发度由各阶段信号量控制
+            with ThreadPoolExecutor(max_workers=len(children), thread_name_prefix="batch-clone") as executor:
+                futures = [executor.submit(run_child, child, content, dc, vm_obj, config) for child in children]
+                wait(futures)
+
+            # 所有克隆结束后逐台刷新新 VM，最后一次刷新宿主机资源/存储
+            try:
+                morefs = [c["new_vm_moref"] for c in children if c["new_vm_moref"]]
+                for moref in morefs:
+                    self.refresh_vm(db, host, moref, content)
+                self._refresh_host_stats(db, host, content, with_storage=True)
+                refresh_storage_aggregates(db, [host.ip])
+                db.commit()
+            except Exception as e:
+                print(f"[BatchClone] Sync warning: {e}")
+
+        succeeded = [c for c in children if c["status"] == "success"]
+        failed = [c for c in children if c["status"] == "failed"]
+        return {
+            "success": not failed,
+            "message": f"批量克隆完成：成功 {len(succeeded)}，失败 {len(failed)}",
+            "source": vm.name,
+            "children": children,
+        }
 
     def install_tools_ssh(self, ip, username, password):
         """SSH into VM and install open-vm-tools"""
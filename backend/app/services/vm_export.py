@@ -0,0 +1,117 @@
+"""
+VM 清单流式导出（NDJSON / CSV）：以服务端游标（yield_per）逐批读取扁平列元组，边读边编码输出，
+不构造 ORM 对象或 pydantic 模型，内存占用与总行数无关。导出在独立会话中执行，响应结束时关闭。
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Iterator, List
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db import SessionLocal
+from app.models.virtualization import Datastore, EsxiHost, VirtualMachine
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+_VM_FIELDS = [
+    "id", "name", "uuid", "moref", "status", "ip_address", "os_name", "description",
+    "cpu_count", "memory_mb", "cpu_usage_mhz", "memory_usage_mb", "uptime_seconds",
+    "disk_used_gb", "disk_provisioned_gb", "tools_status", "vmx_path", "last_sync", "host_ip",
+]
+EXPORT_FIELDS: List[str] = _VM_FIELDS + [
+    "host_id", "host_name", "host_version",
+    "datastore", "datastore_type", "datastore_capacity_gb", "datastore_free_gb",
+]
+
+
+def _export_query(db: Session, criteria: list, order_by: list):
+    # VM 只记录数据存储名称；多台主机的本地存储可能同名，只关联名称唯一的数据存储，避免行重复
+    ds = (
+        select(
+            Datastore.name.label("name"),
+            func.max(Datastore.type).label("type"),
+            func.max(Datastore.capacity_gb).label("capacity_gb"),
+            func.max(Datastore.free_gb).label("free_gb"),
+        )
+        .group_by(Datastore.name)
+        .having(func.count(Datastore.id) == 1)
+        .subquery("ds")
+    )
+    columns = [getattr(VirtualMachine, name) for name in _VM_FIELDS] + [
+        EsxiHost.id, EsxiHost.hostname, EsxiHost.version,
+        VirtualMachine.datastore, ds.c.type, ds.c.capacity_gb, ds.c.free_gb,
+    ]
+    return (
+        db.query(*columns)
+        .outerjoin(EsxiHost, EsxiHost.ip == VirtualMachine.host_ip)
+        .outerjoin(ds, ds.c.name == VirtualMachine.datastore)
+        .filter(*criteria)
+        .order_by(*order_by)
+    )
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+# 复用同一个编码器：json.dumps 带参数时每次调用都会新建 JSONEncoder
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class VmExporter:
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+
+    def stream(self, fmt: str, criteria: list, order_by: list) -> Iterator[str]:
+        """逐批产出编码后的文本块；criteria / order_by 为 VM 列表同款过滤与排序表达式"""
+        db = SessionLocal()
+        try:
+            rows = _export_query(db, criteria, order_by).yield_per(self.batch_size)
+            if fmt == "csv":
+                yield from self._csv(rows)
+            else:
+                yield from self._ndjson(rows)
+        finally:
+            db.close()
+
+    def _ndjson(self, rows) -> Iterator[str]:
+        lines = []
+        for row in rows:
+            lines.append(_json_encoder.encode(dict(zip(EXPORT_FIELDS, row))))
+            if len(lines) >= self.batch_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    def _csv(self, rows) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_FIELDS)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([_csv_value(v) for v in row])
+            if count % self.batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+vm_exporter = VmExporter(batch_size=int(os.getenv("VM_EXPORT_BATCH_SIZE", "1000")))
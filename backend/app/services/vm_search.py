@@ -0,0 +1,114 @@
+"""
+VM 搜索：关键字按空白拆分为多个词（AND），覆盖名称 / IP / 操作系统 / 备注 / 宿主机 IP。
+SQLite 下长度 >= 3 的词走 FTS5 trigram 索引（子串匹配，含前缀），按 bm25 加权打分，名称前缀命中优先；
+不足 3 个字符的词（trigram 无法索引）以及非 SQLite 数据库回退为 LIKE。
+"""
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Float, Integer, and_, case, column, literal_column, or_, text
+from sqlalchemy.orm import Session
+
+from app.db.search import VM_SEARCH_TABLE, VM_SEARCH_COLUMNS
+from app.models.virtualization import EsxiHost, VirtualMachine
+
+_MIN_TRIGRAM = 3
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _like_any(term: str):
+    return or_(*[getattr(VirtualMachine, name).contains(term, autoescape=True) for name in VM_SEARCH_COLUMNS])
+
+
+class VmSearch:
+    def __init__(self, enabled: bool = True, weights: Optional[List[float]] = None):
+        self.enabled = enabled
+        # bm25 列权重，顺序同 VM_SEARCH_COLUMNS：名称、IP 命中比 OS/备注更相关
+        self.weights = weights or [10.0, 5.0, 1.0, 1.0, 2.0]
+        self._available: Optional[bool] = None
+        self._lock = threading.Lock()
+
+    def available(self, db: Session) -> bool:
+        """FTS 表是否存在（首次检查后缓存）"""
+        if not self.enabled:
+            return False
+        if self._available is None:
+            with self._lock:
+                if self._available is None:
+                    if db.get_bind().dialect.name != "sqlite":
+                        self._available = False
+                    else:
+                        self._available = db.execute(
+                            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                            {"name": VM_SEARCH_TABLE},
+                        ).first() is not None
+        return self._available
+
+    def _split(self, db: Session, keyword: str) -> Tuple[List[str], List[str]]:
+        """拆分为 (走索引的词, 走 LIKE 的词)"""
+        terms = [t for t in keyword.split() if t]
+        if not self.available(db):
+            return [], terms
+        return [t for t in terms if len(t) >= _MIN_TRIGRAM], [t for t in terms if len(t) < _MIN_TRIGRAM]
+
+    def _match_query(self, terms: List[str]) -> str:
+        return " AND ".join(_fts_phrase(t) for t in terms)
+
+    def keyword_filter(self, db: Session, keyword: str):
+        """供列表查询使用的过滤条件（不改变排序）"""
+        fts_terms, like_terms = self._split(db, keyword)
+        criteria = [_like_any(t) for t in like_terms]
+        if fts_terms:
+            matched = text(f"SELECT rowid FROM {VM_SEARCH_TABLE} WHERE {VM_SEARCH_TABLE} MATCH :q").bindparams(
+                q=self._match_query(fts_terms)
+            ).columns(column("rowid", Integer))
+            criteria.append(literal_column("virtual_machines.rowid").in_(matched))
+        return and_(*criteria)
+
+    def search(
+        self,
+        db: Session,
+        keyword: str,
+        limit: int = 20,
+        host_id: Optional[int] = None,
+        status: Optional[str] = None,
+    ) -> List[Tuple[VirtualMachine, Optional[int]]]:
+        """按相关度返回前 limit 条 (VM, host_id)"""
+        terms = [t for t in keyword.split() if t]
+        if not terms:
+            return []
+        fts_terms, like_terms = self._split(db, keyword)
+        query = db.query(VirtualMachine, EsxiHost.id).outerjoin(EsxiHost, EsxiHost.ip == VirtualMachine.host_ip)
+        order = [
+            # 名称以首个词开头的排最前（前缀匹配）
+            case((VirtualMachine.name.startswith(terms[0], autoescape=True), 0), else_=1),
+        ]
+        if fts_terms:
+            weights = ", ".join(str(w) for w in self.weights)
+            ranked = (
+                text(
+                    f"SELECT rowid, bm25({VM_SEARCH_TABLE}, {weights}) AS score "
+                    f"FROM {VM_SEARCH_TABLE} WHERE {VM_SEARCH_TABLE} MATCH :q"
+                )
+                .bindparams(q=self._match_query(fts_terms))
+                .columns(column("rowid", Integer), column("score", Float))
+                .subquery("ranked")
+            )
+            query = query.join(ranked, literal_column("virtual_machines.rowid") == ranked.c.rowid)
+            # bm25 越小越相关
+            order.append(ranked.c.score.asc())
+        for term in like_terms:
+            query = query.filter(_like_any(term))
+        if host_id:
+            query = query.filter(EsxiHost.id == host_id)
+        if status:
+            query = query.filter(VirtualMachine.status == status)
+        order += [VirtualMachine.name.asc(), VirtualMachine.id.asc()]
+        return query.order_by(*order).limit(limit).all()
+
+
+vm_search = VmSearch(enabled=os.getenv("VM_SEARCH_FTS", "True") == "True")
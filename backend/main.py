@@ -11,6 +11,13 @@ load_dotenv()
 
 from app.db import init_db
 from app.api import virtualization_router, tasks_router, credentials_router
+from app.services.esxi_session_pool import esxi_session_pool
+from app.services.esxi_executor import esxi_executor
+from app.services.inventory_watcher import inventory_watcher
+from app.services.metrics_collector import metrics_collector
+from app.services.job_queue import job_queue
+from app.services.task_events import task_events
+from app.services.task_service import task_service
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -43,6 +50,16 @@ async def startup_event():
     # 初始化数据库
     init_db()
     print("✅ Database initialized")
+    # 为每台主机启动增量清单监听
+    inventory_watcher.start_all()
+    # 性能指标采集（PerformanceManager 实时采样）
+    metrics_collector.start()
+    # 进程内 worker 执行队列任务；也可设为 False 后单独运行 worker.py
+    if os.getenv("JOB_WORKERS_ENABLED", "True") == "True":
+        job_queue.start()
+    else:
+        # 任务由独立 worker 进程执行：单线程轮询任务表转发给 SSE 订阅者
+        task_events.start_db_watch(float(os.getenv("TASK_EVENT_DB_WATCH_INTERVAL", "2")))
 
 
 @app.on_event("shutdown")
@@ -51,6 +68,15 @@ async def shutdown_event():
     应用关闭事件
     """
     print("👋 Shutting down OpsNav API Server...")
+    job_queue.stop()
+    task_events.stop_db_watch()
+    # 写入尚未落库的任务进度
+    task_service.close()
+    inventory_watcher.stop_all()
+    metrics_collector.stop()
+    esxi_executor.shutdown()
+    # 注销会话池中的所有 ESXi 会话
+    esxi_session_pool.close_all()
 
 
 @app.get("/")
@@ -0,0 +1,183 @@
+"""
+SQLite 读延迟基准：后台持续执行 500 台 VM 的同步写入（内存比对 + 批量 upsert）与任务进度写入，
+同时多个读线程执行虚拟机列表查询，对比默认配置与调优配置（WAL + PRAGMA + 写串行化）下的读延迟和锁错误。
+
+用法（在 backend 目录下）：
+    python scripts/bench_sqlite.py --vms 500 --seconds 10 --readers 4
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.db import Base  # noqa: E402
+from app.db.sqlite import configure_sqlite  # noqa: E402
+from app.db.upsert import load_rows, diff_rows, bulk_upsert  # noqa: E402
+from app.models.task import Task  # noqa: E402
+from app.models.virtualization import VirtualMachine  # noqa: E402
+from app.services.esxi_inventory import VM_COLUMNS  # noqa: E402
+
+HOST_IP = "10.0.0.1"
+
+
+def build_vm_rows(count: int, round_no: int):
+    rows = []
+    for i in range(count):
+        rows.append({
+            "id": f"{HOST_IP}-uuid-{i}",
+            "uuid": f"uuid-{i}",
+            "moref": f"vm-{i}",
+            "name": f"vm-{i:04d}",
+            "host_ip": HOST_IP,
+            "status": "poweredOn" if (i + round_no) % 7 else "poweredOff",
+            "ip_address": f"10.1.{i // 250}.{i % 250}",
+            "os_name": "CentOS 7 (64-bit)",
+            "description": None,
+            "cpu_count": 2,
+            "memory_mb": 4096,
+            "cpu_usage_mhz": random.randint(0, 4000),
+            "memory_usage_mb": random.randint(0, 4096),
+            "uptime_seconds": round_no * 10,
+            "disk_used_gb": 20.5,
+            "disk_provisioned_gb": 40.0,
+            "tools_status": "toolsOk",
+            "datastore": "datastore1",
+            "vmx_path": f"[datastore1] vm-{i}/vm-{i}.vmx",
+        })
+    return rows
+
+
+def run_profile(name: str, tuned: bool, vm_count: int, seconds: float, readers: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="esxi-bench-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        configure_sqlite(engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = Session()
+    bulk_upsert(db, VirtualMachine, build_vm_rows(vm_count, 0))
+    db.add(Task(id="bench-task", type="clone_vm", status="running", progress=0, attempts=0, max_attempts=1))
+    db.commit()
+    db.close()
+
+    stop = threading.Event()
+    latencies = []
+    errors = {"read": 0, "write": 0}
+    counters = {"sync_rounds": 0, "task_updates": 0}
+    lock = threading.Lock()
+
+    def sync_writer():
+        round_no = 0
+        while not stop.is_set():
+            round_no += 1
+            session = Session()
+            try:
+                existing = load_rows(session, VirtualMachine, VM_COLUMNS, VirtualMachine.host_ip == HOST_IP)
+                changed = diff_rows(existing, build_vm_rows(vm_count, round_no), compare=VM_COLUMNS)
+                now = datetime.now(timezone.utc)
+                for row in changed:
+                    row["last_sync"] = now
+                bulk_upsert(session, VirtualMachine, changed)
+                session.commit()
+                counters["sync_rounds"] += 1
+            except OperationalError:
+                session.rollback()
+                with lock:
+                    errors["write"] += 1
+            finally:
+                session.close()
+
+    def task_writer():
+        progress = 0
+        while not stop.is_set():
+            session = Session()
+            try:
+                progress = (progress + 1) % 100
+                session.query(Task).filter(Task.id == "bench-task").update({"progress": progress})
+                session.commit()
+                counters["task_updates"] += 1
+            except OperationalError:
+                session.rollback()
+                with lock:
+                    errors["write"] += 1
+            finally:
+                session.close()
+            time.sleep(0.05)
+
+    def reader():
+        while not stop.is_set():
+            session = Session()
+            start = time.perf_counter()
+            try:
+                query = session.query(VirtualMachine).filter(VirtualMachine.host_ip == HOST_IP)
+                query.with_entities(func.count(VirtualMachine.id)).scalar()
+                query.order_by(VirtualMachine.name).offset(random.randint(0, max(vm_count - 50, 0))).limit(50).all()
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    latencies.append(elapsed)
+            except OperationalError:
+                with lock:
+                    errors["read"] += 1
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=sync_writer), threading.Thread(target=task_writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] if latencies else 0.0
+
+    return {
+        "profile": name,
+        "reads": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else 0.0,
+        "p95_ms": round(pct(0.95), 2),
+        "p99_ms": round(pct(0.99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "sync_rounds": counters["sync_rounds"],
+        "task_updates": counters["task_updates"],
+        "read_errors": errors["read"],
+        "write_errors": errors["write"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 读写并发基准")
+    parser.add_argument("--vms", type=int, default=500, help="每轮同步的 VM 数")
+    parser.add_argument("--seconds", type=float, default=10, help="每种配置的运行时长")
+    parser.add_argument("--readers", type=int, default=4, help="并发读线程数")
+    args = parser.parse_args()
+
+    results = [
+        run_profile("default", False, args.vms, args.seconds, args.readers),
+        run_profile("tuned", True, args.vms, args.seconds, args.readers),
+    ]
+    columns = list(results[0].keys())
+    print(" | ".join(f"{col:>12}" for col in columns))
+    for row in results:
+        print(" | ".join(f"{str(row[col]):>12}" for col in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+测试公共夹具：进程级 DATABASE_URL 指向临时文件（导入 app 时创建的全局 engine 不会碰到开发库），
+各用例通过 db 夹具拿到独立的内存 SQLite 会话。
+"""
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault("METRICS_ENABLED", "False")
+os.environ.setdefault("ESXI_WATCH_ENABLED", "False")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.db import Base  # noqa: E402
+import app.models.task  # noqa: E402,F401
+import app.models.credential  # noqa: E402,F401
+import app.models.virtualization  # noqa: E402,F401
+import app.models.metrics  # noqa: E402,F401
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,94 @@
+import pytest
+
+from app.models.virtualization import EsxiHost, VirtualMachine
+from app.services.capacity import CapacityPlanner
+
+
+@pytest.fixture
+def planner():
+    return CapacityPlanner(default_core_mhz=2400)
+
+
+def _host(db, ip, cpu_mhz, sort_order=0):
+    host = EsxiHost(
+        ip=ip, username="root", password="pw", sort_order=sort_order, cpu_cores=8, cpu_mhz=cpu_mhz,
+        memory_total_gb=64.0, storage_total_gb=1000.0, storage_free_gb=500.0,
+    )
+    db.add(host)
+    return host
+
+
+def _vm(db, vm_id, host_ip, **extra):
+    # 2 vCPU / 4 GB，200 MHz：按默认 2400 MHz 主频为 4.17%（空闲），按 1000 MHz 为 10%
+    values = dict(
+        id=vm_id, name=vm_id, host_ip=host_ip, status="poweredOn", cpu_count=2, memory_mb=4096,
+        cpu_usage_mhz=200, memory_usage_mb=200, disk_provisioned_gb=50.0, disk_used_gb=10.0,
+    )
+    values.update(extra)
+    db.add(VirtualMachine(**values))
+
+
+def _by_id(rows):
+    return {row["vm_id"]: row for row in rows}
+
+
+def test_unknown_core_mhz_falls_back_to_default(planner, db):
+    _host(db, "10.0.0.1", None, 0)
+    _host(db, "10.0.0.2", 0, 1)
+    _host(db, "10.0.0.3", 1000, 2)
+    _vm(db, "null-mhz", "10.0.0.1")
+    _vm(db, "zero-mhz", "10.0.0.2")
+    _vm(db, "known-mhz", "10.0.0.3")
+    db.commit()
+
+    report = planner.report(db)
+    idle = _by_id(report["idle_vms"])
+    oversized = _by_id(report["oversized_vms"])
+    assert set(idle) == {"null-mhz", "zero-mhz"}
+    assert idle["null-mhz"]["cpu_usage_pct"] == idle["zero-mhz"]["cpu_usage_pct"] == 4.17
+    assert set(oversized) == {"known-mhz"}
+    assert oversized["known-mhz"]["cpu_usage_pct"] == 10.0
+    assert oversized["known-mhz"]["recommended_cpu"] == 1
+    assert [h["idle_vm_count"] for h in report["hosts"]] == [1, 1, 0]
+
+
+def test_vms_on_unregistered_hosts_are_excluded_from_host_rows(planner, db):
+    _host(db, "10.0.0.1", 2000)
+    _vm(db, "known", "10.0.0.1", cpu_usage_mhz=2000, memory_usage_mb=3000)
+    _vm(db, "orphan", "10.9.9.9", cpu_count=4, memory_mb=8192)
+    _vm(db, "no-host", None, status="poweredOff")
+    db.commit()
+
+    report = planner.report(db)
+    assert report["vm_count"] == 3
+    assert report["powered_on"] == 2
+    (host,) = report["hosts"]
+    assert host["vcpu_total"] == 2
+    assert host["vcpu_running"] == 2
+    assert host["disk_provisioned_gb"] == 50.0
+    assert host["idle_vm_count"] == 0
+    # 未登记主机的 VM 仍参与 VM 级分析，主频取默认值
+    orphan = _by_id(report["idle_vms"])["orphan"]
+    assert orphan["host_ip"] == "10.9.9.9"
+    assert orphan["cpu_usage_pct"] == round(200 / (4 * 2400) * 100, 2)
+
+
+def test_report_for_single_host(planner, db):
+    host = _host(db, "10.0.0.1", 2000)
+    _host(db, "10.0.0.2", 2000)
+    _vm(db, "a", "10.0.0.1")
+    _vm(db, "b", "10.0.0.2")
+    db.commit()
+
+    report = planner.report(db, host_id=host.id)
+    assert report["vm_count"] == 1
+    assert [h["host_ip"] for h in report["hosts"]] == ["10.0.0.1"]
+    with pytest.raises(ValueError):
+        planner.report(db, host_id=999)
+
+
+def test_empty_inventory(planner, db):
+    report = planner.report(db)
+    assert report["vm_count"] == 0
+    assert report["hosts"] == []
+    assert report["idle_vms"] == [] and report["oversized_vms"] == []
@@ -0,0 +1,40 @@
+import asyncio
+import importlib
+import threading
+
+executor_module = importlib.import_module("app.services.esxi_executor")
+
+
+def test_discard_during_inflight_call_keeps_new_lane_count():
+    executor = executor_module.EsxiExecutor(workers_per_host=2, queue_limit=2)
+    old_release, new_release = threading.Event(), threading.Event()
+
+    async def scenario():
+        old_call = asyncio.ensure_future(executor.run("10.0.0.1", old_release.wait, 5))
+        await asyncio.sleep(0.05)
+        # 主机删除后重新添加：旧调用仍在途
+        executor.discard("10.0.0.1")
+        new_calls = [asyncio.ensure_future(executor.run("10.0.0.1", new_release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert executor.stats() == {"10.0.0.1": 2}
+
+        old_release.set()
+        await old_call
+        # 旧调用结束不能扣减新线程池的计数，上限依然生效
+        assert executor.stats() == {"10.0.0.1": 2}
+        try:
+            await executor.run("10.0.0.1", lambda: None)
+            raise AssertionError("queue limit not enforced")
+        except executor_module.HostQueueFull:
+            pass
+
+        new_release.set()
+        await asyncio.gather(*new_calls)
+        assert executor.stats() == {}
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        old_release.set()
+        new_release.set()
+        executor.shutdown()
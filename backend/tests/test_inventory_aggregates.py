@@ -0,0 +1,102 @@
+import pytest
+
+from app.db.upsert import bulk_upsert, diff_rows, load_rows
+from app.models.virtualization import Datastore, EsxiHost, InventoryAggregate, VirtualMachine
+from app.services.esxi_inventory import VM_COLUMNS
+from app.services.inventory_aggregates import _SUM_FIELDS, apply_vm_changes, refresh_aggregates
+
+
+def _vm(vm_id, host_ip, status="poweredOn", datastore="ds1", **extra):
+    row = {name: None for name in VM_COLUMNS}
+    row.update(
+        id=vm_id, uuid=vm_id, name=vm_id, host_ip=host_ip, status=status, datastore=datastore,
+        cpu_count=2, memory_mb=4096, cpu_usage_mhz=300, memory_usage_mb=1024,
+        disk_provisioned_gb=40.0, disk_used_gb=12.5,
+    )
+    row.update(extra)
+    return row
+
+
+def _upsert(db, rows):
+    """与同步路径相同：比对已有行后 upsert，返回 (旧行, 新行) 变更列表"""
+    ids = [row["id"] for row in rows]
+    existing = load_rows(db, VirtualMachine, VM_COLUMNS, VirtualMachine.id.in_(ids))
+    changed = diff_rows(existing, rows, compare=VM_COLUMNS)
+    bulk_upsert(db, VirtualMachine, changed)
+    return [(existing.get(row["id"]), row) for row in changed]
+
+
+def _delete(db, ids):
+    removed = load_rows(db, VirtualMachine, VM_COLUMNS, VirtualMachine.id.in_(ids))
+    db.query(VirtualMachine).filter(VirtualMachine.id.in_(ids)).delete(synchronize_session=False)
+    return [(row, None) for row in removed.values()]
+
+
+def _snapshot(db):
+    db.expire_all()
+    return {
+        row.host_ip: {name: getattr(row, name) or 0 for name in _SUM_FIELDS + ["datastore_count"]}
+        for row in db.query(InventoryAggregate)
+    }
+
+
+@pytest.fixture
+def inventory(db):
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        db.add(EsxiHost(ip=ip, username="root", password="pw", storage_total_gb=1000.0, storage_free_gb=400.0))
+    db.add(Datastore(id="ds1", name="ds1", capacity_gb=1000.0, free_gb=400.0))
+    _upsert(db, [
+        _vm("a", "10.0.0.1"),
+        _vm("b", "10.0.0.1", status="poweredOff", cpu_usage_mhz=None, memory_usage_mb=None),
+        _vm("c", "10.0.0.2", status="suspended", cpu_count=None),
+    ])
+    refresh_aggregates(db)
+    db.commit()
+    return db
+
+
+STEPS = [
+    ("insert", lambda db: _upsert(db, [_vm("d", "10.0.0.2", cpu_count=8, memory_mb=16384, disk_used_gb=None)])),
+    ("power off", lambda db: _upsert(db, [_vm("a", "10.0.0.1", status="poweredOff", cpu_usage_mhz=0)])),
+    ("power on", lambda db: _upsert(db, [_vm("b", "10.0.0.1")])),
+    ("datastore move", lambda db: _upsert(db, [_vm("b", "10.0.0.1", datastore="ds2", disk_provisioned_gb=80.0)])),
+    ("host move", lambda db: _upsert(db, [_vm("a", "10.0.0.2", status="poweredOff", cpu_usage_mhz=0)])),
+    ("reconfigure + power", lambda db: _upsert(db, [
+        _vm("c", "10.0.0.2", status="poweredOn", cpu_count=4),
+        _vm("d", "10.0.0.2", status="suspended", cpu_count=8, memory_mb=16384, disk_used_gb=None),
+    ])),
+    ("no-op", lambda db: _upsert(db, [_vm("c", "10.0.0.2", status="poweredOn", cpu_count=4)])),
+    ("delete", lambda db: _delete(db, ["b", "c"])),
+    ("delete last on host", lambda db: _delete(db, ["d", "a"])),
+]
+
+
+def test_incremental_changes_match_full_refresh(inventory):
+    db = inventory
+    for name, step in STEPS:
+        apply_vm_changes(db, step(db))
+        db.commit()
+        incremental = _snapshot(db)
+        refresh_aggregates(db)
+        db.commit()
+        full = _snapshot(db)
+        assert incremental.keys() == full.keys(), name
+        for host_ip, values in full.items():
+            assert incremental[host_ip] == pytest.approx(values), f"{name}: {host_ip}"
+
+
+def test_move_to_host_without_aggregate_row_falls_back_to_refresh(inventory):
+    db = inventory
+    # 新加入的主机还没有聚合行：增量路径应退回对该主机的全量重算
+    db.add(EsxiHost(ip="10.0.0.3", username="root", password="pw", storage_total_gb=500.0, storage_free_gb=100.0))
+    db.commit()
+    apply_vm_changes(db, _upsert(db, [_vm("a", "10.0.0.3")]))
+    db.commit()
+    incremental = _snapshot(db)
+    assert incremental["10.0.0.3"]["vm_total"] == 1
+
+    refresh_aggregates(db)
+    db.commit()
+    full = _snapshot(db)
+    for host_ip, values in full.items():
+        assert incremental[host_ip] == pytest.approx(values), host_ip
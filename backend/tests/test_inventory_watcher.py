@@ -0,0 +1,85 @@
+import importlib
+from unittest import mock
+
+from pyVmomi import vim
+
+watcher_module = importlib.import_module("app.services.inventory_watcher")
+
+
+class _Session:
+    def __init__(self, si):
+        self.si = si
+
+    def __enter__(self):
+        return self.si
+
+    def __exit__(self, *exc):
+        return False
+
+
+def _run_watch(updates, apply_side_effect):
+    """驱动一次 _watch：依次返回 updates，取完后停止；返回 (watcher, 各次 WaitForUpdatesEx 的 version, _apply mock)"""
+    watcher = watcher_module.HostInventoryWatcher(1, "10.0.0.1")
+    queue = list(updates)
+    versions = []
+
+    def wait_for_updates(version, options):
+        versions.append(version)
+        if not queue:
+            watcher._stop.set()
+            return None
+        return queue.pop(0)
+
+    collector = mock.Mock()
+    collector.WaitForUpdatesEx.side_effect = wait_for_updates
+    si = mock.Mock()
+    si.RetrieveContent.return_value.propertyCollector.CreatePropertyCollector.return_value = collector
+    host = mock.Mock(ip="10.0.0.1", port=443)
+    db = mock.Mock()
+    db.query.return_value.filter.return_value.first.return_value = host
+    with mock.patch.object(watcher_module, "SessionLocal", return_value=db), \
+            mock.patch.object(watcher_module.esxi_session_pool, "session", return_value=_Session(si)), \
+            mock.patch.object(watcher_module.virtualization_service, "_resolve_credentials", return_value=("u", "p")), \
+            mock.patch.object(watcher_module, "build_filter_spec"), \
+            mock.patch.object(watcher.__class__, "_mark_offline") as mark_offline, \
+            mock.patch.object(watcher, "_apply", side_effect=apply_side_effect) as apply, \
+            mock.patch.object(watcher._stop, "wait"):
+        watcher._watch()
+    assert not mark_offline.called
+    return watcher, versions, apply
+
+
+def _update(version, truncated=False):
+    return mock.Mock(version=version, truncated=truncated, filterSet=[])
+
+
+def test_truncated_snapshot_prunes_only_on_last_batch():
+    watcher, _, apply = _run_watch(
+        [_update("1", truncated=True), _update("2", truncated=True), _update("3"), _update("4")],
+        apply_side_effect=None,
+    )
+    assert [c.kwargs["snapshot_complete"] for c in apply.call_args_list] == [False, False, True, False]
+    assert watcher.live
+
+
+def test_apply_failure_resyncs_without_marking_offline():
+    outcomes = iter([None, TimeoutError("等待 SQLite 写锁超时"), None, None])
+
+    def apply(update, snapshot_complete):
+        error = next(outcomes)
+        if error:
+            raise error
+
+    watcher, versions, apply_mock = _run_watch([_update("1"), _update("2"), _update("3"), _update("4")], apply)
+    # 第二批写库失败后从 version="" 重新取快照，重新取到的第一批视为完整快照
+    assert versions[:4] == ["", "1", "", "3"]
+    assert [c.kwargs["snapshot_complete"] for c in apply_mock.call_args_list] == [True, False, True, False]
+    assert watcher.live
+
+
+def test_esxi_error_marks_offline():
+    watcher = watcher_module.HostInventoryWatcher(1, "10.0.0.1")
+    with mock.patch.object(watcher, "_watch", side_effect=vim.fault.NotAuthenticated()), \
+            mock.patch.object(watcher, "_mark_offline", side_effect=lambda: watcher._stop.set()) as mark_offline:
+        watcher._run()
+    assert mark_offline.called
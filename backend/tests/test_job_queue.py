@@ -0,0 +1,82 @@
+import importlib
+from unittest import mock
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.task import Task, TaskSecret
+
+queue_module = importlib.import_module("app.services.job_queue")
+
+
+class _Retryable(Exception):
+    pass
+
+
+@pytest.fixture
+def queue(engine):
+    factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    with mock.patch.object(queue_module, "SessionLocal", factory):
+        yield queue_module.JobQueue(workers=1)
+
+
+def _run_once(queue, db):
+    task_id = queue._claim()
+    assert task_id
+    queue._execute(task_id)
+    db.expire_all()
+    return db.query(Task).filter(Task.id == task_id).one()
+
+
+def test_secrets_kept_out_of_payload_and_dropped_on_success(queue, db):
+    seen = {}
+
+    def handler(db, task_id, payload):
+        seen.update(payload=payload, secrets=queue.secrets(db, task_id))
+        return {"message": "ok"}
+
+    queue.register("demo", handler)
+    task = queue.enqueue(db, "demo", payload={"ip": "10.0.0.2", "username": "root"}, secrets={"password": "pw"})
+    assert "password" not in task.payload
+    assert db.query(TaskSecret).filter(TaskSecret.task_id == task.id).one().data == {"password": "pw"}
+
+    task = _run_once(queue, db)
+    assert seen == {"payload": {"ip": "10.0.0.2", "username": "root"}, "secrets": {"password": "pw"}}
+    assert task.status == "success"
+    assert task.payload is None
+    assert db.query(TaskSecret).count() == 0
+
+
+def test_retry_keeps_secrets_until_terminal_failure(queue, db):
+    def handler(db, task_id, payload):
+        raise _Retryable("esxi down")
+
+    queue.register("demo", handler, max_attempts=2, retry_on=(_Retryable,))
+    task = queue.enqueue(db, "demo", payload={"ip": "10.0.0.2"}, secrets={"password": "pw"})
+
+    task = _run_once(queue, db)
+    assert task.status == "pending"
+    assert task.payload == {"ip": "10.0.0.2"}
+    assert db.query(TaskSecret).count() == 1
+
+    task.available_at = None
+    db.commit()
+    task = _run_once(queue, db)
+    assert task.status == "failed"
+    assert task.payload is None
+    assert db.query(TaskSecret).count() == 0
+
+
+def test_recover_orphans_drops_secrets_when_attempts_exhausted(queue, db):
+    queue.register("demo", lambda db, task_id, payload: {})
+    task = queue.enqueue(db, "demo", payload={"ip": "10.0.0.2"}, secrets={"password": "pw"})
+    task.status = "running"
+    task.attempts = 1
+    db.commit()
+
+    assert queue.recover_orphans() == 1
+    db.expire_all()
+    task = db.query(Task).filter(Task.id == task.id).one()
+    assert task.status == "failed"
+    assert task.payload is None
+    assert db.query(TaskSecret).count() == 0
@@ -0,0 +1,124 @@
+import random
+import time
+
+import pytest
+
+from app.models.metrics import MetricRawChunk, MetricRollupChunk
+from app.services.metrics_store import RAW_SPAN, RAW_STEP, ROLLUPS, MetricsStore, _unpack
+
+HOST = "10.0.0.1"
+# 对齐到所有块跨度（20 分钟 / 2 小时 / 1 天）
+T0 = 86400 * 19700
+
+
+@pytest.fixture
+def store():
+    return MetricsStore()
+
+
+def _write(store, db, points, metric="cpu"):
+    written = store.write(db, HOST, [("vm", "vm-1", metric, points)])
+    db.commit()
+    return written
+
+
+def _rollup(db, step):
+    return {
+        row.chunk_start: (_unpack(row.sums), _unpack(row.counts), _unpack(row.maxes))
+        for row in db.query(MetricRollupChunk).filter(MetricRollupChunk.resolution == step)
+    }
+
+
+def test_write_across_raw_chunk_boundary(store, db):
+    boundary = T0 + RAW_SPAN
+    points = [(boundary - 40, 1.0), (boundary - 20, 2.0), (boundary, 3.0), (boundary + 20, 4.0)]
+    assert _write(store, db, points) == 4
+
+    starts = sorted(row.chunk_start for row in db.query(MetricRawChunk))
+    assert starts == [T0, boundary]
+    res = store.query(db, "vm", "vm-1", ["cpu"], boundary - 40, boundary + 20, resolution=RAW_STEP)
+    assert res["timestamps"] == [ts for ts, _ in points]
+    assert res["series"]["cpu"]["avg"] == [1.0, 2.0, 3.0, 4.0]
+
+    # 第二批落在已有块的后续槽位，前一批的采样不丢失
+    assert _write(store, db, [(boundary + 40, 5.0)]) == 1
+    res = store.query(db, "vm", "vm-1", ["cpu"], boundary - 40, boundary + 40, resolution=RAW_STEP)
+    assert res["series"]["cpu"]["avg"] == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_duplicate_timestamp_in_same_slot_is_ignored(store, db):
+    assert _write(store, db, [(T0 + 40, 10.0), (T0 + 45, 99.0)]) == 1
+    # 重叠的采集窗口再次带回同一槽位
+    assert _write(store, db, [(T0 + 40, 50.0), (T0 + 59, 70.0)]) == 0
+
+    res = store.query(db, "vm", "vm-1", ["cpu"], T0 + 40, T0 + 40 + 1, resolution=RAW_STEP)
+    assert res["series"]["cpu"]["avg"][0] == 10.0
+    for step, _ in ROLLUPS:
+        sums, counts, maxes = _rollup(db, step)[T0]
+        assert (sums[0], counts[0], maxes[0]) == (10.0, 1.0, 10.0)
+
+
+def test_rollups_match_naive_recomputation(store, db):
+    rng = random.Random(7)
+    start, end = T0 + 86400 - 3 * 3600, T0 + 86400 + 3 * 3600
+    # 跨 1 天 / 2 小时块边界，采样带抖动且有重复与缺失
+    points = [(ts + rng.randrange(RAW_STEP), float(rng.randrange(0, 4000)) / 4)
+              for ts in range(start, end, RAW_STEP) if rng.random() > 0.1]
+    batches = [points[i:i + 50] for i in range(0, len(points), 40)]  # 相邻批次重叠 10 个点
+    for batch in batches:
+        _write(store, db, batch)
+
+    kept = {}
+    for ts, value in points:
+        kept.setdefault(ts - ts % RAW_STEP, value)
+    assert len(kept) == len(points)
+
+    for step, span in ROLLUPS:
+        naive = {}
+        for ts, value in kept.items():
+            bucket = naive.setdefault(ts - ts % step, [0.0, 0, float("-inf")])
+            bucket[0] += value
+            bucket[1] += 1
+            bucket[2] = max(bucket[2], value)
+
+        chunks = _rollup(db, step)
+        for bucket_start, (total, count, peak) in naive.items():
+            chunk_start = bucket_start - bucket_start % span
+            sums, counts, maxes = chunks[chunk_start]
+            slot = (bucket_start - chunk_start) // step
+            assert sums[slot] == pytest.approx(total, rel=1e-6)
+            assert counts[slot] == count
+            assert maxes[slot] == peak
+        populated = sum(1 for sums, counts, maxes in chunks.values() for c in counts if c > 0)
+        assert populated == len(naive)
+
+        res = store.query(db, "vm", "vm-1", ["cpu"], start, end - 1, resolution=step)
+        for ts, avg, peak in zip(res["timestamps"], res["series"]["cpu"]["avg"], res["series"]["cpu"]["max"]):
+            if ts in naive:
+                total, count, top = naive[ts]
+                assert avg == pytest.approx(round(total / count, 2), abs=0.01)
+                assert peak == top
+            else:
+                assert avg is None and peak is None
+
+
+@pytest.mark.parametrize(
+    "hours, expected",
+    [(1, RAW_STEP), (4, 300), (3 * 24, 300), (30 * 24, 3600)],
+)
+def test_query_picks_tier_by_range(store, db, hours, expected):
+    end = int(time.time())
+    start = end - hours * 3600
+    # 4 小时按 20 秒粒度只有 720 点，未超点数上限；原始采样保留期缩到 1 小时后应改用 5 分钟汇总
+    if hours == 4:
+        store.retention[RAW_STEP] = 3600
+    _write(store, db, [(end - 600, 42.0)])
+    res = store.query(db, "vm", "vm-1", ["cpu"], start, end)
+    assert res["resolution"] == expected
+    assert len(res["timestamps"]) <= store.max_points
+    assert 42.0 in res["series"]["cpu"]["avg"]
+
+
+def test_query_rejects_too_many_points_for_fine_resolution(store, db):
+    with pytest.raises(ValueError):
+        store.query(db, "vm", "vm-1", ["cpu"], T0, T0 + 30 * 86400, resolution=300)
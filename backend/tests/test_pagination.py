@@ -0,0 +1,101 @@
+import asyncio
+import importlib
+from unittest import mock
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app.db.pagination import decode_cursor, encode_cursor, keyset_after
+from app.models.virtualization import VirtualMachine
+
+api_module = importlib.import_module("app.api.virtualization")
+
+# (id, status)：含 NULL 与同值多行，覆盖按 id 决胜
+ROWS = [
+    ("vm-01", "poweredOn"),
+    ("vm-02", None),
+    ("vm-03", "poweredOff"),
+    ("vm-04", "poweredOn"),
+    ("vm-05", None),
+    ("vm-06", "poweredOff"),
+    ("vm-07", "poweredOn"),
+    ("vm-08", None),
+]
+
+
+@pytest.fixture
+def vms(db):
+    for vm_id, status in ROWS:
+        db.add(VirtualMachine(id=vm_id, name=vm_id, host_ip="10.0.0.1", status=status))
+    db.commit()
+    return db
+
+
+def _expected(descending):
+    # SQLite/MySQL：升序 NULL 在前，降序 NULL 在后；同值按 id 同向排序
+    ordered = sorted(ROWS, key=lambda r: (r[1] is not None, r[1] or "", r[0]))
+    return [vm_id for vm_id, _ in (reversed(ordered) if descending else ordered)]
+
+
+def _walk(db, descending, page_size):
+    col, pk = VirtualMachine.status, VirtualMachine.id
+    order = [col.desc(), pk.desc()] if descending else [col.asc(), pk.asc()]
+    seen, cursor = [], None
+    while True:
+        query = db.query(VirtualMachine).order_by(*order)
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            query = query.filter(keyset_after(col, pk, value, last_id, descending))
+        rows = query.limit(page_size).all()
+        if not rows:
+            return seen
+        seen.extend(vm.id for vm in rows)
+        cursor = encode_cursor([rows[-1].status, rows[-1].id])
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("page_size", [1, 2, 3])
+def test_keyset_walk_matches_full_ordering(vms, descending, page_size):
+    assert _walk(vms, descending, page_size) == _expected(descending)
+    # 与数据库自身的排序一致，确认 NULL 位置假设成立
+    col, pk = VirtualMachine.status, VirtualMachine.id
+    order = [col.desc(), pk.desc()] if descending else [col.asc(), pk.asc()]
+    assert [vm.id for vm in vms.query(VirtualMachine).order_by(*order)] == _expected(descending)
+
+
+def test_cursor_round_trip():
+    for values in (["名称", "vm-1"], [None, "vm-2"], [3, "vm-3"]):
+        assert decode_cursor(encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-base64!!",
+        "全角",
+        encode_cursor({"a": 1}),
+        encode_cursor(["only-one"]),
+        encode_cursor([{"x": 1}, "vm-1"]),
+        encode_cursor([["a"], "vm-1"]),
+        encode_cursor(["name", None]),
+        encode_cursor(["name", {"id": 1}]),
+    ],
+)
+def test_malformed_cursor_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("cursor", ["garbage", encode_cursor([{"x": 1}, "vm-1"])])
+def test_tampered_cursor_returns_400(vms, engine, cursor):
+    request = Request({"type": "http", "method": "GET", "query_string": b"", "headers": []})
+    factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    with mock.patch.object(api_module, "SessionLocal", factory), \
+            mock.patch.object(api_module.inventory_cache, "etag", return_value='"e"'):
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(api_module.get_vms(
+                request, Response(), status_filter=None, page=1, page_size=20, cursor=cursor, sort="name", total="exact"
+            ))
+    assert exc.value.status_code == 400
@@ -0,0 +1,37 @@
+import importlib
+from unittest import mock
+
+import pytest
+
+pool_module = importlib.import_module("app.services.esxi_session_pool")
+
+
+@pytest.fixture
+def pool():
+    pool = pool_module.EsxiSessionPool(max_sessions=8, max_per_host=2, acquire_timeout=0)
+
+    def connect(key, pwd):
+        return pool_module._PooledSession(key, pwd, mock.Mock())
+
+    with mock.patch.object(pool, "_connect", side_effect=connect), mock.patch.object(pool_module, "Disconnect"):
+        yield pool
+
+
+def test_pinned_session_does_not_use_per_host_slot(pool):
+    watcher = pool.acquire("10.0.0.1", "root", "pw", pinned=True)
+    workers = [pool.acquire("10.0.0.1", "root", "pw") for _ in range(2)]
+    assert pool.stats()["pinned"] == 1
+    with pytest.raises(pool_module.EsxiConnectionError):
+        pool.acquire("10.0.0.1", "root", "pw")
+
+    for si in workers + [watcher]:
+        pool.release(si)
+    assert pool.stats() == {"total": 3, "in_use": 0, "idle": 3, "pinned": 0, "hosts": 1}
+
+
+def test_pinned_registration_released_when_login_fails(pool):
+    pool._connect.side_effect = pool_module.EsxiConnectionError("down")
+    with pytest.raises(pool_module.EsxiConnectionError):
+        pool.acquire("10.0.0.1", "root", "pw", pinned=True)
+    assert pool.stats()["pinned"] == 0
+    assert pool.stats()["total"] == 0
@@ -0,0 +1,50 @@
+import asyncio
+
+from app.services.task_events import TaskEventBus
+
+
+def _subscribe(bus: TaskEventBus, header):
+    async def run():
+        sub, backlog = bus.subscribe(bus.parse_event_id(header))
+        bus.unsubscribe(sub)
+        return backlog
+
+    return asyncio.run(run())
+
+
+def _publish(bus: TaskEventBus, n: int):
+    for i in range(n):
+        bus.publish({"id": f"t{i}", "status": "running"})
+
+
+def test_same_epoch_replays_backlog():
+    bus = TaskEventBus()
+    _publish(bus, 3)
+    backlog = _subscribe(bus, bus.event_id(1))
+    assert [seq for seq, _ in backlog] == [2, 3]
+    assert _subscribe(bus, bus.event_id(3)) == []
+
+
+def test_restart_sends_snapshot():
+    before = TaskEventBus()
+    _publish(before, 5)
+    last_seen = before.event_id(5)
+
+    after = TaskEventBus()
+    _publish(after, 2)
+    # 旧进程的游标即使序号在范围内也不能拿来补发
+    assert _subscribe(after, before.event_id(1)) is None
+    assert _subscribe(after, last_seen) is None
+
+
+def test_cursor_ahead_of_sequence_sends_snapshot():
+    bus = TaskEventBus()
+    _publish(bus, 2)
+    assert _subscribe(bus, bus.event_id(10)) is None
+
+
+def test_malformed_or_legacy_ids_send_snapshot():
+    bus = TaskEventBus()
+    _publish(bus, 2)
+    for header in [None, "", "1", "abc", f"{bus.epoch}:", f"{bus.epoch}:x", ":1"]:
+        assert _subscribe(bus, header) is None
@@ -0,0 +1,57 @@
+import importlib
+from concurrent.futures import Future
+from unittest import mock
+
+import pytest
+from pyVmomi import vim
+
+from app.services.esxi_session_pool import EsxiConnectionError
+
+service_module = importlib.import_module("app.services.virtualization_service")
+
+
+def _wait_with(error=None, result=None, done=True, timeout=5):
+    future: Future = Future()
+    if done:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    waiter = mock.Mock()
+    waiter.track.return_value = future
+    service = service_module.VirtualizationService()
+    with mock.patch.object(service_module.esxi_session_pool, "task_waiter", return_value=waiter):
+        return service._wait_task(mock.Mock(), "clone", timeout=timeout), waiter
+
+
+@pytest.mark.parametrize(
+    "error",
+    [vim.fault.NotAuthenticated(), ConnectionResetError("reset"), EsxiConnectionError("down"), TimeoutError("socket")],
+)
+def test_connection_errors_propagate_unchanged(error):
+    with pytest.raises(type(error)) as info:
+        _wait_with(error=error)
+    assert info.value is error
+
+
+def test_task_fault_is_wrapped_with_cause():
+    fault = Exception("FileNotFound")
+    with pytest.raises(Exception, match="clone 失败: FileNotFound") as info:
+        _wait_with(error=fault)
+    assert info.value.__cause__ is fault
+
+
+def test_wait_timeout_untracks_task():
+    waiter = mock.Mock()
+    waiter.track.return_value = Future()
+    service = service_module.VirtualizationService()
+    task = mock.Mock()
+    with mock.patch.object(service_module.esxi_session_pool, "task_waiter", return_value=waiter):
+        with pytest.raises(TimeoutError, match="clone 超时"):
+            service._wait_task(task, "clone", timeout=0.01)
+    waiter.untrack.assert_called_once_with(task)
+
+
+def test_result_returned():
+    result, _ = _wait_with(result="vm-42")
+    assert result == "vm-42"
@@ -0,0 +1,36 @@
+"""
+独立的任务队列 worker 进程：与 API 共用数据库，执行克隆 / 安装 Tools 等长耗时任务。
+API 侧设置 JOB_WORKERS_ENABLED=False 后，可按需启动多个 worker 横向扩展。
+"""
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+# 提前加载 .env
+load_dotenv()
+
+from app.db import init_db
+from app.services import jobs  # noqa: F401  注册任务处理函数
+from app.services.esxi_session_pool import esxi_session_pool
+from app.services.job_queue import job_queue
+from app.services.task_service import task_service
+
+
+def main():
+    init_db()
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    print("🚀 Starting ESXi-Mate job worker...")
+    job_queue.start()
+    stop.wait()
+    print("👋 Stopping job worker...")
+    job_queue.stop()
+    task_service.close()
+    esxi_session_pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
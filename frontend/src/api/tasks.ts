@@ -17,6 +17,11 @@ export interface TaskListResponse {
   items: Task[];
 }
 
+export interface TaskSnapshot extends TaskListResponse {
+  // 事件 ID（<进程纪元>:<序号>）
+  cursor: string;
+}
+
 export const taskApi = {
   getTasks: async (params?: { 
     status?: string; 
@@ -31,5 +36,17 @@ export const taskApi = {
   getTask: async (taskId: string) => {
     const response = await apiClient.get<Task>(`/tasks/${taskId}`);
     return response.data;
+  },
+
+  // SSE：先收到 snapshot（最近 limit 条），之后每次任务变化收到一条 task 事件；
+  // 断线后 EventSource 自动携带 Last-Event-ID 重连，服务端按游标补发
+  streamTasks: (
+    handlers: { onSnapshot: (snapshot: TaskSnapshot) => void; onTask: (task: Task) => void },
+    limit = 20,
+  ) => {
+    const source = new EventSource(`${apiClient.defaults.baseURL}/tasks/stream?limit=${limit}`);
+    source.addEventListener('snapshot', (e) => handlers.onSnapshot(JSON.parse((e as MessageEvent).data)));
+    source.addEventListener('task', (e) => handlers.onTask(JSON.parse((e as MessageEvent).data)));
+    return () => source.close();
   }
 };
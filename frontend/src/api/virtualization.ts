@@ -76,6 +76,10 @@ export interface VmConsoleInfo {
 export interface PageResult<T> {
   total: number;
   items: T[];
+  // total=approx 且超过后端计数上限时为 true
+  total_is_approximate?: boolean;
+  // 游标分页：下一页游标，为空表示没有更多
+  next_cursor?: string | null;
 }
 
 export interface DatastoreStats {
@@ -84,6 +88,80 @@ export interface DatastoreStats {
   total_free_gb: number;
 }
 
+// 性能曲线：timestamps 为 Unix 秒，avg/max 与之一一对应，缺失为 null
+export interface MetricSeries {
+  metric: string;
+  avg: (number | null)[];
+  max: (number | null)[];
+}
+
+export interface MetricsResult {
+  entity_type: 'vm' | 'host';
+  entity_id: string;
+  resolution: number;
+  timestamps: number[];
+  series: MetricSeries[];
+}
+
+export interface MetricsQuery {
+  metrics?: string; // 逗号分隔，如 cpu_usage_pct,mem_usage_pct
+  start?: string | number;
+  end?: string | number;
+  resolution?: 20 | 300 | 3600;
+}
+
+// 容量报告（GET /virtualization/capacity）
+export interface CapacityHost {
+  host_id: number;
+  host_ip: string;
+  hostname?: string | null;
+  cpu_cores?: number | null;
+  vcpu_total: number;
+  vcpu_running: number;
+  vcpu_ratio?: number | null;
+  memory_total_gb?: number | null;
+  memory_allocated_gb?: number | null;
+  memory_overcommit?: number | null;
+  storage_total_gb?: number | null;
+  storage_free_gb?: number | null;
+  disk_provisioned_gb?: number | null;
+  disk_used_gb?: number | null;
+  storage_overcommit?: number | null;
+  thin_provision_risk: boolean;
+  storage_growth_gb_per_day?: number | null;
+  days_until_full?: number | null;
+  idle_vm_count: number;
+  oversized_vm_count: number;
+  reclaimable_vcpu: number;
+  reclaimable_memory_gb?: number | null;
+}
+
+export interface CapacityVm {
+  vm_id: string;
+  name?: string | null;
+  host_ip?: string | null;
+  cpu_count: number;
+  memory_mb: number;
+  cpu_usage_pct?: number | null;
+  memory_usage_pct?: number | null;
+  recommended_cpu: number;
+  recommended_memory_mb: number;
+}
+
+export interface CapacityReport {
+  generated_at: string;
+  elapsed_ms: number;
+  vm_count: number;
+  powered_on: number;
+  idle_count: number;
+  oversized_count: number;
+  reclaimable_vcpu: number;
+  reclaimable_memory_gb: number;
+  hosts: CapacityHost[];
+  idle_vms: CapacityVm[];
+  oversized_vms: CapacityVm[];
+}
+
 // --- API ---
 
 export const virtualizationApi = {
@@ -133,6 +211,9 @@ export const virtualizationApi = {
     status?: string;
     page?: number;
     page_size?: number;
+    cursor?: string;
+    sort?: 'name' | '-name' | 'status' | '-status' | 'host_ip' | '-host_ip';
+    total?: 'exact' | 'approx' | 'none';
   }) => {
     const response = await apiClient.get<PageResult<VirtualMachine>>('/virtualization/vms', {
       params,
@@ -140,6 +221,29 @@ export const virtualizationApi = {
     return response.data;
   },
 
+  // 按相关度搜索（名称 / IP / 操作系统 / 备注 / 宿主机 IP）
+  // 流式导出（NDJSON / CSV），过滤参数与 getVms 相同；返回 Blob 供浏览器下载
+  exportVms: async (params?: {
+    format?: 'ndjson' | 'csv';
+    host_id?: number;
+    keyword?: string;
+    status?: string;
+    sort?: string;
+  }) => {
+    const response = await apiClient.get<Blob>('/virtualization/vms/export', {
+      params,
+      responseType: 'blob',
+    });
+    return response.data;
+  },
+
+  searchVms: async (params: { q: string; host_id?: number; status?: string; limit?: number }) => {
+    const response = await apiClient.get<PageResult<VirtualMachine>>('/virtualization/vms/search', {
+      params,
+    });
+    return response.data;
+  },
+
   performPowerAction: async (vmId: string, action: VmPowerAction) => {
     const response = await apiClient.post<AsyncTaskResponse>(`/virtualization/vms/${vmId}/power`, {
       action,
@@ -147,6 +251,15 @@ export const virtualizationApi = {
     return response.data;
   },
 
+  // 批量电源操作：可跨主机，整批作为一个后台任务执行
+  performBulkPowerAction: async (vmIds: string[], action: VmPowerAction) => {
+    const response = await apiClient.post<AsyncTaskResponse>(`/virtualization/vms/power/batch`, {
+      vm_ids: vmIds,
+      action,
+    });
+    return response.data;
+  },
+
   getConsoleUrl: async (vmId: string) => {
     const response = await apiClient.get<VmConsoleInfo>(`/virtualization/vms/${vmId}/console`);
     return response.data;
@@ -198,5 +311,20 @@ export const virtualizationApi = {
   installTools: async (vmId: string, data: { ip: string; username?: string; password?: string; credential_id?: number }) => {
       const response = await apiClient.post<AsyncTaskResponse>(`/virtualization/vms/${vmId}/install-tools`, data);
       return response.data;
+  },
+
+  getVmMetrics: async (vmId: string, params?: MetricsQuery) => {
+    const response = await apiClient.get<MetricsResult>(`/virtualization/vms/${vmId}/metrics`, { params });
+    return response.data;
+  },
+
+  getHostMetrics: async (hostId: number, params?: MetricsQuery) => {
+    const response = await apiClient.get<MetricsResult>(`/virtualization/hosts/${hostId}/metrics`, { params });
+    return response.data;
+  },
+
+  getCapacityReport: async (params?: { host_id?: number; top?: number }) => {
+    const response = await apiClient.get<CapacityReport>('/virtualization/capacity', { params });
+    return response.data;
   }
 };
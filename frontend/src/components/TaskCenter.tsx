@@ -50,21 +50,37 @@ export const TaskCenter: React.FC<TaskCenterProps> = ({ isOpen, onClose, autoRef
   useEffect(() => {
     if (isOpen) {
       setLoading(true);
-      // Reset and fetch
-      fetchTasks(true).finally(() => setLoading(false));
+      // 开启推送时首屏由 snapshot 事件填充
+      if (!autoRefresh) {
+        fetchTasks(true).finally(() => setLoading(false));
+      }
     }
   }, [isOpen]);
 
   useEffect(() => {
-    if (isOpen && autoRefresh && page === 1) { // Only auto-refresh first page
-      // Check if any task is running
-      const hasRunning = tasks.some(t => t.status === 'running' || t.status === 'pending');
-      if (hasRunning) {
-        const interval = setInterval(() => fetchTasks(true), 3000);
-        return () => clearInterval(interval);
-      }
-    }
-  }, [isOpen, autoRefresh, tasks, page]); 
+    if (!isOpen || !autoRefresh) return;
+    // 服务端推送任务变化，替代定时轮询
+    return taskApi.streamTasks(
+      {
+        onSnapshot: (snapshot) => {
+          setLoading(false);
+          setTasks(snapshot.items);
+          setPage(1);
+          setHasMore(snapshot.total > snapshot.items.length);
+        },
+        onTask: (task) => {
+          setTasks(prev => {
+            const index = prev.findIndex(t => t.id === task.id);
+            if (index === -1) return [task, ...prev];
+            const next = [...prev];
+            next[index] = task;
+            return next;
+          });
+        },
+      },
+      5,
+    );
+  }, [isOpen, autoRefresh]);
 
   if (!isOpen) return null;
 